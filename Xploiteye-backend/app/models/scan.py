@@ -26,6 +26,7 @@ class ScanRequest(BaseModel):
     """Request model for starting a network scan"""
     scan_type: ScanType = Field(..., description="Type of scan to perform")
     target: str = Field(..., min_length=1, description="Target IP address, domain, or network")
+    incremental: bool = Field(False, description="Only re-fingerprint ports that changed since the last scan of this target")
 
 class ScanResponse(BaseModel):
     """Response model for scan operations"""
@@ -38,8 +39,33 @@ class ScanResponse(BaseModel):
     started_at: datetime = Field(..., description="Scan start timestamp")
     completed_at: Optional[datetime] = Field(None, description="Scan completion timestamp")
     results: Optional[Dict[str, Any]] = Field(None, description="Scan results")
+    progress: Optional[Dict[str, Any]] = Field(None, description="Live progress (phase, hosts and open ports found so far)")
     json_file_path: Optional[str] = Field(None, description="Path to JSON results file")
-    txt_file_path: Optional[str] = Field(None, description="Path to TXT report file")
+    txt_file_path: Optional[str] = Field(None, description="Path to TXT report file (scans before CVE records)")
+    cve_records_path: Optional[str] = Field(None, description="Path to CVE records (JSON Lines) file")
+    timings: Optional[Dict[str, Any]] = Field(None, description="Time spent per phase, per node/tool and per timed operation")
+
+class BatchScanRequest(BaseModel):
+    """Request model for scanning several targets (IPs, hostnames or CIDR ranges) as one batch"""
+    scan_type: ScanType = Field(..., description="Type of scan to perform on every host")
+    targets: List[str] = Field(..., description="Target IP addresses, domains or CIDR networks")
+
+class BatchScanResponse(BaseModel):
+    """Response model for batch scan operations"""
+    batch_id: str = Field(..., description="Unique batch identifier")
+    status: ScanStatus = Field(..., description="Current batch status")
+    message: str = Field(..., description="Status message")
+    targets: List[str] = Field(..., description="Targets as given in the request")
+    scan_type: ScanType = Field(..., description="Type of scan")
+    user_id: str = Field(..., description="User who initiated the batch")
+    started_at: datetime = Field(..., description="Batch start timestamp")
+    completed_at: Optional[datetime] = Field(None, description="Batch completion timestamp")
+    hosts_total: int = Field(0, description="Hosts the targets expand to")
+    scan_ids: List[str] = Field(default_factory=list, description="Per-host scan IDs (one scan document per scanned host)")
+    summary: Optional[Dict[str, Any]] = Field(None, description="Batch summary (hosts up, distinct services looked up, CVE counts)")
+    hosts: Optional[List[Dict[str, Any]]] = Field(None, description="Per-host status, scan ID and risk")
+    progress: Optional[Dict[str, Any]] = Field(None, description="Live progress (phase, hosts and open ports found so far)")
+    timings: Optional[Dict[str, Any]] = Field(None, description="Time spent per phase and per timed operation")
 
 class ScanSummary(BaseModel):
     """Summary model for scan results"""
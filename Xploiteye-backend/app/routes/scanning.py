@@ -2,8 +2,8 @@
 Network Scanning API routes for XploitEye Backend
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from typing import List, Optional
 import os
 import logging
@@ -11,14 +11,20 @@ import subprocess
 import asyncio
 
 from app.models.scan import (
-    ScanRequest, ScanResponse, ReportRequest, ReportResponse, ScanStatus
+    BatchScanRequest, BatchScanResponse, ScanRequest, ScanResponse, ReportRequest, ReportResponse, ScanStatus
 )
 from app.models.user import UserInDB
 from app.auth.dependencies import get_current_active_user
 from app.services.scanning_service import get_scanning_service
 from app.services.cve_service import CVEService
-from app.scanning.network_discovery import NetworkDiscovery
-from app.scanning.PortDiscovery import PortDiscovery
+from app.scanning.network_discovery import NetworkDiscovery, NetworkRangeError
+from app.scanning.PortDiscovery import PortDiscovery, MAX_PORTS_PER_REQUEST
+from app.scanning.cve_scheduler import get_cve_scheduler
+from app.scanning.batch_scanner import BatchTargetError
+from app.scanning.scan_context import get_scan_context
+from app.scanning.scan_events import TERMINAL_STATUSES, format_sse, get_scan_event_log
+from app.scanning.scan_metrics import render_metrics
+from app.scanning.results_cache import CachedResults, etag_matches, get_results_cache, pick_encoding
 from config.settings import settings
 from config.logging_config import scanning_logger
 from pydantic import BaseModel
@@ -41,6 +47,9 @@ class IPCheckResponse(BaseModel):
 
 class NetworkDiscoveryRequest(BaseModel):
     network_range: Optional[str] = None  # e.g., "192.168.1.0/24" or auto-detect
+    max_age_seconds: Optional[int] = None  # Serve a sweep up to this old (default: settings.discovery_cache_max_age_seconds)
+    force_refresh: bool = False  # Always sweep
+    delta: bool = False  # Only devices that appeared, vanished or changed in the latest sweep
 
 class NetworkDiscoveryResponse(BaseModel):
     status: str
@@ -52,6 +61,10 @@ class PortDiscoveryRequest(BaseModel):
     target: str
     port: int
 
+class PortBatchDiscoveryRequest(BaseModel):
+    target: str
+    ports: List[int]
+
 class PortDiscoveryResponse(BaseModel):
     status: str
     message: str
@@ -84,6 +97,60 @@ async def start_scan(
             detail=f"Failed to start scan: {str(e)}"
         )
 
+@router.post("/batch/start", response_model=BatchScanResponse)
+async def start_batch_scan(
+    batch_request: BatchScanRequest,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Start a batch scan of several targets and/or CIDR ranges"""
+    try:
+        scanning_service = get_scanning_service()
+        return await scanning_service.start_batch_scan(batch_request, current_user)
+    except BatchTargetError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logging.error(f"Failed to start batch scan: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to start batch scan: {str(e)}"
+        )
+
+@router.get("/batch/{batch_id}", response_model=BatchScanResponse)
+async def get_batch_status(
+    batch_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Get batch scan status, summary and the per-host scan IDs"""
+    scanning_service = get_scanning_service()
+    result = await scanning_service.get_batch_status(batch_id, current_user)
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch scan not found"
+        )
+    return result
+
+@router.post("/batch/{batch_id}/cancel")
+async def cancel_batch_scan(
+    batch_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Cancel a running batch scan"""
+    scanning_service = get_scanning_service()
+    success = await scanning_service.cancel_batch_scan(batch_id, current_user)
+
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch scan not found or cannot be cancelled"
+        )
+
+    return {"message": "Batch scan cancelled successfully"}
+
 @router.post("/check-ip", response_model=IPCheckResponse)
 async def check_ip_reachability(
     request: IPCheckRequest,
@@ -210,6 +277,57 @@ async def get_scan_status(
 
     return result
 
+# Headers that stop proxies from buffering or caching an event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Reconnect delay suggested to clients of scans that have no live event log here
+SSE_RETRY_MS = 5000
+
+@router.get("/events/{scan_id}")
+async def stream_scan_events(
+    scan_id: str,
+    request: Request,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Server-sent events for a scan or batch: phase changes, hosts, open ports/services,
+    nmap progress, CVE counts and status changes, each with a sequence id. Reconnect
+    with the Last-Event-ID header (or ?last_event_id=) to resume; the stream ends
+    after the final status event.
+    """
+    try:
+        resume_after = int(last_event_id_header) if last_event_id_header else (last_event_id or 0)
+    except ValueError:
+        resume_after = 0
+
+    event_log = get_scan_event_log(scan_id)
+    if event_log is None or event_log.user_id != str(current_user.id):
+        # Not running in this process (or long finished): one status event from the stored scan
+        scan_state = await get_scanning_service().get_scan_state(scan_id, current_user)
+        if not scan_state:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Scan not found"
+            )
+        final = scan_state["status"] in TERMINAL_STATUSES
+        event = {"id": resume_after, "event": "status", "data": {**scan_state, "final": final}}
+        # A scan still running elsewhere: the client reconnects after the retry delay
+        body = format_sse(event) if final else f"retry: {SSE_RETRY_MS}\n" + format_sse(event)
+        return StreamingResponse(iter([body]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    async def event_stream():
+        async for event in event_log.subscribe(resume_after, heartbeat=settings.scan_event_heartbeat_seconds):
+            if event is None and await request.is_disconnected():
+                return
+            if event is not None and event["event"] == "resync":
+                # Events were dropped from the buffer; send the current progress instead
+                ctx = get_scan_context(scan_id)
+                event = {**event, "data": {**event["data"], "progress": ctx.progress_snapshot() if ctx else None}}
+            yield format_sse(event)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.get("/list", response_model=List[ScanResponse])
 async def list_user_scans(
     limit: int = 50,
@@ -338,34 +456,67 @@ async def download_report(
         media_type="application/pdf"
     )
 
+def _cached_results_response(request: Request, cached: CachedResults) -> Response:
+    """Compact JSON body of cached results: 304 when the client has it, compressed when accepted"""
+    headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    encoding = pick_encoding(request.headers.get("accept-encoding"), len(cached.body))
+    if encoding is None:
+        return Response(content=cached.body, media_type="application/json", headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(content=cached.encoded(encoding), media_type="application/json", headers=headers)
+
 @router.get("/results/{scan_id}")
 async def get_scan_results_json(
     scan_id: str,
+    request: Request,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Get detailed scan results in JSON format"""
+    """Get detailed scan results in JSON format (ETag / If-None-Match aware, gzip or br compressed)"""
     scanning_service = get_scanning_service()
-    scan_data = await scanning_service.get_scan_status(scan_id, current_user)
+    scan_state = await scanning_service.get_cached_results(scan_id, current_user)
 
-    if not scan_data:
+    if not scan_state:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Scan not found"
         )
 
-    if scan_data.status != ScanStatus.COMPLETED:
+    if scan_state["status"] != ScanStatus.COMPLETED.value:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Scan not completed"
         )
 
-    if not scan_data.results:
+    if scan_state["cached"] is not None:
+        return _cached_results_response(request, scan_state["cached"])
+
+    if not scan_state["results"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Scan results not available"
         )
 
-    return scan_data.results.get("scan_results", {})
+    return scan_state["results"]
+
+@router.get("/cve-report/{scan_id}", response_class=PlainTextResponse)
+async def get_scan_cve_report(
+    scan_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Get the text CVE report of a completed scan (rendered from its CVE records)"""
+    scanning_service = get_scanning_service()
+    report_text = await scanning_service.get_cve_report_text(scan_id, current_user)
+
+    if report_text is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="CVE report not available"
+        )
+
+    return PlainTextResponse(report_text)
 
 @router.post("/network-discovery", response_model=NetworkDiscoveryResponse)
 async def network_discovery_endpoint(
@@ -376,27 +527,41 @@ async def network_discovery_endpoint(
     - Discovers devices on network
     - Gets IP addresses and MAC addresses
     - Returns structured JSON with GPT analysis
+    - Recent sweeps of the same range are served from the discovery cache
+    - Ranges wider than settings.discovery_max_prefix (or public ranges) are rejected
     """
     try:
         # Initialize network discovery service
         network_discovery = NetworkDiscovery()
+        network_range = await network_discovery.resolve_network_range(request.network_range)
 
         # Log network discovery start
         logging.info(f"Network discovery started for range: {request.network_range}")
 
         # Perform network discovery
-        result = await network_discovery.discover_network(request.network_range)
+        result = await network_discovery.discover_network_cached(
+            network_range,
+            max_age_seconds=request.max_age_seconds,
+            force_refresh=request.force_refresh,
+            delta=request.delta
+        )
+        cache_hit = result["raw_data"].get("cache", {}).get("hit", False)
 
         # Log successful completion
-        logging.info(f"Network discovery completed")
+        logging.info(f"Network discovery completed{' (cached)' if cache_hit else ''}")
 
         return NetworkDiscoveryResponse(
             status="success",
-            message="Network discovery completed",
+            message="Network discovery served from cache" if cache_hit else "Network discovery completed",
             data=result["raw_data"],
             json_result=result["gpt_analysis"]
         )
 
+    except NetworkRangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         # Log error
         logging.error(f"Network discovery failed: {str(e)}")
@@ -406,6 +571,38 @@ async def network_discovery_endpoint(
             detail=f"Network discovery failed: {str(e)}"
         )
 
+@router.get("/network-discovery/stream")
+async def network_discovery_stream_endpoint(
+    network_range: Optional[str] = None
+):
+    """
+    Streaming Network Discovery (server-sent events)
+    - "host" events as devices are found, repeated when a MAC or hostname arrives
+    - "progress" events as each chunk of the range finishes
+    - a final "complete" event with the totals
+    - ranges are limited like POST /network-discovery; streamed sweeps are live
+      views only and are not saved to the discovery cache (no first/last seen,
+      deltas or GPT analysis)
+    """
+    network_discovery = NetworkDiscovery()
+    try:
+        network_range = await network_discovery.resolve_network_range(network_range)
+    except NetworkRangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    logging.info(f"Streaming network discovery started for range: {network_range}")
+
+    async def event_stream():
+        event_id = 0
+        async for event in network_discovery.discover_hosts(network_range):
+            event_id += 1
+            yield format_sse({"id": event_id, **event})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.post("/port-discovery", response_model=PortDiscoveryResponse)
 async def port_discovery_endpoint(
     request: PortDiscoveryRequest
@@ -446,6 +643,51 @@ async def port_discovery_endpoint(
             detail=f"Port discovery failed: {str(e)}"
         )
 
+@router.post("/port-discovery/batch", response_model=PortDiscoveryResponse)
+async def port_batch_discovery_endpoint(
+    request: PortBatchDiscoveryRequest
+):
+    """
+    Multi-port Port Discovery
+    - One nmap version/script scan covering every requested port
+    - CVE lookups once per distinct service, run concurrently
+    - One combined GPT analysis for all ports
+    """
+    ports = sorted(set(request.ports))
+    if not ports or len(ports) > MAX_PORTS_PER_REQUEST:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Provide between 1 and {MAX_PORTS_PER_REQUEST} ports"
+        )
+    if any(port < 1 or port > 65535 for port in ports):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ports must be between 1 and 65535"
+        )
+
+    port_list = ",".join(map(str, ports))
+    try:
+        port_discovery = PortDiscovery()
+
+        logging.info(f"Port discovery started for {request.target} ports {port_list}")
+        result = await port_discovery.scan_ports(request.target, ports)
+        logging.info(f"Port discovery completed for {request.target} ports {port_list}")
+
+        return PortDiscoveryResponse(
+            status="success",
+            message=f"Port discovery completed for {request.target} ({len(ports)} ports)",
+            data=result["raw_data"],
+            json_result=result["gpt_analysis"]
+        )
+
+    except Exception as e:
+        logging.error(f"Port discovery failed: {str(e)}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Port discovery failed: {str(e)}"
+        )
+
 @router.get("/health")
 async def scanning_health_check():
     """Health check for scanning service"""
@@ -457,6 +699,9 @@ async def scanning_health_check():
         # Check if required environment variables are set
         openai_key_set = bool(os.getenv("OPENAI_API_KEY"))
 
+        # CVE query scheduler metrics (queue depth, wait times) once it has started
+        cve_scheduler = get_cve_scheduler()
+
         return {
             "status": "healthy",
             "results_directory": settings.results_dir,
@@ -464,6 +709,8 @@ async def scanning_health_check():
             "results_dir_exists": results_dir_exists,
             "reports_dir_exists": reports_dir_exists,
             "openai_configured": openai_key_set,
+            "cve_scheduler": cve_scheduler.stats() if cve_scheduler else None,
+            "results_cache": get_results_cache().stats(),
             "message": "Scanning service is operational"
         }
     except Exception as e:
@@ -471,4 +718,15 @@ async def scanning_health_check():
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Scanning service unhealthy: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# Prometheus text exposition format
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics")
+async def scanning_metrics():
+    """
+    Scan metrics for Prometheus: phase, span, LLM and CVE query latency histograms,
+    finished scan counts, and live gauges (active scans, nmap processes, CVE queue depth)
+    """
+    return PlainTextResponse(render_metrics(), media_type=METRICS_MEDIA_TYPE)
\ No newline at end of file
@@ -1,6 +1,9 @@
 """
 PortDiscovery Service
 Automated port scanning, version detection, and CVE lookup
+nmap runs as an asyncio subprocess and the CVE and GPT calls run off the event
+loop, so a discovery never blocks other requests. scan_ports covers a whole port
+list with one nmap run, one CVE lookup per distinct service and one GPT analysis.
 """
 
 import nmap
@@ -15,8 +18,26 @@ from datetime import datetime
 import openai
 from dotenv import load_dotenv
 
+from config.settings import settings
+from app.scanning.cve_index import get_cve_index
+from app.scanning.nmap_runner import run_command_async
+
 load_dotenv()
 
+# Version and default-script detection (python-nmap's "-sV -sC --version-intensity=9")
+NMAP_ARGUMENTS = ["-sV", "-sC", "--version-intensity", "9"]
+
+# nmap timeout: a base plus a per-port allowance for intensity-9 probing and scripts
+NMAP_BASE_TIMEOUT = 60
+NMAP_TIMEOUT_PER_PORT = 20
+NMAP_MAX_TIMEOUT = 900
+
+# Largest port list a single scan_ports request may ask for
+MAX_PORTS_PER_REQUEST = 100
+
+# vulnx lookups running at once for one request
+CVE_LOOKUP_CONCURRENCY = 4
+
 class PortDiscovery:
     def __init__(self):
         self.nm = nmap.PortScanner()
@@ -31,9 +52,8 @@ class PortDiscovery:
         try:
             print(f"[*] Starting port scan on {target}:{port}")
 
-            # Perform nmap scan for specific port (fix argument parsing)
-            scan_args = f"-sV -sC --version-intensity=9"
-            self.nm.scan(target, str(port), arguments=scan_args)
+            # Perform nmap scan for specific port without blocking the event loop
+            host_data = await self._run_nmap(target, [port])
 
             raw_data = {
                 "target": target,
@@ -43,9 +63,7 @@ class PortDiscovery:
                 "results": {}
             }
 
-            if target in self.nm.all_hosts():
-                host_data = self.nm[target]
-
+            if host_data is not None:
                 if 'tcp' in host_data and port in host_data['tcp']:
                     port_info = host_data['tcp'][port]
 
@@ -115,6 +133,128 @@ class PortDiscovery:
                 }
             }
 
+    async def scan_ports(self, target: str, ports: List[int]) -> Dict[str, Any]:
+        """
+        Scan a list of ports with one nmap run, look up CVEs once per distinct
+        service (concurrently) and get one combined GPT analysis
+        """
+        ports = sorted(set(ports))
+        try:
+            print(f"[*] Starting port scan on {target} ports {','.join(map(str, ports))}")
+            started = datetime.now()
+            host_data = await self._run_nmap(target, ports)
+
+            raw_data = {
+                "target": target,
+                "ports": ports,
+                "timestamp": started.isoformat(),
+                "scan_status": "completed",
+                "results": {},
+                "services": []
+            }
+
+            if host_data is None:
+                print(f"[-] Target {target} not reachable")
+                raw_data["scan_status"] = "failed"
+                raw_data["error"] = "Target not reachable"
+            else:
+                tcp_data = host_data.get('tcp', {})
+                services = {}
+                for port in ports:
+                    if port not in tcp_data:
+                        raw_data["results"][str(port)] = {
+                            "port_state": "closed",
+                            "service_name": "unknown",
+                            "service_version": "unknown",
+                            "cves": []
+                        }
+                        continue
+
+                    port_info = tcp_data[port]
+                    port_result = {
+                        "port_state": port_info.get('state', 'closed'),
+                        "service_name": port_info.get('name', 'unknown'),
+                        "service_version": port_info.get('version', 'unknown'),
+                        "service_product": port_info.get('product', ''),
+                        "service_extrainfo": port_info.get('extrainfo', ''),
+                        "port_info": port_info,
+                        "cves": []
+                    }
+                    raw_data["results"][str(port)] = port_result
+                    if port_result["port_state"] == 'open':
+                        print(f"[+] Port {port} is open - {port_result['service_name']} {port_result['service_version']}")
+                        key = (port_result["service_name"], port_result["service_version"], port_result["service_product"])
+                        services.setdefault(key, []).append(port)
+
+                # Ports running the same service share one lookup
+                cve_lists = await self._lookup_services_cves(list(services))
+                for (service_name, service_version, service_product), cves in zip(services, cve_lists):
+                    service_ports = services[(service_name, service_version, service_product)]
+                    for port in service_ports:
+                        raw_data["results"][str(port)]["cves"] = cves
+                    raw_data["services"].append({
+                        "service_name": service_name,
+                        "service_version": service_version,
+                        "service_product": service_product,
+                        "ports": service_ports,
+                        "cves_found": len(cves)
+                    })
+
+            raw_data["scan_seconds"] = round((datetime.now() - started).total_seconds(), 2)
+
+            # One GPT analysis for the whole port list
+            gpt_analysis = await self._get_gpt_batch_analysis(raw_data)
+
+            return {
+                "raw_data": raw_data,
+                "gpt_analysis": gpt_analysis
+            }
+
+        except Exception as e:
+            print(f"[!] Error during port scan: {e}")
+            return {
+                "raw_data": {
+                    "target": target,
+                    "ports": ports,
+                    "timestamp": datetime.now().isoformat(),
+                    "scan_status": "failed",
+                    "error": str(e)
+                },
+                "gpt_analysis": {
+                    "status": "error",
+                    "message": f"Port discovery failed: {str(e)}"
+                }
+            }
+
+    async def _run_nmap(self, target: str, ports: List[int]) -> Optional[Dict[str, Any]]:
+        """
+        Run nmap for all ports as one asyncio subprocess and parse its XML with
+        python-nmap, so results keep the PortScanner host/port dict shape.
+        Returns the target's host data, or None if the host did not answer.
+        """
+        timeout = min(NMAP_MAX_TIMEOUT, NMAP_BASE_TIMEOUT + NMAP_TIMEOUT_PER_PORT * len(ports))
+        command = ["nmap", *NMAP_ARGUMENTS, "-p", ",".join(map(str, ports)), "-oX", "-", target]
+        result = await run_command_async(command, timeout=timeout)
+        if not result["stdout"]:
+            raise RuntimeError(result["stderr"] or f"nmap exited with {result['returncode']}")
+
+        self.nm.analyse_nmap_xml_scan(nmap_xml_output=result["stdout"], nmap_err=result["stderr"])
+        hosts = self.nm.all_hosts()
+        if target in hosts:
+            return self.nm[target]
+        # A hostname target is reported under its address
+        return self.nm[hosts[0]] if hosts else None
+
+    async def _lookup_services_cves(self, services: List[tuple]) -> List[List[Dict[str, Any]]]:
+        """CVE lists for (service_name, service_version, service_product) tuples, looked up concurrently"""
+        semaphore = asyncio.Semaphore(CVE_LOOKUP_CONCURRENCY)
+
+        async def lookup(service_name, service_version, service_product):
+            async with semaphore:
+                return await self._lookup_cves(service_name, service_version, service_product)
+
+        return await asyncio.gather(*(lookup(*service) for service in services))
+
     async def _lookup_cves(self, service_name: str, service_version: str, service_product: str) -> List[Dict[str, Any]]:
         """
         Lookup CVEs for detected service using 1x command
@@ -135,13 +275,39 @@ class PortDiscovery:
                 return cves
 
             search_query = " ".join(search_terms)
+
+            # Prefer the offline CVE index when it is populated
+            cve_index = get_cve_index()
+            if cve_index:
+                print(f"[*] Searching CVEs in offline index for: {search_query}")
+                svc = {
+                    "service": service_name if service_name != 'unknown' else "",
+                    "product": service_product if service_product != 'unknown' else "",
+                    "version": service_version if service_version != 'unknown' else ""
+                }
+                vulns = (await asyncio.to_thread(cve_index.lookup_services, [svc], 10))[0]
+                for vuln in vulns:
+                    cves.append({
+                        "cve_id": vuln["cve_id"],
+                        "summary": vuln.get("description") or f"Vulnerability in {search_query}",
+                        "severity": vuln.get("severity") or (self._cvss_to_severity(vuln["cvss_score"]) if vuln.get("cvss_score") else "medium"),
+                        "cvss_score": vuln.get("cvss_score"),
+                        "epss_score": vuln.get("epss_score"),
+                        "exploit_available": vuln.get("is_exploit_available", False),
+                        "published": vuln.get("published") or "Unknown",
+                        "modified": "Unknown",
+                        "source": "offline_index"
+                    })
+                print(f"[+] Found {len(cves)} CVEs in offline index")
+                return cves
+
             print(f"[*] Searching CVEs using vulnx for: {search_query}")
 
             # Use vulnx command for CVE lookup
             try:
                 # Run vulnx search command with proper format
-                cmd = ['/home/kali/go/bin/vulnx', 'search', '--json', '--limit', '10', search_query]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+                cmd = [settings.vulnx_path, 'search', '--json', '--limit', '10', search_query]
+                result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True, timeout=30)
 
                 if result.returncode == 0 and result.stdout:
                     # Parse vulnx JSON output
@@ -326,7 +492,8 @@ class PortDiscovery:
         try:
             search_query = " ".join([s for s in [service_product, service_name, service_version] if s and s != 'unknown'])
 
-            response = requests.get(
+            response = await asyncio.to_thread(
+                requests.get,
                 f"{self.cve_search_url}/{search_query}",
                 timeout=10
             )
@@ -417,24 +584,7 @@ class PortDiscovery:
             Focus on security implications and provide actionable recommendations.
             """
 
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a cybersecurity expert analyzing network port scan results. Provide accurate, detailed security assessments in valid JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-
-            # Parse GPT response
-            gpt_content = response.choices[0].message.content.strip()
-
-            # Try to extract JSON from response
-            if '```json' in gpt_content:
-                gpt_content = gpt_content.split('```json')[1].split('```')[0].strip()
-            elif '```' in gpt_content:
-                gpt_content = gpt_content.split('```')[1].split('```')[0].strip()
+            gpt_content = await self._complete_json(prompt)
 
             # Parse JSON
             analysis = json.loads(gpt_content)
@@ -460,4 +610,110 @@ class PortDiscovery:
                     "service_detected": f"{scan_data['results'].get('service_name', 'unknown')} {scan_data['results'].get('service_version', 'unknown')}",
                     "vulnerabilities_found": len(scan_data["results"].get("cves", []))
                 }
-            }
\ No newline at end of file
+            }
+
+    async def _get_gpt_batch_analysis(self, scan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        One GPT analysis covering every scanned port
+        """
+        # The model only needs the service details, not python-nmap's raw port dicts
+        port_results = {
+            port: {key: value for key, value in result.items() if key != "port_info"}
+            for port, result in scan_data.get("results", {}).items()
+        }
+        try:
+            prompt = f"""
+            Analyze the following port discovery scan results and provide a structured JSON response:
+
+            Target: {scan_data['target']}
+            Ports: {', '.join(map(str, scan_data['ports']))}
+            Scan Status: {scan_data['scan_status']}
+            Results per port: {json.dumps(port_results, indent=2)}
+
+            Please provide a JSON response with the following structure:
+            {{
+                "security_assessment": {{
+                    "risk_level": "low/medium/high/critical",
+                    "vulnerabilities_found": number_of_cves,
+                    "exploitable": true/false,
+                    "recommendations": ["recommendation1", "recommendation2"]
+                }},
+                "ports": [
+                    {{
+                        "port": port_number,
+                        "port_status": "open/closed/filtered",
+                        "service_detected": "service name and version",
+                        "risk_level": "low/medium/high/critical"
+                    }}
+                ],
+                "cve_summary": [
+                    {{
+                        "cve_id": "CVE-XXXX-XXXX",
+                        "port": port_number,
+                        "severity": "low/medium/high/critical",
+                        "description": "Brief description",
+                        "exploitable": true/false
+                    }}
+                ],
+                "next_steps": ["what to do next"]
+            }}
+
+            Focus on security implications and provide actionable recommendations.
+            """
+
+            gpt_content = await self._complete_json(prompt, max_tokens=3000)
+            analysis = json.loads(gpt_content)
+            analysis["analysis_timestamp"] = datetime.now().isoformat()
+            analysis["status"] = "success"
+            return analysis
+
+        except json.JSONDecodeError as e:
+            print(f"[!] Failed to parse GPT JSON response: {e}")
+            return {
+                "status": "error",
+                "message": "Failed to parse GPT analysis",
+                "raw_response": gpt_content if 'gpt_content' in locals() else "No response"
+            }
+        except Exception as e:
+            print(f"[!] Error getting GPT analysis: {e}")
+            return {
+                "status": "error",
+                "message": f"GPT analysis failed: {str(e)}",
+                "fallback_analysis": {
+                    "ports": [
+                        {
+                            "port": int(port),
+                            "port_status": result.get("port_state", "unknown"),
+                            "service_detected": f"{result.get('service_name', 'unknown')} {result.get('service_version', 'unknown')}",
+                            "vulnerabilities_found": len(result.get("cves", []))
+                        }
+                        for port, result in port_results.items()
+                    ]
+                }
+            }
+
+    async def _complete_json(self, prompt: str, max_tokens: int = 2000) -> str:
+        """
+        Ask GPT for a JSON answer (the blocking OpenAI client runs in a worker thread)
+        and strip any markdown code fence around it
+        """
+        response = await asyncio.to_thread(
+            self.openai_client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a cybersecurity expert analyzing network port scan results. Provide accurate, detailed security assessments in valid JSON format."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+
+        # Parse GPT response
+        gpt_content = response.choices[0].message.content.strip()
+
+        # Try to extract JSON from response
+        if '```json' in gpt_content:
+            gpt_content = gpt_content.split('```json')[1].split('```')[0].strip()
+        elif '```' in gpt_content:
+            gpt_content = gpt_content.split('```')[1].split('```')[0].strip()
+        return gpt_content
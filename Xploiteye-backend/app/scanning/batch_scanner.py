@@ -0,0 +1,389 @@
+"""
+Batch scanning
+Scans a list of targets and CIDR ranges as one job. Live hosts are packed into
+shared nmap invocations (hosts with the same open ports share one -sV run), each
+distinct service/version pair is looked up once for the whole batch, and the
+results are fanned back out into one scan result per host.
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from config.logging_config import scanning_logger
+from config.settings import settings
+from app.scanning.cve_records import to_report_vulnerability, write_jsonl
+from app.scanning.nmap_runner import merge_parsed_data, run_nmap_streaming
+from app.scanning.report_builder import build_scan_results, heuristic_risk_assessment
+from app.scanning.scan_context import ScanContext, register_scan_context, release_scan_context
+from app.scanning.scan_metrics import finish_scan_timings
+from app.scanning.scanner_engine import (
+    NMAP_STATS_INTERVAL, lookup_cve_records, run_nmap_phase, select_services_for_cve_lookup
+)
+from app.services.dns_resolver_service import get_dns_resolver_service
+
+# Ports and per-group nmap timeouts of each scan type (same ranges as the single-target scans)
+BATCH_SCAN_TYPES = {
+    "light": {"max_ports": 1000, "discovery_timeout": 45, "version_timeout": 60},
+    "medium": {"max_ports": 5000, "discovery_timeout": 250, "version_timeout": 80},
+    "deep": {"max_ports": 15000, "discovery_timeout": 600, "version_timeout": 180}
+}
+
+# nmap works through a host group in parallel; timeouts grow by one base timeout per this many hosts
+HOSTS_PER_TIMEOUT = 8
+
+HOST_SWEEP_TIMEOUT = 120
+
+
+class BatchTargetError(ValueError):
+    """Raised when a batch's targets are invalid or expand to too many hosts."""
+
+
+def expand_targets(targets: List[str], max_hosts: int) -> List[str]:
+    """
+    Expand IPs, CIDR ranges and hostnames into a de-duplicated host list, in order.
+    CIDR ranges contribute their usable host addresses; hostnames are kept as given.
+    """
+    hosts, seen = [], set()
+    for target in targets:
+        target = (target or "").strip()
+        if not target:
+            continue
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            addresses = [target]
+        else:
+            # A range that cannot fit is rejected before any address is generated
+            # (a /8 or an IPv6 /64 would otherwise block the event loop)
+            if network.num_addresses - 2 > max_hosts:
+                raise BatchTargetError(f"{target} has more than {max_hosts} hosts")
+            addresses = (str(ip) for ip in (network.hosts() if network.num_addresses > 2 else network))
+        for address in addresses:
+            if address in seen:
+                continue
+            seen.add(address)
+            hosts.append(address)
+            if len(hosts) > max_hosts:
+                raise BatchTargetError(f"Batch expands to more than {max_hosts} hosts")
+    if not hosts:
+        raise BatchTargetError("No targets given")
+    return hosts
+
+
+async def resolve_hosts(hosts: List[str]) -> Dict[str, str]:
+    """Map each host to the IPv4 address nmap will report it under ({ip: original target})."""
+    names = []
+    for host in hosts:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            names.append(host)
+    # Hostnames are resolved together (and cached) by the shared resolver
+    addresses = await get_dns_resolver_service().resolve_many(names, "A") if names else {}
+
+    resolved = {}
+    for host in hosts:
+        if host not in addresses:
+            resolved.setdefault(host, host)
+        elif addresses[host]:
+            resolved.setdefault(addresses[host][0], host)
+        else:
+            logging.warning(f"⚠️ Batch target {host} does not resolve, skipping")
+    return resolved
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _group_timeout(base_timeout: int, host_count: int) -> int:
+    return base_timeout * max(1, -(-host_count // HOSTS_PER_TIMEOUT))
+
+
+def _hosts_by_ip(parsed_data: Dict) -> Dict[str, Dict]:
+    return {host["ip"]: host for host in (parsed_data or {}).get("hosts", []) if host.get("ip")}
+
+
+def _open_ports_of(host: Dict) -> List[str]:
+    return [port["port"] for port in host.get("ports", []) if port.get("state") == "open"]
+
+
+async def sweep_live_hosts(ips: List[str], semaphore: asyncio.Semaphore) -> List[str]:
+    """Ping sweep (nmap -sn) the hosts in shared invocations; returns the ones that are up."""
+    async def sweep(group):
+        command = ["sudo", "nmap", "-sn", "-n", "--stats-every", NMAP_STATS_INTERVAL, "-oX", "-", *group]
+        async with semaphore:
+            result = await run_nmap_streaming(command, timeout=_group_timeout(HOST_SWEEP_TIMEOUT, len(group)))
+        if not result["success"]:
+            logging.warning(f"⚠️ Host sweep of {len(group)} hosts failed: {result['stderr']}")
+        return result["parsed_data"]
+
+    sweeps = await asyncio.gather(*(sweep(group) for group in _chunks(ips, settings.batch_hosts_per_nmap)))
+    up = {ip for parsed in sweeps for ip, host in _hosts_by_ip(parsed).items() if host.get("status") == "up"}
+    return [ip for ip in ips if ip in up]
+
+
+async def discover_ports(ips: List[str], profile: Dict, semaphore: asyncio.Semaphore) -> Dict[str, Dict]:
+    """Port and OS discovery over host groups; returns the merged host dict per IP."""
+    port_range = f"1-{profile['max_ports']}"
+
+    async def discover(group):
+        async with semaphore:
+            result = await run_nmap_phase(
+                "discovery", group, port_range, profile["max_ports"] * len(group),
+                _group_timeout(profile["discovery_timeout"], len(group))
+            )
+        if not result["success"]:
+            logging.warning(f"⚠️ Port discovery of {len(group)} hosts failed: {result['stderr']}")
+        return result["parsed_data"]
+
+    discoveries = await asyncio.gather(*(discover(group) for group in _chunks(ips, settings.batch_hosts_per_nmap)))
+    return _hosts_by_ip(merge_parsed_data(discoveries))
+
+
+async def detect_versions(discovered: Dict[str, Dict], profile: Dict, semaphore: asyncio.Semaphore) -> Dict[str, Dict]:
+    """
+    -sV over the open ports of each host. Hosts with the same open ports share an nmap
+    run, so a fleet of identical machines costs one version scan per host group.
+    """
+    by_ports: Dict[Tuple[str, ...], List[str]] = {}
+    for ip, host in discovered.items():
+        open_ports = _open_ports_of(host)
+        if open_ports:
+            by_ports.setdefault(tuple(open_ports), []).append(ip)
+
+    async def detect(ports, group):
+        async with semaphore:
+            result = await run_nmap_phase(
+                "version", group, ",".join(ports), len(ports) * len(group),
+                _group_timeout(profile["version_timeout"], len(group))
+            )
+        if not result["success"]:
+            logging.warning(f"⚠️ Version detection of {len(group)} hosts failed: {result['stderr']}")
+        return result["parsed_data"]
+
+    jobs = [
+        detect(ports, group)
+        for ports, ips in by_ports.items()
+        for group in _chunks(ips, settings.batch_hosts_per_nmap)
+    ]
+    logging.info(f"🧩 Batch version detection: {len(by_ports)} distinct port sets, {len(jobs)} nmap runs")
+    return _hosts_by_ip(merge_parsed_data(await asyncio.gather(*jobs)))
+
+
+def lookup_key(svc: Dict) -> Tuple[str, str]:
+    """Identity of a CVE lookup: service name and version, independent of host and port."""
+    return (svc.get("service") or "").lower(), svc.get("version") or ""
+
+
+def fan_out_records(selected: List[Dict], records_by_key: Dict[Tuple[str, str], List[Dict]]) -> List[Dict]:
+    """CVE records of one host: the shared lookup results re-labelled with the host's ports."""
+    records = []
+    for svc in selected:
+        for record in records_by_key.get(lookup_key(svc), []):
+            records.append({**record, "port": svc["port"]})
+    return records
+
+
+def _host_scan_data(target: str, scan_type: str, user_id: str, duration: float,
+                    discovered: Dict, versioned: Dict, selected: List[Dict], records: List[Dict]) -> Dict:
+    """Structured scan data of one host in the layout report_builder expects."""
+    profile = BATCH_SCAN_TYPES[scan_type]
+    services = [
+        {
+            "port": port["port"],
+            "service": port.get("service"),
+            "version": port.get("version"),
+            "protocol": port.get("protocol", "tcp"),
+            "state": port.get("state", "open")
+        }
+        for port in (versioned or discovered).get("ports", [])
+    ]
+    return {
+        "target": target,
+        "scan_type": scan_type,
+        "user_id": user_id,
+        "scan_duration": round(duration, 2),
+        "scan_coverage": {
+            "port_range": f"1-{profile['max_ports']}",
+            "total_ports_scanned": profile["max_ports"],
+            "scan_techniques": ["TCP SYN scan", "OS detection", "Service detection", "CVE lookup"]
+        },
+        "os_details": discovered.get("os_details") or {},
+        "ports_scanned": profile["max_ports"],
+        "open_ports": len(_open_ports_of(discovered)),
+        "critical_ports": len({s["port"] for s in services if s.get("version") and s["version"].strip()}),
+        "vulnerable_ports": len({str(r["port"]) for r in records if r.get("cve_id")}),
+        "cves_found": len(records),
+        "services": services,
+        "gpt_selected_services": selected,
+        "vulnerabilities": [to_report_vulnerability(r) for r in records if r.get("cve_id")]
+    }
+
+
+def _write_host_results(scan_id: str, target: str, scan_type: str, user_id: str,
+                        scan_results: Dict, records: List[Dict]) -> Tuple[str, str]:
+    """Save the host's scan JSON and CVE records under the names single scans use."""
+    result_folder = settings.results_dir
+    os.makedirs(result_folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    prefix = f"{result_folder}/{user_id}_{target.replace('.', '_').replace(':', '_')}_{scan_type}_{scan_id}"
+
+    json_file_path = f"{prefix}_scan_{timestamp}.json"
+    with open(json_file_path, "w", encoding="utf-8") as f:
+        json.dump(scan_results, f, indent=2, ensure_ascii=False)
+    scanning_logger.file_generated("json", json_file_path, target)
+
+    cve_records_path = ""
+    if records:
+        cve_records_path = f"{prefix}_cves_{timestamp}.jsonl"
+        write_jsonl(cve_records_path, records)
+        scanning_logger.file_generated("jsonl", cve_records_path, target)
+    return json_file_path, cve_records_path
+
+
+async def execute_batch_scan(batch_id: str, targets: List[str], scan_type: str, user_id: str = "unknown",
+                             progress_callback=None) -> Dict:
+    """
+    Run a batch scan and return one result per host plus a batch summary.
+
+    Host results carry their own scan_id, scan_results document and file paths, in the
+    shape execute_scan_with_controller returns for a single target.
+    """
+    scan_type = scan_type.lower()
+    profile = BATCH_SCAN_TYPES.get(scan_type)
+    if profile is None:
+        return {"status": "failed", "error": f"Unsupported scan type for batch scans: {scan_type}", "hosts": []}
+
+    ctx = ScanContext(batch_id, ", ".join(targets)[:200], scan_type, user_id)
+    if progress_callback is not None:
+        ctx.add_listener(progress_callback)
+    ctx_token = register_scan_context(ctx)
+    ctx.track_task(asyncio.current_task())
+    started = time.time()
+    semaphore = asyncio.Semaphore(max(1, settings.batch_scan_parallelism))
+    timings = None
+
+    try:
+        ctx.set_phase("host_discovery")
+        hosts = expand_targets(targets, settings.batch_scan_max_hosts)
+        labels = await resolve_hosts(hosts)
+        live_ips = await sweep_live_hosts(list(labels), semaphore)
+        logging.info(f"📡 Batch {batch_id[:8]}: {len(live_ips)} of {len(labels)} hosts up")
+
+        ctx.set_phase("port_discovery")
+        discovered = await discover_ports(live_ips, profile, semaphore) if live_ips else {}
+
+        ctx.set_phase("version_detection")
+        versioned = await detect_versions(discovered, profile, semaphore) if discovered else {}
+
+        ctx.set_phase("service_normalization")
+        selected_by_ip, unique_services = {}, {}
+        for ip, host in versioned.items():
+            services = [{**port, "state": port.get("state", "open")} for port in host.get("ports", [])]
+            selected_by_ip[ip] = await select_services_for_cve_lookup(services, scan_type)
+            for svc in selected_by_ip[ip]:
+                unique_services.setdefault(lookup_key(svc), svc)
+
+        ctx.set_phase("cve_lookup")
+        total_selected = sum(len(selected) for selected in selected_by_ip.values())
+        logging.info(f"🔍 Batch {batch_id[:8]}: {len(unique_services)} distinct services to look up for {total_selected} selected across hosts")
+        records_by_key: Dict[Tuple[str, str], List[Dict]] = {}
+        cve_engine, cve_error = None, None
+        if unique_services:
+            try:
+                primary, fallback, cve_engine = await asyncio.to_thread(lookup_cve_records, ctx, list(unique_services.values()))
+                for record in primary + fallback:
+                    records_by_key.setdefault(lookup_key(record), []).append(record)
+            except Exception as e:
+                logging.error(f"Batch CVE lookup failed: {e}")
+                cve_error = str(e)
+
+        ctx.emit("cves", {
+            "unique_services": len(unique_services),
+            "vulnerabilities_found": sum(len(records) for records in records_by_key.values()),
+            "engine": cve_engine
+        })
+
+        ctx.set_phase("report_formatting")
+        duration = time.time() - started
+        host_results = []
+        for ip in labels:
+            target = labels[ip]
+            if ip not in discovered:
+                host_results.append({"ip": ip, "target": target, "status": "down" if ip not in live_ips else "failed"})
+                continue
+
+            selected = selected_by_ip.get(ip, [])
+            records = fan_out_records(selected, records_by_key)
+            scan_data = _host_scan_data(target, scan_type, user_id, duration,
+                                        discovered[ip], versioned.get(ip), selected, records)
+            scan_results = build_scan_results(scan_data, heuristic_risk_assessment(scan_data))
+            scan_results["summary"]["batch_id"] = batch_id
+
+            scan_id = str(uuid.uuid4())
+            try:
+                json_file_path, cve_records_path = _write_host_results(scan_id, target, scan_type, user_id, scan_results, records)
+            except Exception as e:
+                logging.error(f"Failed to save batch results of {target}: {e}")
+                json_file_path, cve_records_path = "", ""
+
+            host_results.append({
+                "ip": ip,
+                "target": target,
+                "status": "completed",
+                "scan_id": scan_id,
+                "scan_results": scan_results,
+                "records": records,
+                "json_file_path": json_file_path,
+                "cve_records_path": cve_records_path
+            })
+
+        completed = [h for h in host_results if h["status"] == "completed"]
+        severity_counts: Dict[str, int] = {}
+        for host in completed:
+            for record in host["records"]:
+                severity = (record.get("severity") or "unknown").lower()
+                severity_counts[severity] = severity_counts.get(severity, 0) + 1
+
+        summary = {
+            "scan_type": scan_type,
+            "hosts_total": len(labels),
+            "hosts_up": len(live_ips),
+            "hosts_scanned": len(completed),
+            "open_ports": sum(h["scan_results"]["summary"]["open_ports"] for h in completed),
+            "selected_services": total_selected,
+            "unique_services_looked_up": len(unique_services),
+            "cves_found": sum(len(h["records"]) for h in completed),
+            "severity_counts": severity_counts,
+            "highest_risk": max(
+                ({"target": h["target"], "risk_score": h["scan_results"]["summary"]["risk_score"]} for h in completed),
+                key=lambda h: h["risk_score"], default=None
+            ),
+            "cve_engine": cve_engine,
+            "cve_error": cve_error,
+            "scan_duration": round(time.time() - started, 2)
+        }
+        logging.info(f"✅ Batch {batch_id[:8]} completed: {summary['hosts_scanned']} hosts, {summary['cves_found']} CVEs in {summary['scan_duration']}s")
+        timings = finish_scan_timings(ctx, "completed")
+        return {"status": "completed", "summary": summary, "hosts": host_results, "timings": timings}
+
+    except BatchTargetError as e:
+        timings = finish_scan_timings(ctx, "failed")
+        return {"status": "failed", "error": str(e), "hosts": [], "timings": timings}
+    except Exception as e:
+        logging.error(f"Batch scan {batch_id} failed: {e}")
+        timings = finish_scan_timings(ctx, "failed")
+        return {"status": "failed", "error": str(e), "hosts": [], "timings": timings}
+    finally:
+        if timings is None:
+            finish_scan_timings(ctx, "cancelled")
+        release_scan_context(ctx, ctx_token)
@@ -0,0 +1,144 @@
+"""
+Persistent CVE lookup cache
+SQLite-backed cache of vulnx search results keyed by the normalized query string,
+shared by every scan and every worker process on the host.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import time
+from threading import Lock
+from typing import Optional, Tuple
+
+from config.settings import settings
+
+
+class CveLookupCache:
+    """
+    Disk-backed cache for CVE lookups.
+
+    Positive results (the vulnerability JSON returned for a query) are kept for
+    ttl_seconds; queries that returned nothing are cached as negative entries for
+    negative_ttl_seconds so common "no result" services do not hit the API again.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, negative_ttl_seconds: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            # WAL lets several backend workers read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS cve_lookups (
+                       query_key TEXT PRIMARY KEY,
+                       payload TEXT,
+                       is_negative INTEGER NOT NULL,
+                       created_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Normalize a lookup query so 'OpenSSH  4.7p1' and 'openssh 4.7p1' share an entry."""
+        return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+    def get(self, query: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look up a query.
+
+        Returns (found, payload): found is False on a miss or expired entry; payload is
+        None for a cached negative result.
+        """
+        key = self.normalize_query(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, is_negative, created_at FROM cve_lookups WHERE query_key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is not None:
+                payload, is_negative, created_at = row
+                ttl = self.negative_ttl_seconds if is_negative else self.ttl_seconds
+                if now - created_at <= ttl:
+                    if is_negative:
+                        self.negative_hits += 1
+                        return True, None
+                    self.hits += 1
+                    return True, payload
+
+            self.misses += 1
+            return False, None
+
+    def put(self, query: str, payload: Optional[str]):
+        """Store a lookup result; payload None stores a negative (no CVE found) entry."""
+        key = self.normalize_query(query)
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cve_lookups (query_key, payload, is_negative, created_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, 1 if payload is None else 0, time.time())
+                )
+                self._conn.commit()
+                self.stores += 1
+            except sqlite3.Error as e:
+                logging.error(f"Failed to store CVE cache entry for '{key}': {e}")
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cve_lookups WHERE (is_negative = 0 AND created_at < ?) OR (is_negative = 1 AND created_at < ?)",
+                (now - self.ttl_seconds, now - self.negative_ttl_seconds)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the number of stored entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cve_lookups").fetchone()[0]
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "entries": entries,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0
+        }
+
+
+# Global cache instance
+_cve_cache = None
+
+
+def get_cve_cache() -> Optional[CveLookupCache]:
+    """Get or create the CVE lookup cache (None when caching is disabled or unavailable)."""
+    global _cve_cache
+    if _cve_cache is None and settings.cve_cache_enabled:
+        db_path = settings.cve_cache_path or os.path.join(settings.results_dir, "cve_lookup_cache.sqlite3")
+        try:
+            _cve_cache = CveLookupCache(
+                db_path,
+                ttl_seconds=settings.cve_cache_ttl_hours * 3600,
+                negative_ttl_seconds=settings.cve_cache_negative_ttl_hours * 3600
+            )
+            logging.info(f"🗄️ CVE lookup cache ready: {db_path}")
+        except Exception as e:
+            logging.error(f"CVE lookup cache unavailable, continuing without it: {e}")
+            return None
+    return _cve_cache
@@ -0,0 +1,566 @@
+"""
+Offline CVE index
+Local SQLite index built from NVD CVE JSON feeds (1.1 data feeds or API 2.0 pages)
+and EPSS CSV files, mapping CPE product -> version ranges -> CVEs so service lookups
+run in-process without vulnx, the rate limit or VPN rotation.
+
+Feed import is incremental: files whose size and mtime have not changed since the
+last import are skipped, and a CVE record is only replaced by a newer revision.
+
+    python -m app.scanning.cve_index import /path/to/feeds
+    python -m app.scanning.cve_index stats
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+# Reference tags/URL fragments that mark a public exploit or PoC
+EXPLOIT_REFERENCE_TAGS = {"exploit"}
+EXPLOIT_URL_KEYWORDS = ("exploit-db.com", "packetstormsecurity", "metasploit", "/poc", "exploit")
+
+# Common nmap service/product names -> NVD CPE product names
+PRODUCT_ALIASES = {
+    "ssh": ["openssh"],
+    "apache": ["http_server"],
+    "apache_httpd": ["http_server"],
+    "httpd": ["http_server"],
+    "apache_tomcat": ["tomcat"],
+    "apache_tomcat/coyote_jsp_engine": ["tomcat"],
+    "microsoft_iis_httpd": ["internet_information_services"],
+    "iis": ["internet_information_services"],
+    "isc_bind": ["bind"],
+    "domain": ["bind"],
+    "mysql": ["mysql", "mariadb"],
+    "postgresql": ["postgresql"],
+    "samba_smbd": ["samba"],
+    "netbios-ssn": ["samba"],
+    "postfix_smtpd": ["postfix"],
+    "exim_smtpd": ["exim"],
+    "distccd": ["distcc"],
+    "ftp": ["vsftpd", "proftpd"],
+    "vnc": ["realvnc", "tightvnc"],
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cves (
+    cve_id TEXT PRIMARY KEY,
+    description TEXT,
+    severity TEXT,
+    cvss_score REAL,
+    cvss_vector TEXT,
+    published TEXT,
+    last_modified TEXT,
+    reference_urls TEXT,
+    exploit_urls TEXT,
+    has_exploit INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cpe_matches (
+    cve_id TEXT NOT NULL,
+    vendor TEXT,
+    product TEXT NOT NULL,
+    version TEXT,
+    version_start_including TEXT,
+    version_start_excluding TEXT,
+    version_end_including TEXT,
+    version_end_excluding TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_cpe_matches_product ON cpe_matches (product);
+CREATE INDEX IF NOT EXISTS idx_cpe_matches_cve ON cpe_matches (cve_id);
+CREATE TABLE IF NOT EXISTS epss (
+    cve_id TEXT PRIMARY KEY,
+    score REAL,
+    percentile REAL
+);
+CREATE TABLE IF NOT EXISTS imported_feeds (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    records INTEGER,
+    imported_at REAL
+);
+"""
+
+
+def normalize_product(name: str) -> str:
+    """Normalize a product/service name to NVD's CPE style (lowercase, underscores)."""
+    return re.sub(r"[\s\-]+", "_", (name or "").strip().lower())
+
+
+def clean_version(version: str) -> str:
+    """Reduce an nmap version string ('4.7p1 Debian 8ubuntu1') to its leading version token."""
+    match = re.search(r"\d[\w.\-]*", version or "")
+    return match.group(0).lower() if match else ""
+
+
+def version_key(version: str) -> tuple:
+    """Sortable key for dotted versions with alphanumeric parts ('4.7' < '4.7p1' < '4.10')."""
+    parts = []
+    for token in re.findall(r"\d+|[a-z]+", (version or "").lower()):
+        parts.append((1, int(token), "") if token.isdigit() else (0, 0, token))
+    return tuple(parts)
+
+
+def version_in_range(version: str, row: sqlite3.Row) -> bool:
+    """Check a concrete service version against one CPE match entry."""
+    key = version_key(version)
+    if not key:
+        return False
+
+    exact = row["version"]
+    has_range = any(row[col] for col in (
+        "version_start_including", "version_start_excluding",
+        "version_end_including", "version_end_excluding"
+    ))
+    if exact not in (None, "", "*", "-") and not has_range:
+        return version_key(exact) == key
+    if not has_range:
+        # Wildcard without bounds: every version of the product is affected
+        return exact == "*"
+
+    if row["version_start_including"] and key < version_key(row["version_start_including"]):
+        return False
+    if row["version_start_excluding"] and key <= version_key(row["version_start_excluding"]):
+        return False
+    if row["version_end_including"] and key > version_key(row["version_end_including"]):
+        return False
+    if row["version_end_excluding"] and key >= version_key(row["version_end_excluding"]):
+        return False
+    return True
+
+
+def _parse_cpe(uri: str):
+    """Split a CPE 2.3 URI into (vendor, product, version); the update field is folded into the version."""
+    fields = (uri or "").split(":")
+    if len(fields) < 6:
+        return None
+    vendor, product, version, update = fields[3], fields[4], fields[5], fields[6] if len(fields) > 6 else "*"
+    if update not in ("*", "-", "") and version not in ("*", "-", ""):
+        version = f"{version}{update}"
+    return vendor.lower(), product.lower(), version.lower()
+
+
+def _collect_cpe_matches(nodes: list, matches: list):
+    """Walk (possibly nested) configuration nodes and collect vulnerable CPE matches."""
+    for node in nodes or []:
+        for match in node.get("cpe_match", []) + node.get("cpeMatch", []):
+            if not match.get("vulnerable", True):
+                continue
+            parsed = _parse_cpe(match.get("cpe23Uri") or match.get("criteria"))
+            if not parsed:
+                continue
+            vendor, product, version = parsed
+            matches.append((
+                vendor, product, version,
+                match.get("versionStartIncluding"), match.get("versionStartExcluding"),
+                match.get("versionEndIncluding"), match.get("versionEndExcluding")
+            ))
+        _collect_cpe_matches(node.get("children", []), matches)
+
+
+def _split_references(references: list):
+    reference_urls, exploit_urls = [], []
+    for ref in references:
+        url = ref.get("url")
+        if not url:
+            continue
+        tags = {t.lower() for t in ref.get("tags", [])}
+        if tags & EXPLOIT_REFERENCE_TAGS or any(k in url.lower() for k in EXPLOIT_URL_KEYWORDS):
+            exploit_urls.append(url)
+        else:
+            reference_urls.append(url)
+    return reference_urls, exploit_urls
+
+
+def _english_description(descriptions: list) -> str:
+    for desc in descriptions:
+        if desc.get("lang", "en") == "en":
+            return desc.get("value", "")
+    return descriptions[0].get("value", "") if descriptions else ""
+
+
+def parse_nvd_11_item(item: dict) -> Optional[dict]:
+    """Convert a CVE_Items entry from an NVD 1.1 JSON data feed into an index record."""
+    cve = item.get("cve", {})
+    cve_id = cve.get("CVE_data_meta", {}).get("ID")
+    if not cve_id:
+        return None
+
+    impact = item.get("impact", {})
+    v3 = impact.get("baseMetricV3", {}).get("cvssV3", {})
+    v2 = impact.get("baseMetricV2", {})
+    reference_urls, exploit_urls = _split_references(cve.get("references", {}).get("reference_data", []))
+    matches = []
+    _collect_cpe_matches(item.get("configurations", {}).get("nodes", []), matches)
+
+    return {
+        "cve_id": cve_id,
+        "description": _english_description(cve.get("description", {}).get("description_data", [])),
+        "severity": v3.get("baseSeverity") or v2.get("severity"),
+        "cvss_score": v3.get("baseScore", v2.get("cvssV2", {}).get("baseScore")),
+        "cvss_vector": v3.get("vectorString") or v2.get("cvssV2", {}).get("vectorString"),
+        "published": item.get("publishedDate"),
+        "last_modified": item.get("lastModifiedDate"),
+        "reference_urls": reference_urls,
+        "exploit_urls": exploit_urls,
+        "matches": matches
+    }
+
+
+def parse_nvd_20_item(item: dict) -> Optional[dict]:
+    """Convert a vulnerabilities entry from an NVD API 2.0 response into an index record."""
+    cve = item.get("cve", {})
+    cve_id = cve.get("id")
+    if not cve_id:
+        return None
+
+    metrics = cve.get("metrics", {})
+    metric = None
+    for key in ("cvssMetricV31", "cvssMetricV30", "cvssMetricV2"):
+        if metrics.get(key):
+            metric = metrics[key][0]
+            break
+    cvss_data = (metric or {}).get("cvssData", {})
+    reference_urls, exploit_urls = _split_references(cve.get("references", []))
+    matches = []
+    for config in cve.get("configurations", []):
+        _collect_cpe_matches(config.get("nodes", []), matches)
+
+    return {
+        "cve_id": cve_id,
+        "description": _english_description(cve.get("descriptions", [])),
+        "severity": cvss_data.get("baseSeverity") or (metric or {}).get("baseSeverity"),
+        "cvss_score": cvss_data.get("baseScore"),
+        "cvss_vector": cvss_data.get("vectorString"),
+        "published": cve.get("published"),
+        "last_modified": cve.get("lastModified"),
+        "reference_urls": reference_urls,
+        "exploit_urls": exploit_urls,
+        "matches": matches
+    }
+
+
+def _open_feed(path: str):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+class CveIndex:
+    """SQLite-backed CVE index queried in-process by the scanners."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    # --- Import ---
+
+    def import_path(self, path: str, force: bool = False) -> Dict[str, int]:
+        """Import every feed file under a directory (or a single file), skipping unchanged files."""
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+                if name.endswith((".json", ".json.gz", ".csv", ".csv.gz"))
+            )
+        else:
+            files = [path]
+
+        summary = {"files_imported": 0, "files_skipped": 0, "records": 0}
+        for feed_file in files:
+            imported = self.import_file(feed_file, force=force)
+            if imported is None:
+                summary["files_skipped"] += 1
+            else:
+                summary["files_imported"] += 1
+                summary["records"] += imported
+        return summary
+
+    def import_file(self, path: str, force: bool = False) -> Optional[int]:
+        """Import one feed file; returns the record count, or None if it was unchanged."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime FROM imported_feeds WHERE path = ?", (path,)
+            ).fetchone()
+        if row and not force and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+            logging.info(f"⏭️ CVE feed unchanged, skipping: {path}")
+            return None
+
+        started = time.time()
+        if path.endswith((".csv", ".csv.gz")):
+            records = self._import_epss(path)
+        else:
+            records = self._import_nvd(path)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imported_feeds (path, size, mtime, records, imported_at) VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime, records, time.time())
+            )
+            self._conn.commit()
+        logging.info(f"📥 Imported {records} records from {path} in {time.time() - started:.2f}s")
+        return records
+
+    def _import_nvd(self, path: str) -> int:
+        with _open_feed(path) as f:
+            feed = json.load(f)
+
+        if "CVE_Items" in feed:
+            records = (parse_nvd_11_item(item) for item in feed["CVE_Items"])
+        elif "vulnerabilities" in feed:
+            records = (parse_nvd_20_item(item) for item in feed["vulnerabilities"])
+        else:
+            logging.warning(f"Unrecognized CVE feed format: {path}")
+            return 0
+
+        count = 0
+        with self._lock:
+            for record in records:
+                if record and self._upsert_cve(record):
+                    count += 1
+            self._conn.commit()
+        return count
+
+    def _upsert_cve(self, record: dict) -> bool:
+        """Insert or update one CVE; older revisions never overwrite newer ones. Caller holds the lock."""
+        existing = self._conn.execute(
+            "SELECT last_modified FROM cves WHERE cve_id = ?", (record["cve_id"],)
+        ).fetchone()
+        if existing and existing["last_modified"] and record["last_modified"] \
+                and record["last_modified"] < existing["last_modified"]:
+            return False
+
+        self._conn.execute(
+            """INSERT OR REPLACE INTO cves
+               (cve_id, description, severity, cvss_score, cvss_vector, published, last_modified,
+                reference_urls, exploit_urls, has_exploit)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                record["cve_id"], record["description"],
+                (record["severity"] or "").upper() or None, record["cvss_score"], record["cvss_vector"],
+                record["published"], record["last_modified"],
+                json.dumps(record["reference_urls"]), json.dumps(record["exploit_urls"]),
+                1 if record["exploit_urls"] else 0
+            )
+        )
+        self._conn.execute("DELETE FROM cpe_matches WHERE cve_id = ?", (record["cve_id"],))
+        self._conn.executemany(
+            """INSERT INTO cpe_matches
+               (cve_id, vendor, product, version, version_start_including, version_start_excluding,
+                version_end_including, version_end_excluding)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            [(record["cve_id"], *match) for match in record["matches"]]
+        )
+        return True
+
+    def _import_epss(self, path: str) -> int:
+        rows = []
+        with _open_feed(path) as f:
+            # EPSS files start with a "#model_version:...,score_date:..." comment line
+            lines = (line for line in f if not line.startswith("#"))
+            for row in csv.DictReader(lines):
+                cve_id = row.get("cve")
+                if not cve_id:
+                    continue
+                try:
+                    rows.append((cve_id, float(row.get("epss") or 0), float(row.get("percentile") or 0)))
+                except ValueError:
+                    continue
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO epss (cve_id, score, percentile) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    # --- Lookup ---
+
+    def cve_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cves").fetchone()[0]
+
+    @staticmethod
+    def product_candidates(svc: dict) -> List[str]:
+        """CPE product names a service may be indexed under (nmap CPE, product, then service name)."""
+        candidates = []
+        for cpe in [svc.get("cpe")] if isinstance(svc.get("cpe"), str) else (svc.get("cpe") or []):
+            # nmap reports CPE 2.2 URIs: cpe:/a:openbsd:openssh:4.7p1
+            fields = cpe.replace("cpe:/", "cpe:2.3:").split(":")
+            if len(fields) > 4 and fields[4]:
+                candidates.append(fields[4].lower())
+        for name in (svc.get("product"), svc.get("service")):
+            product = normalize_product(name)
+            if product:
+                candidates.append(product)
+                candidates.extend(PRODUCT_ALIASES.get(product, []))
+        return list(dict.fromkeys(candidates))
+
+    def lookup_services(self, services: List[dict], limit: int = 1, use_version: bool = True) -> List[List[dict]]:
+        """
+        Resolve a whole service list in one batched query.
+
+        Returns one list of vulnx-shaped vulnerability dicts per input service (most
+        severe first: exploit available, then CVSS, then EPSS). With use_version=False,
+        or when a service has no usable version, any CVE for the product matches.
+        """
+        candidates_per_service = [self.product_candidates(svc) for svc in services]
+        all_products = sorted({p for candidates in candidates_per_service for p in candidates})
+        if not all_products:
+            return [[] for _ in services]
+
+        placeholders = ",".join("?" * len(all_products))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT m.*, c.description, c.severity, c.cvss_score, c.cvss_vector, c.published,
+                           c.reference_urls, c.exploit_urls, c.has_exploit,
+                           e.score AS epss_score, e.percentile AS epss_percentile
+                    FROM cpe_matches m
+                    JOIN cves c ON c.cve_id = m.cve_id
+                    LEFT JOIN epss e ON e.cve_id = m.cve_id
+                    WHERE m.product IN ({placeholders})""",
+                all_products
+            ).fetchall()
+
+        rows_by_product: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            rows_by_product.setdefault(row["product"], []).append(row)
+
+        results = []
+        for svc, candidates in zip(services, candidates_per_service):
+            version = clean_version(svc.get("version") or "") if use_version else ""
+            matched: Dict[str, sqlite3.Row] = {}
+            for product in candidates:
+                for row in rows_by_product.get(product, []):
+                    if version and not version_in_range(version, row):
+                        continue
+                    matched.setdefault(row["cve_id"], row)
+                if matched:
+                    # Stop at the most specific candidate that produced matches
+                    break
+
+            ranked = sorted(
+                matched.values(),
+                key=lambda r: (r["has_exploit"], r["cvss_score"] or 0, r["epss_score"] or 0),
+                reverse=True
+            )
+            results.append([self._to_vuln(row) for row in ranked[:limit]])
+        return results
+
+    @staticmethod
+    def _to_vuln(row: sqlite3.Row) -> dict:
+        """Shape an index row like a vulnx search result so it can become a CVE record."""
+        age_in_days = None
+        if row["published"]:
+            try:
+                published = datetime.fromisoformat(row["published"].replace("Z", "+00:00"))
+                if published.tzinfo is None:
+                    published = published.replace(tzinfo=timezone.utc)
+                age_in_days = (datetime.now(timezone.utc) - published).days
+            except ValueError:
+                pass
+
+        description = row["description"] or ""
+        return {
+            "cve_id": row["cve_id"],
+            "name": f"{row['product']} - {description.split('. ')[0][:120]}" if description else row["product"],
+            "description": description,
+            "severity": (row["severity"] or "").lower() or None,
+            "cvss_score": row["cvss_score"],
+            "cvss_vector": row["cvss_vector"],
+            "epss_score": row["epss_score"],
+            "epss_percentile": row["epss_percentile"],
+            "age_in_days": age_in_days,
+            "published": row["published"],
+            "is_exploit_available": bool(row["has_exploit"]),
+            "references": json.loads(row["reference_urls"] or "[]"),
+            "exploits": json.loads(row["exploit_urls"] or "[]"),
+            "source": "offline_index"
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cves": self._conn.execute("SELECT COUNT(*) FROM cves").fetchone()[0],
+                "cpe_matches": self._conn.execute("SELECT COUNT(*) FROM cpe_matches").fetchone()[0],
+                "epss_scores": self._conn.execute("SELECT COUNT(*) FROM epss").fetchone()[0],
+                "feeds": self._conn.execute("SELECT COUNT(*) FROM imported_feeds").fetchone()[0]
+            }
+
+
+def get_cve_index_path() -> str:
+    return settings.cve_index_path or os.path.join(settings.results_dir, "cve_index.sqlite3")
+
+
+# Global index instance
+_cve_index = None
+
+
+def get_cve_index() -> Optional[CveIndex]:
+    """
+    Get the offline CVE index if it should answer lookups.
+
+    cve_lookup_engine "offline" always uses it; "auto" uses it only when an index file
+    with data exists; "vulnx" never does.
+    """
+    global _cve_index
+    engine = settings.cve_lookup_engine.lower()
+    if engine == "vulnx":
+        return None
+
+    if _cve_index is None:
+        db_path = get_cve_index_path()
+        if engine == "auto" and not os.path.exists(db_path):
+            return None
+        try:
+            _cve_index = CveIndex(db_path)
+        except Exception as e:
+            logging.error(f"Offline CVE index unavailable: {e}")
+            return None
+
+    if engine == "auto" and _cve_index.cve_count() == 0:
+        return None
+    return _cve_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the offline CVE index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import NVD JSON feeds and EPSS CSV files")
+    import_parser.add_argument("paths", nargs="*", help="Feed files or directories (default: settings.cve_feeds_dir)")
+    import_parser.add_argument("--force", action="store_true", help="Re-import files even if unchanged")
+    subparsers.add_parser("stats", help="Show index statistics")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    index = CveIndex(get_cve_index_path())
+    if args.command == "import":
+        for path in args.paths or [settings.cve_feeds_dir]:
+            print(json.dumps({"path": path, **index.import_path(path, force=args.force)}))
+    print(json.dumps(index.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Structured CVE records
+One record per CVE found for a service, carried from the lookup through the report
+node to the PDF generator and the CVE store, and persisted as JSON Lines next to the
+scan JSON. The human-readable text blocks are rendered from the records on demand.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional, TypedDict, Union
+
+# How the CVE was found for the service
+LOOKUP_VERSION = "version"
+LOOKUP_SERVICE_NAME = "service_name"
+LOOKUP_FALLBACK = "fallback"
+
+LOOKUP_LABELS = {
+    LOOKUP_VERSION: "(Version-Based)",
+    LOOKUP_SERVICE_NAME: "(Service-Name Only)",
+    LOOKUP_FALLBACK: "(Service-Name Fallback)"
+}
+
+BLOCK_SEPARATOR = "----------------------------------------"
+
+
+class CveRecord(TypedDict, total=False):
+    port: Union[int, str]
+    service: str
+    version: Optional[str]
+    lookup: str
+    cve_id: Optional[str]
+    name: Optional[str]
+    description: Optional[str]
+    impact: Optional[str]
+    severity: Optional[str]
+    cvss_score: Optional[float]
+    epss_score: Optional[float]
+    age_in_days: Optional[int]
+    remediation: Optional[str]
+    exploit_links: List[str]
+    exploit_available: bool
+    source: str
+
+
+def extract_all_links(vuln: Dict) -> List[str]:
+    """Extract all relevant links from vulnerability data."""
+    links, citations = [], vuln.get("citations", [])
+    links.extend(vuln.get("references", []) or []); links.extend(vuln.get("exploits", []) or [])
+    keywords = ["exploit", "metasploit", "db", "poc"]
+    matching = [c.get("url") for c in citations if c.get("url") and any(k in c.get("url").lower() for k in keywords)]
+    if matching: links.extend(matching)
+    else: links.extend([c.get("url") for c in citations if c.get("url")][:2])
+    return list(sorted({link for link in links if link}))
+
+
+def lookup_strategy(svc: Dict, is_fallback: bool) -> str:
+    if is_fallback:
+        return LOOKUP_FALLBACK
+    if svc.get("version") and svc["version"] != "None":
+        return LOOKUP_VERSION
+    return LOOKUP_SERVICE_NAME
+
+
+def make_record(svc: Dict, vuln: Dict, is_fallback: bool) -> CveRecord:
+    """Build a record from a selected service and a vulnx-shaped search result."""
+    links = extract_all_links(vuln)
+    return {
+        "port": svc["port"],
+        "service": svc["service"],
+        "version": svc.get("version"),
+        "lookup": lookup_strategy(svc, is_fallback),
+        "cve_id": vuln.get("cve_id"),
+        "name": vuln.get("name"),
+        "description": vuln.get("description"),
+        "impact": vuln.get("impact"),
+        "severity": vuln.get("severity"),
+        "cvss_score": vuln.get("cvss_score"),
+        "epss_score": vuln.get("epss_score"),
+        "age_in_days": vuln.get("age_in_days"),
+        "remediation": vuln.get("remediation"),
+        "exploit_links": links,
+        "exploit_available": bool(links),
+        "source": vuln.get("source", "vulnx")
+    }
+
+
+def _field(value, default: str = "Not Available") -> str:
+    return default if value is None or value == "" else str(value)
+
+
+def render_text(record: CveRecord) -> str:
+    """Render one record as the CVE text block used in the .txt reports."""
+    output = (
+        f"[Port: {record.get('port')} | Service: {record.get('service')} | Version: {record.get('version')} "
+        f"{LOOKUP_LABELS.get(record.get('lookup'), '')}]\n"
+        f"CVE ID: {_field(record.get('cve_id'))}\n"
+        f"Name: {_field(record.get('name'))}\n"
+        f"Description: {_field(record.get('description'))}\n"
+        f"Impact: {_field(record.get('impact'))}\n"
+        f"Severity: {_field(record.get('severity'))}\n"
+        f"CVSS Score: {_field(record.get('cvss_score'))}\n"
+        f"EPSS Score: {_field(record.get('epss_score'))}\n"
+        f"Age in Days: {_field(record.get('age_in_days'))}\n"
+        f"Remediation: {_field(record.get('remediation'))}\n"
+        f"Exploit Available: {'Yes' if record.get('exploit_available') else 'No'}\n"
+        f"Exploit/PoC Links:\n"
+    )
+    links = record.get("exploit_links") or []
+    if links:
+        for link in links:
+            output += f"- {link}\n"
+    else:
+        output += "No specific exploit links found.\n"
+    output += BLOCK_SEPARATOR + "\n\n"
+    return output
+
+
+def render_report_text(scan_results: Dict, records: List[CveRecord]) -> str:
+    """
+    Render the full text report (summary, services, selected services and CVE details)
+    from the scan_results_json document and the scan's CVE records.
+    """
+    lines = ["NETWORK SECURITY SCAN REPORT", "=" * 80, ""]
+
+    summary = scan_results.get("summary")
+    if summary:
+        lines.append("SCAN SUMMARY:")
+        lines.append(f"Target: {summary.get('target', 'N/A')}")
+        lines.append(f"User ID: {summary.get('user_id', 'N/A')}")
+        lines.append(f"Scan Type: {summary.get('scan_type', 'N/A')}")
+        lines.append(f"Scan Duration: {summary.get('scan_duration', 'N/A')}s")
+        lines.append(f"Timestamp: {summary.get('timestamp', 'N/A')}")
+        lines.append(f"Ports Scanned: {summary.get('ports_scanned', 'N/A')}")
+        lines.append(f"Open Ports: {summary.get('open_ports', 'N/A')}")
+        lines.append(f"Critical Ports: {summary.get('critical_ports', 'N/A')}")
+        lines.append(f"CVEs Found: {summary.get('cves_found', 'N/A')}")
+        lines.append(f"Risk Score: {summary.get('risk_score', 'N/A')}/10")
+        lines.append(f"Risk Level: {summary.get('risk_level', 'N/A')}")
+        lines.append("")
+
+    services = [s for s in scan_results.get("services", []) if isinstance(s, dict)]
+    if services:
+        lines.append("DETECTED SERVICES:")
+        for service in services:
+            lines.append(f"  Port {service.get('port', 'N/A')}/{service.get('protocol', 'tcp')}: "
+                         f"{service.get('service', 'N/A')} {service.get('version', 'N/A')}")
+        lines.append("")
+
+    selected = [s for s in scan_results.get("gpt_selected_services", []) if isinstance(s, dict)]
+    if selected:
+        lines.append("SELECTED SERVICES FOR CVE LOOKUP:")
+        for service in selected:
+            lines.append(f"  Port {service.get('port', 'N/A')}: {service.get('service', 'N/A')} {service.get('version', 'N/A')}")
+        lines.append("")
+
+    lines.append("CVE VULNERABILITY DETAILS")
+    lines.append(f"Total vulnerabilities found: {len(records)}")
+    lines.append("=" * 80)
+    lines.append("")
+    return "\n".join(lines) + "\n" + "".join(render_text(record) for record in records)
+
+
+def write_jsonl(path: str, records: Iterable[CveRecord]):
+    """Write records as JSON Lines (one compact object per line)."""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+
+def read_jsonl(path: str) -> List[CveRecord]:
+    """Read the records written by write_jsonl; blank and corrupt lines are skipped."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def is_records_file(path: Optional[str]) -> bool:
+    return bool(path) and path.endswith(".jsonl") and os.path.exists(path)
+
+
+def to_report_vulnerability(record: CveRecord) -> Dict:
+    """Entry for the "vulnerabilities" list of scan_results_json."""
+    return {
+        "port": str(record.get("port")),
+        "service": record.get("service"),
+        "cve_id": record.get("cve_id"),
+        "description": _field(record.get("description")),
+        "impact": _field(record.get("impact")),
+        "severity": _field(record.get("severity")),
+        "cvss_score": _field(record.get("cvss_score"))
+    }
+
+
+def to_iso_details(record: CveRecord) -> Dict:
+    """Detail dict in the shape the ISO report generator used to parse out of the .txt file."""
+    return {
+        "cve_id": record.get("cve_id"),
+        "name": _field(record.get("name")),
+        "description": _field(record.get("description")),
+        "impact": _field(record.get("impact")),
+        "severity": _field(record.get("severity")),
+        "cvss_score": _field(record.get("cvss_score")),
+        "epss_score": _field(record.get("epss_score")),
+        "age_in_days": _field(record.get("age_in_days")),
+        "remediation": _field(record.get("remediation")),
+        "exploit_available": bool(record.get("exploit_available")),
+        "exploit_links": list(record.get("exploit_links") or []),
+        "port": _field(record.get("port"), "N/A"),
+        "service": _field(record.get("service"), "N/A"),
+        "version": _field(record.get("version"), "None")
+    }
+
+
+def to_cve_store_entry(record: CveRecord) -> Dict:
+    """Entry for CVEService.store_cves_from_scan."""
+    try:
+        cvss_score = float(record.get("cvss_score"))
+    except (TypeError, ValueError):
+        cvss_score = None
+    return {
+        "cve_id": record.get("cve_id"),
+        "severity": (record.get("severity") or "medium").lower(),
+        "cvss_score": cvss_score,
+        "description": record.get("description") or "Vulnerability found during scan",
+        "exploitable": bool(record.get("exploit_available")),
+        "privilege_escalation": False,
+        "port": str(record.get("port")),
+        "service": record.get("service")
+    }
@@ -0,0 +1,332 @@
+"""
+CVE query scheduler
+Process-wide scheduler for online CVE lookups. Queries from every running scan share
+one priority queue (primary lookups before service-name fallbacks) and one token
+bucket holding the API rate-limit budget, so worker threads wait for tokens instead
+of contending on a global lock. Each query remembers which scans are waiting for it,
+so cancelling a scan drops the queries only it needed and kills their vulnx process.
+"""
+
+import itertools
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+# Queue priorities (lower runs first)
+PRIORITY_PRIMARY = 0
+PRIORITY_FALLBACK = 1
+
+# Number of recent queue wait times kept for the wait-time metrics
+WAIT_SAMPLE_SIZE = 500
+
+
+class TokenBucket:
+    """
+    Rate-limit budget of `capacity` requests.
+
+    Tokens trickle back over refill_period seconds. When the bucket is empty and an
+    on_empty callback is set (e.g. a VPN rotation to a fresh IP), the first waiting
+    thread runs it and the bucket is refilled in full; the others wait for it.
+    """
+
+    def __init__(self, capacity: int, refill_period: float,
+                 on_empty: Optional[Callable[[], bool]] = None):
+        self.capacity = capacity
+        self.refill_period = refill_period
+        self.on_empty = on_empty
+        self.tokens = float(capacity)
+        self.refills = 0
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._refilling = False
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_period > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / self.refill_period)
+        self._updated = now
+
+    def acquire(self) -> bool:
+        """Take one token, blocking until one is available. False if the refill callback failed."""
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+
+                if self.on_empty is None:
+                    self._cond.wait(timeout=(1 - self.tokens) * self.refill_period / self.capacity)
+                    continue
+
+                if self._refilling:
+                    self._cond.wait()
+                    continue
+
+                self._refilling = True
+                self._cond.release()
+                try:
+                    success = self.on_empty()
+                finally:
+                    self._cond.acquire()
+                    self._refilling = False
+                    # Like the old request counter, the budget restarts even if the refill failed
+                    self.tokens = float(self.capacity)
+                    self._updated = time.monotonic()
+                    self.refills += 1
+                    self._cond.notify_all()
+
+                if not success:
+                    return False
+
+    def drain(self):
+        """Empty the bucket (the API reported a rate limit before we expected it)."""
+        with self._cond:
+            self.tokens = 0.0
+            self._updated = time.monotonic()
+
+
+class _Job:
+    def __init__(self, query: str, priority: int):
+        self.query = query
+        self.priority = priority
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.retries = 0
+        # Scans waiting for this query, and the runner's subprocess while it executes
+        self.owners = set()
+        self.process: Optional[subprocess.Popen] = None
+        self.abandoned = False
+
+
+# Job executed by the current worker thread, so the runner can attach its subprocess
+_worker_state = threading.local()
+
+
+def attach_process(process: subprocess.Popen):
+    """Called by the runner: lets cancel_owner kill this query's subprocess if no scan needs it anymore."""
+    job = getattr(_worker_state, "job", None)
+    if job is None:
+        return
+    job.process = process
+    if job.abandoned:
+        _kill_process_group(process)
+
+
+def _kill_process_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class CveQueryScheduler:
+    """
+    Shared priority queue of CVE queries executed by a fixed pool of worker threads.
+
+    Identical queries submitted while one is already queued or running share its
+    result instead of spending another token.
+    """
+
+    def __init__(self, runner: Callable[[str], object], bucket: TokenBucket, workers: int,
+                 is_rate_limited: Callable[[object], bool] = lambda result: False,
+                 rate_limit_retries: int = 1):
+        self.runner = runner
+        self.bucket = bucket
+        self.workers = workers
+        self.is_rate_limited = is_rate_limited
+        self.rate_limit_retries = rate_limit_retries
+
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Job] = {}
+        self._threads = []
+        self._stopped = False
+
+        # Metrics
+        self._wait_times = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.submitted = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.cancelled = 0
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"cve-query-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, query: str, priority: int = PRIORITY_PRIMARY, owner: Optional[str] = None) -> Future:
+        """Queue a query for the owner scan; returns a Future resolving to the runner's result."""
+        with self._lock:
+            self.submitted += 1
+            job = self._pending.get(query)
+            # An abandoned query is being killed; a new request needs a fresh run
+            if job is not None and not job.abandoned:
+                self.coalesced += 1
+                if owner is not None:
+                    job.owners.add(owner)
+                if priority < job.priority:
+                    # A primary request joined a queued fallback; let it jump ahead
+                    job.priority = priority
+                    self._queue.put((priority, next(self._seq), job))
+                return job.future
+
+            job = _Job(query, priority)
+            if owner is not None:
+                job.owners.add(owner)
+            self._pending[query] = job
+            self._ensure_workers()
+        self._queue.put((priority, next(self._seq), job))
+        return job.future
+
+    def _worker(self):
+        while not self._stopped:
+            priority, _, job = self._queue.get()
+            if job is None:
+                break
+            # A job re-queued at a higher priority is already running or done
+            if job.future.done() or job.future.running() or priority != job.priority:
+                continue
+            if not job.future.set_running_or_notify_cancel():
+                self._finish(job)
+                continue
+
+            self._wait_times.append(time.monotonic() - job.enqueued_at)
+            with self._lock:
+                self.in_flight += 1
+            _worker_state.job = job
+            try:
+                result = self._execute(job)
+                job.future.set_result(result)
+            except Exception as e:
+                logging.error(f"CVE query '{job.query}' failed: {e}")
+                job.future.set_exception(e)
+            finally:
+                _worker_state.job = None
+                job.process = None
+                with self._lock:
+                    self.in_flight -= 1
+                self._finish(job)
+
+    def _execute(self, job: _Job):
+        while True:
+            # Nobody waits for an abandoned query; don't spend a token on it
+            if job.abandoned or not self.bucket.acquire():
+                return None
+            with self._lock:
+                self.executed += 1
+            result = self.runner(job.query)
+            if not self.is_rate_limited(result) or job.retries >= self.rate_limit_retries:
+                return result
+            # The budget was used up elsewhere; drain it so the next acquire rotates, then retry
+            with self._lock:
+                self.rate_limited += 1
+            job.retries += 1
+            self.bucket.drain()
+
+    def _finish(self, job: _Job):
+        with self._lock:
+            if self._pending.get(job.query) is job:
+                del self._pending[job.query]
+
+    def cancel_owner(self, owner: str) -> Dict[str, int]:
+        """
+        Withdraw a cancelled scan from its queries. Queued queries no other scan waits
+        for are dropped; running ones have their subprocess killed. Queries shared with
+        other scans keep running.
+        """
+        dropped, killed, shared = 0, 0, 0
+        with self._lock:
+            for query, job in list(self._pending.items()):
+                if owner not in job.owners:
+                    continue
+                job.owners.discard(owner)
+                if job.owners:
+                    shared += 1
+                    continue
+                job.abandoned = True
+                if job.future.cancel():
+                    # Still queued: the worker skips it, so forget it here
+                    del self._pending[query]
+                    dropped += 1
+                else:
+                    if job.process is not None and job.process.poll() is None:
+                        _kill_process_group(job.process)
+                    killed += 1
+            self.cancelled += dropped + killed
+        if dropped or killed:
+            logging.info(f"🛑 CVE queries of scan {owner[:8]}: {dropped} queued dropped, {killed} running stopped, {shared} shared kept")
+        return {"queries_dropped": dropped, "queries_stopped": killed, "queries_shared": shared}
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._pending) - self.in_flight
+
+    def stats(self) -> dict:
+        """Queue depth, wait-time and throughput metrics."""
+        waits = sorted(self._wait_times)
+        with self._lock:
+            depth = len(self._pending) - self.in_flight
+            stats = {
+                "queue_depth": depth,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "executed": self.executed,
+                "rate_limited": self.rate_limited,
+                "cancelled": self.cancelled,
+                "tokens_available": round(self.bucket.tokens, 2),
+                "bucket_refills": self.bucket.refills,
+                "workers": self.workers
+            }
+        stats["wait_seconds"] = {
+            "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "p95": round(waits[int(len(waits) * 0.95) - 1 if len(waits) > 1 else 0], 3) if waits else 0.0,
+            "max": round(waits[-1], 3) if waits else 0.0
+        }
+        return stats
+
+    def shutdown(self):
+        """Stop the worker threads and cancel queued queries."""
+        self._stopped = True
+        with self._lock:
+            jobs = list(self._pending.values())
+        for job in jobs:
+            job.future.cancel()
+        for _ in self._threads:
+            self._queue.put((-1, next(self._seq), None))
+
+
+# Global scheduler instance
+_scheduler: Optional[CveQueryScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def init_cve_scheduler(factory: Callable[[], CveQueryScheduler]) -> CveQueryScheduler:
+    """Create the process-wide scheduler on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = factory()
+    return _scheduler
+
+
+def get_cve_scheduler() -> Optional[CveQueryScheduler]:
+    """Get the process-wide scheduler if one has been started."""
+    return _scheduler
@@ -0,0 +1,150 @@
+"""
+Network discovery store
+SQLite-backed record of the latest sweep of each network range: every device seen
+(with first/last seen times, vanished devices kept for a retention period), the
+delta of the last sweep and the GPT analysis with the device set it describes.
+Discovery requests within the freshness window are answered from it, and GPT
+analysis only re-runs when the device set changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+# Device fields whose change is reported in a delta (and changes the device set)
+TRACKED_FIELDS = ("mac", "vendor", "hostname")
+
+
+class DiscoveryStore:
+    """Disk-backed store of the latest discovery per network range."""
+
+    def __init__(self, db_path: str, retention_seconds: int):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self._lock = Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS network_discoveries (
+                       network_range TEXT PRIMARY KEY,
+                       swept_at REAL NOT NULL,
+                       record TEXT NOT NULL
+                   )"""
+            )
+            self._conn.commit()
+
+    def get(self, network_range: str) -> Optional[Dict]:
+        """The stored discovery of a range, with its age in seconds, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT swept_at, record FROM network_discoveries WHERE network_range = ?", (network_range,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[1])
+        record["age_seconds"] = round(time.time() - row[0], 1)
+        return record
+
+    def put(self, record: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO network_discoveries (network_range, swept_at, record) VALUES (?, ?, ?)",
+                (record["network_range"], record["swept_at"], json.dumps(record, default=str))
+            )
+            self._conn.commit()
+
+
+def device_set_hash(devices: List[Dict]) -> str:
+    """Hash of the online devices and their tracked fields (changes when the device set does)."""
+    identity = sorted(
+        (device["ip"], *(device.get(field) or "" for field in TRACKED_FIELDS))
+        for device in devices if device.get("status") == "online"
+    )
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def merge_sweep(previous: Optional[Dict], raw_data: Dict, retention_seconds: int) -> Tuple[List[Dict], Dict]:
+    """
+    Merge a sweep's devices into the stored device list.
+
+    Returns (devices, delta): every known device with first_seen/last_seen (devices
+    missing from this sweep are marked offline and dropped after the retention
+    period), and the devices that appeared, vanished or changed since the last sweep.
+    A value missing from this sweep (a MAC or hostname not resolved this time) keeps
+    the stored one rather than counting as a change.
+    """
+    seen_at = raw_data["timestamp"]
+    cutoff = datetime.fromtimestamp(time.time() - retention_seconds).isoformat()
+    known = {device["ip"]: device for device in (previous or {}).get("devices", [])}
+
+    devices, new_devices, changed_devices = {}, [], []
+    for device in raw_data.get("devices", []):
+        before = known.get(device["ip"])
+        merged = {**device, **(before or {}), **{key: value for key, value in device.items() if value not in (None, "")}}
+        merged["status"] = "online"
+        merged["first_seen"] = (before or {}).get("first_seen", seen_at)
+        merged["last_seen"] = seen_at
+        devices[device["ip"]] = merged
+
+        if before is None or before.get("status") != "online":
+            new_devices.append(merged)
+            continue
+        changes = {
+            field: {"before": before.get(field), "after": merged.get(field)}
+            for field in TRACKED_FIELDS
+            if before.get(field) and merged.get(field) != before.get(field)
+        }
+        if changes:
+            changed_devices.append({"ip": device["ip"], "changes": changes})
+
+    vanished_devices = []
+    for ip, before in known.items():
+        if ip in devices or before.get("last_seen", "") < cutoff:
+            continue
+        if before.get("status") == "online":
+            vanished_devices.append(before)
+        devices[ip] = {**before, "status": "offline"}
+
+    delta = {
+        "previous_sweep_at": (previous or {}).get("timestamp"),
+        "new_devices": new_devices,
+        "vanished_devices": [{**device, "status": "offline"} for device in vanished_devices],
+        "changed_devices": changed_devices
+    }
+    return sorted(devices.values(), key=lambda device: _ip_sort_key(device["ip"])), delta
+
+
+def _ip_sort_key(ip: str):
+    try:
+        return tuple(int(part) for part in ip.split("."))
+    except ValueError:
+        return (ip,)
+
+
+# Global store instance
+_discovery_store = None
+
+
+def get_discovery_store() -> Optional[DiscoveryStore]:
+    """Get or create the discovery store (None when disabled or unavailable)."""
+    global _discovery_store
+    if _discovery_store is None and settings.discovery_cache_enabled:
+        db_path = settings.discovery_cache_path or os.path.join(settings.results_dir, "network_discoveries.sqlite3")
+        try:
+            _discovery_store = DiscoveryStore(db_path, retention_seconds=settings.discovery_device_retention_days * 86400)
+            logging.info(f"🗄️ Network discovery store ready: {db_path}")
+        except Exception as e:
+            logging.error(f"Network discovery store unavailable, every discovery will sweep: {e}")
+            return None
+    return _discovery_store
@@ -0,0 +1,180 @@
+"""
+Scan fingerprint store
+SQLite-backed record of the last completed scan of each target (open ports,
+service versions, OS match, CVE records), keyed by user, target and scan type.
+Incremental rescans diff a fast port sweep against it and only fingerprint and
+look up what changed.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+
+def service_key(svc: Dict) -> Tuple[str, str, str]:
+    """Identity of a looked-up service: port, service name and version."""
+    return str(svc.get("port")), (svc.get("service") or "").lower(), svc.get("version") or ""
+
+
+class ScanFingerprintStore:
+    """Disk-backed store of the latest scan fingerprint per (user, target, scan type)."""
+
+    def __init__(self, db_path: str, max_age_seconds: int):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self._lock = Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS scan_fingerprints (
+                       user_id TEXT NOT NULL,
+                       target TEXT NOT NULL,
+                       scan_type TEXT NOT NULL,
+                       fingerprint TEXT NOT NULL,
+                       scanned_at REAL NOT NULL,
+                       PRIMARY KEY (user_id, target, scan_type)
+                   )"""
+            )
+            self._conn.commit()
+
+    def get(self, user_id: str, target: str, scan_type: str) -> Optional[Dict]:
+        """
+        Latest fingerprint, or None when there is none or the last full scan it
+        builds on is older than the max age (incremental rescans carry services,
+        OS match and CVE records forward, so they do not make it fresh).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, scanned_at FROM scan_fingerprints WHERE user_id = ? AND target = ? AND scan_type = ?",
+                (str(user_id), target, scan_type.lower())
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            fingerprint = json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+        if time.time() - fingerprint.get("full_scanned_at", row[1]) > self.max_age_seconds:
+            return None
+        return fingerprint
+
+    def put(self, fingerprint: Dict):
+        """Replace the fingerprint of the fingerprint's user, target and scan type."""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO scan_fingerprints (user_id, target, scan_type, fingerprint, scanned_at) VALUES (?, ?, ?, ?, ?)",
+                    (str(fingerprint["user_id"]), fingerprint["target"], fingerprint["scan_type"].lower(),
+                     json.dumps(fingerprint, separators=(",", ":")), fingerprint["scanned_at"])
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to store scan fingerprint for {fingerprint['target']}: {e}")
+
+
+def build_fingerprint(user_id: str, target: str, scan_type: str, ip: str, services: List[Dict],
+                      os_info: str, os_details: Dict, selected_services: List[Dict], cve_records: List[Dict],
+                      full_scanned_at: Optional[float] = None) -> Dict:
+    """
+    Fingerprint of a completed scan. An incremental rescan passes the
+    full_scanned_at of its baseline, so the age of the reused data is kept.
+    """
+    scanned_at = time.time()
+    return {
+        "user_id": str(user_id),
+        "target": target,
+        "scan_type": scan_type.lower(),
+        "scanned_at": scanned_at,
+        "full_scanned_at": full_scanned_at or scanned_at,
+        "ip": ip,
+        "open_ports": sorted({str(s.get("port")) for s in services if s.get("state", "open") == "open"}, key=_port_number),
+        "services": services,
+        "os": os_info or "",
+        "os_details": os_details or {},
+        "selected_services": [
+            {"port": s.get("port"), "service": s.get("service"), "version": s.get("version")} for s in selected_services
+        ],
+        "cve_records": cve_records
+    }
+
+
+def _port_number(port: str) -> int:
+    try:
+        return int(port)
+    except ValueError:
+        return 0
+
+
+def split_incremental_services(services_list: List[Dict], baseline: Dict) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split the services selected for CVE lookup against the baseline fingerprint.
+
+    Returns (reused_records, to_lookup): CVE records of services looked up
+    unchanged last time, and the services that are new or changed.
+    """
+    known = {service_key(svc) for svc in baseline.get("selected_services", [])}
+    reused_keys, to_lookup = set(), []
+    for svc in services_list:
+        key = service_key(svc)
+        if key in known:
+            reused_keys.add(key)
+        else:
+            to_lookup.append(svc)
+    reused_records = [r for r in baseline.get("cve_records", []) if service_key(r) in reused_keys]
+    return reused_records, to_lookup
+
+
+def compute_delta(previous: Dict, current: Dict) -> Dict:
+    """What changed between two fingerprints of the same target."""
+    previous_services = {str(s.get("port")): s for s in previous.get("services", [])}
+    current_services = {str(s.get("port")): s for s in current.get("services", [])}
+
+    changed_services = []
+    for port, svc in current_services.items():
+        before = previous_services.get(port)
+        if before and (before.get("service"), before.get("version")) != (svc.get("service"), svc.get("version")):
+            changed_services.append({
+                "port": port,
+                "before": {"service": before.get("service"), "version": before.get("version")},
+                "after": {"service": svc.get("service"), "version": svc.get("version")}
+            })
+
+    previous_cves = {(str(r.get("port")), r.get("cve_id")) for r in previous.get("cve_records", []) if r.get("cve_id")}
+    current_cves = {(str(r.get("port")), r.get("cve_id")) for r in current.get("cve_records", []) if r.get("cve_id")}
+
+    return {
+        "previous_scan_at": previous.get("scanned_at"),
+        "new_ports": sorted(set(current.get("open_ports", [])) - set(previous.get("open_ports", [])), key=_port_number),
+        "closed_ports": sorted(set(previous.get("open_ports", [])) - set(current.get("open_ports", [])), key=_port_number),
+        "changed_services": changed_services,
+        "new_cves": [{"port": port, "cve_id": cve_id} for port, cve_id in sorted(current_cves - previous_cves)],
+        "resolved_cves": [{"port": port, "cve_id": cve_id} for port, cve_id in sorted(previous_cves - current_cves)],
+        "os_changed": bool(previous.get("os") and current.get("os") and previous["os"] != current["os"])
+    }
+
+
+# Global store instance
+_fingerprint_store = None
+
+
+def get_fingerprint_store() -> Optional[ScanFingerprintStore]:
+    """Get or create the fingerprint store (None when disabled or unavailable)."""
+    global _fingerprint_store
+    if _fingerprint_store is None and settings.fingerprint_store_enabled:
+        db_path = settings.fingerprint_store_path or os.path.join(settings.results_dir, "scan_fingerprints.sqlite3")
+        try:
+            _fingerprint_store = ScanFingerprintStore(db_path, max_age_seconds=settings.fingerprint_max_age_hours * 3600)
+            logging.info(f"🗄️ Scan fingerprint store ready: {db_path}")
+        except Exception as e:
+            logging.error(f"Scan fingerprint store unavailable, rescans will run in full: {e}")
+            return None
+    return _fingerprint_store
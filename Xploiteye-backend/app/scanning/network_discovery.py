@@ -1,6 +1,8 @@
 """
 NetworkDiscovery Service
 Automated network device discovery with IP and MAC address detection
+Large ranges are split into chunks probed with bounded concurrency; hosts are
+streamed as they are found (discover_hosts) and discover_network collects them.
 """
 
 import subprocess
@@ -8,87 +10,138 @@ import re
 import asyncio
 import json
 import os
-import socket
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import openai
 from dotenv import load_dotenv
 import ipaddress
-import concurrent.futures
+import time
+
+from config.settings import settings
+from app.scanning.discovery_store import device_set_hash, get_discovery_store, merge_sweep
+from app.scanning.nmap_runner import run_nmap_streaming, terminate_process
+from app.scanning.oui_db import lookup_vendor
+from app.services.dns_resolver_service import get_dns_resolver_service
 
 load_dotenv()
 
+# Kernel neighbor table (Linux); ATF_COM marks entries with a resolved hardware address
+ARP_TABLE_PATH = "/proc/net/arp"
+ARP_FLAG_COMPLETE = 0x2
+
+# Sweeps running now, keyed by network range; concurrent requests for a range share one
+_inflight_sweeps: Dict[str, asyncio.Future] = {}
+
+# Per-chunk probe timeout: a base plus an allowance per address in the chunk
+CHUNK_BASE_TIMEOUT = 10
+CHUNK_TIMEOUT_PER_ADDRESS = 0.1
+
+class NetworkRangeError(ValueError):
+    """Raised when a network range is malformed, too wide or outside the allowed address space."""
+
+
+def validate_network_range(network_range: str) -> ipaddress.IPv4Network:
+    """Parse a range to sweep, enforcing settings.discovery_max_prefix and discovery_private_ranges_only."""
+    try:
+        network = ipaddress.IPv4Network(network_range, strict=False)
+    except ValueError as e:
+        raise NetworkRangeError(f"Invalid network range: {e}")
+    if network.prefixlen < settings.discovery_max_prefix:
+        raise NetworkRangeError(
+            f"Network range {network} is wider than /{settings.discovery_max_prefix} "
+            f"({network.num_addresses} addresses)"
+        )
+    if settings.discovery_private_ranges_only and not network.is_private:
+        raise NetworkRangeError(f"Network range {network} is not a private range")
+    return network
+
+
 class NetworkDiscovery:
     def __init__(self):
         self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.max_concurrent = int(os.getenv("MAX_CONCURRENT_SCANS", "100"))  # Increased for speed
         self.timeout = int(os.getenv("DEFAULT_NETWORK_TIMEOUT", "2"))  # Reduced timeout for speed
+        self.chunk_size = int(os.getenv("DISCOVERY_CHUNK_SIZE", "256"))  # Addresses per discovery chunk (power of two)
+        self.chunk_concurrency = int(os.getenv("DISCOVERY_CHUNK_CONCURRENCY", "8"))  # Chunks probed at once
 
     async def discover_network(self, network_range: Optional[str] = None) -> Dict[str, Any]:
         """
         Discover devices on the network using multiple techniques
         """
         try:
-            print("[*] Starting network discovery...")
-
-            # Auto-detect network range if not provided
-            if not network_range:
-                network_range = await self._get_default_network_range()
-                print(f"[*] Auto-detected network range: {network_range}")
-            else:
-                # If user provided just an IP, convert to /24 network
-                if "/" not in network_range:
-                    # Convert single IP to /24 network
-                    ip_parts = network_range.split('.')
-                    if len(ip_parts) == 4:
-                        network_base = '.'.join(ip_parts[:3]) + '.0/24'
-                        network_range = network_base
-                        print(f"[*] Converted to network range: {network_range}")
-
-            raw_data = {
-                "network_range": network_range,
-                "timestamp": datetime.now().isoformat(),
-                "scan_status": "completed",
-                "devices": [],
-                "summary": {
-                    "total_devices": 0,
-                    "online_devices": 0,
-                    "discovery_methods": []
-                }
-            }
-
-            # Run all discovery methods in parallel for speed
-            print("[*] Running parallel network discovery...")
-
-            # Execute all discovery methods concurrently
-            discovery_tasks = [
-                self._fast_arp_discovery(network_range),
-                self._fast_ping_sweep(network_range),
-                self._get_arp_table()
-            ]
+            raw_data = await self.sweep_network(network_range)
+            network_range = raw_data["network_range"]
 
-            results = await asyncio.gather(*discovery_tasks, return_exceptions=True)
-
-            arp_devices = results[0] if not isinstance(results[0], Exception) else []
-            ping_devices = results[1] if not isinstance(results[1], Exception) else []
-            arp_table_devices = results[2] if not isinstance(results[2], Exception) else []
+            # Get GPT analysis
+            gpt_analysis = await self._get_gpt_analysis(raw_data)
 
-            raw_data["summary"]["discovery_methods"] = ["fast_arp", "fast_ping", "arp_table"]
+            return {
+                "raw_data": raw_data,
+                "gpt_analysis": gpt_analysis
+            }
 
-            # Merge all discovered devices
-            all_devices = self._merge_device_data(arp_devices, ping_devices, arp_table_devices)
-            raw_data["devices"] = all_devices
-            raw_data["summary"]["total_devices"] = len(all_devices)
-            raw_data["summary"]["online_devices"] = len([d for d in all_devices if d.get("status") == "online"])
+        except Exception as e:
+            print(f"[!] Error during network discovery: {e}")
+            return {
+                "raw_data": {
+                    "network_range": network_range or "unknown",
+                    "timestamp": datetime.now().isoformat(),
+                    "scan_status": "failed",
+                    "error": str(e)
+                },
+                "gpt_analysis": {
+                    "status": "error",
+                    "message": f"Network discovery failed: {str(e)}"
+                }
+            }
 
-            print(f"[+] Discovered {len(all_devices)} devices")
+    async def discover_network_cached(self, network_range: Optional[str] = None,
+                                      max_age_seconds: Optional[int] = None,
+                                      force_refresh: bool = False,
+                                      delta: bool = False) -> Dict[str, Any]:
+        """
+        Discover devices, answering from the discovery store when the range was swept
+        within max_age_seconds (default settings.discovery_cache_max_age_seconds).
+        A new sweep is merged into the stored devices (first/last seen) and GPT
+        analysis only re-runs when the device set changed. With delta=True the
+        devices list is replaced by the devices that appeared, vanished or changed
+        in the latest sweep.
+        """
+        store = get_discovery_store()
+        if store is None:
+            return await self.discover_network(network_range)
 
-            # Get GPT analysis
-            gpt_analysis = await self._get_gpt_analysis(raw_data)
+        try:
+            network_range = await self.resolve_network_range(network_range)
+            if max_age_seconds is None:
+                max_age_seconds = settings.discovery_cache_max_age_seconds
+
+            record = await asyncio.to_thread(store.get, network_range)
+            cache_hit = record is not None and not force_refresh and record["age_seconds"] < max_age_seconds
+            if not cache_hit:
+                sweep = _inflight_sweeps.get(network_range)
+                if sweep is None:
+                    sweep = asyncio.ensure_future(self._sweep_and_store(store, network_range, record))
+                    _inflight_sweeps[network_range] = sweep
+                    sweep.add_done_callback(lambda _: _inflight_sweeps.pop(network_range, None))
+                record = await asyncio.shield(sweep)
+                record["age_seconds"] = 0
+
+            raw_data = {key: record[key] for key in ("network_range", "timestamp", "scan_status", "devices", "summary")}
+            raw_data["cache"] = {
+                "hit": cache_hit,
+                "age_seconds": record["age_seconds"],
+                "max_age_seconds": max_age_seconds,
+                "sweep_count": record["sweep_count"],
+                "gpt_reused": record.get("gpt_reused", False)
+            }
+            if delta:
+                raw_data.pop("devices")
+                raw_data["delta"] = record["delta"]
 
             return {
                 "raw_data": raw_data,
-                "gpt_analysis": gpt_analysis
+                "gpt_analysis": record["gpt_analysis"]
             }
 
         except Exception as e:
@@ -106,6 +159,189 @@ class NetworkDiscovery:
                 }
             }
 
+    async def _sweep_and_store(self, store, network_range: str, previous: Optional[Dict]) -> Dict[str, Any]:
+        """
+        Sweep a range, merge it into the stored record and save it; GPT runs only for a changed device set
+        """
+        raw_data = await self.sweep_network(network_range)
+        devices, delta = merge_sweep(previous, raw_data, store.retention_seconds)
+        device_hash = device_set_hash(devices)
+
+        summary = dict(raw_data["summary"])
+        summary["online_devices"] = len([d for d in devices if d.get("status") == "online"])
+        summary["offline_devices"] = len(devices) - summary["online_devices"]
+        summary["total_devices"] = len(devices)
+
+        record = {
+            "network_range": network_range,
+            "timestamp": raw_data["timestamp"],
+            "swept_at": time.time(),
+            "scan_status": raw_data["scan_status"],
+            "devices": devices,
+            "summary": summary,
+            "delta": delta,
+            "sweep_count": (previous or {}).get("sweep_count", 0) + 1,
+            "device_hash": device_hash
+        }
+
+        previous_analysis = (previous or {}).get("gpt_analysis") or {}
+        if previous_analysis.get("status") == "success" and previous.get("gpt_device_hash") == device_hash:
+            print(f"[*] Device set of {network_range} unchanged, reusing GPT analysis")
+            record["gpt_analysis"] = previous_analysis
+            record["gpt_device_hash"] = device_hash
+            record["gpt_reused"] = True
+        else:
+            record["gpt_analysis"] = await self._get_gpt_analysis({**raw_data, "devices": devices, "summary": summary})
+            record["gpt_device_hash"] = device_hash
+            record["gpt_reused"] = False
+
+        await asyncio.to_thread(store.put, record)
+        return record
+
+    async def sweep_network(self, network_range: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sweep the network and return the discovery results (raw_data) without GPT analysis
+        """
+        print("[*] Starting network discovery...")
+        network_range = await self.resolve_network_range(network_range)
+
+        raw_data = {
+            "network_range": network_range,
+            "timestamp": datetime.now().isoformat(),
+            "scan_status": "completed",
+            "devices": [],
+            "summary": {
+                "total_devices": 0,
+                "online_devices": 0,
+                "discovery_methods": []
+            }
+        }
+
+        # Chunked discovery: ARP/ping probes per chunk, neighbor table and hostnames alongside
+        print("[*] Running chunked network discovery...")
+        devices = {}
+        async for event in self.discover_hosts(network_range):
+            if event["event"] == "host":
+                devices[event["data"]["ip"]] = event["data"]
+            elif event["event"] == "complete":
+                raw_data["summary"]["chunks"] = event["data"]["chunks_total"]
+                raw_data["summary"]["duration_seconds"] = event["data"]["duration_seconds"]
+
+        raw_data["summary"]["discovery_methods"] = ["fast_arp", "fast_ping", "arp_table"]
+
+        all_devices = sorted(devices.values(), key=lambda device: ipaddress.ip_address(device["ip"]))
+        raw_data["devices"] = all_devices
+        raw_data["summary"]["total_devices"] = len(all_devices)
+        raw_data["summary"]["online_devices"] = len([d for d in all_devices if d.get("status") == "online"])
+
+        print(f"[+] Discovered {len(all_devices)} devices")
+        return raw_data
+
+    async def resolve_network_range(self, network_range: Optional[str] = None) -> str:
+        """
+        Network range to discover: auto-detected when missing, a single IP widened to its /24.
+        Raises NetworkRangeError for ranges validate_network_range rejects.
+        """
+        if not network_range:
+            network_range = await self._get_default_network_range()
+            print(f"[*] Auto-detected network range: {network_range}")
+        elif "/" not in network_range:
+            # Convert single IP to /24 network
+            ip_parts = network_range.split('.')
+            if len(ip_parts) == 4:
+                network_range = '.'.join(ip_parts[:3]) + '.0/24'
+                print(f"[*] Converted to network range: {network_range}")
+        validate_network_range(network_range)
+        return network_range
+
+    async def discover_hosts(self, network_range: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Discover hosts in network_range chunk by chunk and yield events as they are found:
+
+            {"event": "host", "data": device}       a new device, or new details (MAC, hostname) for one
+            {"event": "progress", "data": {...}}    a chunk finished
+            {"event": "complete", "data": {...}}    discovery finished
+
+        The range is split into chunks of self.chunk_size addresses, probed by
+        self.chunk_concurrency workers with a per-chunk timeout that scales with the
+        chunk, so run time grows linearly with the range and a slow chunk only loses
+        its own stragglers. Closing the generator stops every probe.
+        """
+        network = ipaddress.IPv4Network(network_range, strict=False)
+        chunk_prefix = max(network.prefixlen, 32 - (self.chunk_size.bit_length() - 1))
+        chunks = network.subnets(new_prefix=chunk_prefix)
+        chunks_total = 2 ** (chunk_prefix - network.prefixlen)
+        print(f"[*] Discovering {network} in {chunks_total} chunk(s) of /{chunk_prefix}")
+
+        started = datetime.now()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            try:
+                # Workers share one chunk iterator, so each chunk is probed once
+                for chunk in chunks:
+                    try:
+                        await self._discover_chunk(chunk, queue.put_nowait)
+                    except Exception as e:
+                        print(f"[!] Discovery error in {chunk}: {e}")
+                    queue.put_nowait(("chunk_done", str(chunk)))
+            finally:
+                queue.put_nowait(("worker_done", None))
+
+        async def resolve_hostname(ip: str):
+            try:
+                # The shared resolver bounds concurrency and caches answers across discoveries
+                hostname = await self._get_hostname(ip)
+                if hostname:
+                    queue.put_nowait(("device", {"ip": ip, "hostname": hostname, "discovery_method": "reverse_dns"}))
+            finally:
+                queue.put_nowait(("hostname_done", None))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.chunk_concurrency, chunks_total))]
+        hostname_tasks = set()
+        pending = len(workers)
+        devices: Dict[str, Dict[str, Any]] = {}
+        chunks_done = 0
+
+        try:
+            while pending:
+                kind, item = await queue.get()
+                if kind == "device":
+                    if ipaddress.ip_address(item["ip"]) not in network:
+                        continue
+                    is_new = item["ip"] not in devices
+                    if self._merge_device(devices, item):
+                        yield {"event": "host", "data": dict(devices[item["ip"]])}
+                    if is_new and not devices[item["ip"]].get("hostname"):
+                        pending += 1
+                        task = asyncio.create_task(resolve_hostname(item["ip"]))
+                        hostname_tasks.add(task)
+                        task.add_done_callback(hostname_tasks.discard)
+                elif kind == "chunk_done":
+                    chunks_done += 1
+                    yield {"event": "progress", "data": {
+                        "chunk": item,
+                        "chunks_done": chunks_done,
+                        "chunks_total": chunks_total,
+                        "hosts_found": len(devices)
+                    }}
+                else:
+                    pending -= 1
+        finally:
+            # Also reached when the consumer stops early: cancel probes and lookups still running
+            for task in [*workers, *hostname_tasks]:
+                task.cancel()
+            await asyncio.gather(*workers, *hostname_tasks, return_exceptions=True)
+
+        duration = (datetime.now() - started).total_seconds()
+        print(f"[+] Discovery of {network} found {len(devices)} devices in {duration:.1f}s")
+        yield {"event": "complete", "data": {
+            "network_range": str(network),
+            "chunks_total": chunks_total,
+            "total_devices": len(devices),
+            "duration_seconds": round(duration, 2)
+        }}
+
     async def _get_default_network_range(self) -> str:
         """
         Auto-detect the local network range
@@ -138,148 +374,105 @@ class NetworkDiscovery:
         # Default fallback
         return "192.168.1.0/24"
 
-    async def _fast_arp_discovery(self, network_range: str) -> List[Dict[str, Any]]:
+    def _chunk_timeout(self, chunk: ipaddress.IPv4Network) -> int:
+        """Seconds allowed for probing one chunk, proportional to its size"""
+        return int(CHUNK_BASE_TIMEOUT + CHUNK_TIMEOUT_PER_ADDRESS * chunk.num_addresses)
+
+    async def _discover_chunk(self, chunk: ipaddress.IPv4Network, emit: Callable[[Tuple[str, Dict]], None]):
         """
-        Fast ARP discovery using optimized nmap
+        Probe one chunk with nmap (ARP on local segments) and fping side by side,
+        then read the neighbor entries the probes left in the kernel's ARP table
         """
-        devices = []
-        try:
-            print(f"[*] Running nmap ARP discovery on {network_range}")
+        await asyncio.gather(
+            self._fast_arp_discovery(chunk, emit),
+            self._fast_ping_sweep(chunk, emit)
+        )
+        for device in await self._get_arp_table():
+            if ipaddress.ip_address(device["ip"]) in chunk:
+                emit(("device", device))
+
+    async def _fast_arp_discovery(self, chunk: ipaddress.IPv4Network, emit: Callable[[Tuple[str, Dict]], None]):
+        """
+        Fast ARP discovery of one chunk using nmap, reporting hosts as nmap finishes them
+        """
+        def on_host(host: Dict[str, Any]):
+            if host.get("status") == "up" and host.get("ip"):
+                emit(("device", {
+                    "ip": host["ip"],
+                    "mac": host.get("mac") or None,
+                    "status": "online",
+                    "discovery_method": "nmap_arp",
+                    "hostname": host.get("hostname") or None
+                }))
 
-            # Use comprehensive nmap settings to find all devices
-            cmd = ['nmap', '-sn', network_range, '--max-hostgroup', '100', '--min-rate', '300']
+        cmd = ['nmap', '-sn', str(chunk), '--max-hostgroup', '100', '--min-rate', '300', '-oX', '-']
+        result = await run_nmap_streaming(cmd, timeout=self._chunk_timeout(chunk), on_host=on_host)
+        if not result["success"]:
+            # Hosts reported before a timeout were already emitted
+            print(f"[!] nmap discovery of {chunk}: {result['stderr']}")
+
+    async def _fast_ping_sweep(self, chunk: ipaddress.IPv4Network, emit: Callable[[Tuple[str, Dict]], None]):
+        """
+        Ping sweep of one chunk with fping, reading live hosts as fping prints them
+        (nmap ping sweep if fping is not installed)
+        """
+        if chunk.num_addresses > 4:
+            targets = ['-g', str(chunk)]
+        else:
+            # fping -g skips network/broadcast addresses, which are hosts in tiny ranges
+            targets = [str(ip) for ip in chunk]
+        cmd = ['fping', '-a', '-q', '-r', '1', '-t', '1000'] + targets
 
-            result = await asyncio.create_subprocess_exec(
+        try:
+            process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True
             )
-
-            stdout, stderr = await asyncio.wait_for(result.communicate(), timeout=20)
-
-            if result.returncode == 0:
-                output = stdout.decode()
-                print(f"[DEBUG] Nmap output:\n{output}")
-                lines = output.split('\n')
-                current_ip = None
-                current_mac = None
-
-                for line in lines:
-                    # Look for IP addresses (multiple formats)
-                    ip_match = re.search(r'Nmap scan report for (\d+\.\d+\.\d+\.\d+)', line)
-                    if not ip_match:
-                        ip_match = re.search(r'Host (\d+\.\d+\.\d+\.\d+) is up', line)
-
-                    if ip_match:
-                        # Save previous device if exists
-                        if current_ip:
-                            devices.append({
-                                "ip": current_ip,
-                                "mac": current_mac,
-                                "status": "online",
-                                "discovery_method": "nmap_arp",
-                                "hostname": None
-                            })
-                        current_ip = ip_match.group(1)
-                        current_mac = None
-
-                    # Look for MAC addresses
-                    mac_match = re.search(r'MAC Address: ([0-9A-Fa-f:]{17})', line)
-                    if mac_match and current_ip:
-                        current_mac = mac_match.group(1)
-
-                # Add the last device
-                if current_ip:
-                    devices.append({
-                        "ip": current_ip,
-                        "mac": current_mac,
+        except FileNotFoundError:
+            await self._nmap_ping_sweep(chunk, emit)
+            return
+
+        async def read_hosts():
+            async for line in process.stdout:
+                ip = line.decode(errors="replace").strip()
+                if ip:
+                    emit(("device", {
+                        "ip": ip,
+                        "mac": None,
                         "status": "online",
-                        "discovery_method": "nmap_arp",
+                        "discovery_method": "fping",
                         "hostname": None
-                    })
-
-            else:
-                print(f"[!] Nmap error: {stderr.decode()}")
+                    }))
+            await process.wait()
 
+        try:
+            await asyncio.wait_for(read_hosts(), timeout=self._chunk_timeout(chunk))
         except asyncio.TimeoutError:
-            print("[!] Fast ARP discovery timeout")
-        except Exception as e:
-            print(f"[!] Fast ARP discovery error: {e}")
-
-        print(f"[+] ARP discovery found {len(devices)} devices")
-        return devices
+            print(f"[!] Ping sweep timeout for {chunk}")
+        finally:
+            await terminate_process(process)
 
-    async def _fast_ping_sweep(self, network_range: str) -> List[Dict[str, Any]]:
+    async def _nmap_ping_sweep(self, chunk: ipaddress.IPv4Network, emit: Callable[[Tuple[str, Dict]], None]):
         """
-        Ultra-fast ping sweep using fping or nmap
+        Ping sweep of one chunk with nmap ICMP and TCP SYN probes
         """
-        devices = []
-        try:
-            print(f"[*] Running ping sweep on {network_range}")
-            network = ipaddress.IPv4Network(network_range, strict=False)
-
-            # Create list of IPs to ping
-            ip_list = [str(ip) for ip in network.hosts()]
-
-            # Try fping first (fastest)
-            try:
-                cmd = ['fping', '-a', '-q', '-r', '1', '-t', '1000'] + ip_list
-
-                result = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-
-                stdout, stderr = await asyncio.wait_for(result.communicate(), timeout=15)
-
-                if stdout:
-                    online_ips = stdout.decode().strip().split('\n')
-                    for ip in online_ips:
-                        if ip.strip() and ip.strip() != '':
-                            devices.append({
-                                "ip": ip.strip(),
-                                "mac": None,
-                                "status": "online",
-                                "discovery_method": "fping",
-                                "hostname": None
-                            })
-
-            except FileNotFoundError:
-                # Fallback to nmap ping sweep if fping not available
-                print("[*] fping not found, using nmap ping sweep")
-                cmd = ['nmap', '-sn', '-PE', '-PP', '-PS21,22,23,25,53,80,110,111,135,139,143,443,993,995,1723,3389,5900,8080', network_range]
-
-                result = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-
-                stdout, stderr = await asyncio.wait_for(result.communicate(), timeout=15)
-
-                if result.returncode == 0:
-                    output = stdout.decode()
-                    # Extract IPs from nmap output
-                    for line in output.split('\n'):
-                        ip_match = re.search(r'Nmap scan report for (\d+\.\d+\.\d+\.\d+)', line)
-                        if ip_match:
-                            devices.append({
-                                "ip": ip_match.group(1),
-                                "mac": None,
-                                "status": "online",
-                                "discovery_method": "nmap_ping",
-                                "hostname": None
-                            })
-
-            except asyncio.TimeoutError:
-                print("[!] Ping sweep timeout")
-
-        except Exception as e:
-            print(f"[!] Ping sweep error: {e}")
+        def on_host(host: Dict[str, Any]):
+            if host.get("status") == "up" and host.get("ip"):
+                emit(("device", {
+                    "ip": host["ip"],
+                    "mac": host.get("mac") or None,
+                    "status": "online",
+                    "discovery_method": "nmap_ping",
+                    "hostname": host.get("hostname") or None
+                }))
 
-        print(f"[+] Ping sweep found {len(devices)} devices")
-        return devices
+        cmd = ['nmap', '-sn', '-PE', '-PP', '-PS21,22,23,25,53,80,110,111,135,139,143,443,993,995,1723,3389,5900,8080',
+               str(chunk), '-oX', '-']
+        result = await run_nmap_streaming(cmd, timeout=self._chunk_timeout(chunk), on_host=on_host)
+        if not result["success"]:
+            print(f"[!] nmap ping sweep of {chunk}: {result['stderr']}")
 
     async def _fallback_ping_sweep(self, ip_list: List[str]) -> List[Dict[str, Any]]:
         """
@@ -320,33 +513,69 @@ class NetworkDiscovery:
 
     async def _get_arp_table(self) -> List[Dict[str, Any]]:
         """
-        Get devices from system ARP table
+        Get devices from the kernel's neighbor (ARP) table in /proc/net/arp
+        (`arp -a` where /proc is not available)
         """
         devices = []
         try:
-            # Read ARP table
-            result = subprocess.run(['arp', '-a'], capture_output=True, text=True, timeout=10)
+            if not os.path.exists(ARP_TABLE_PATH):
+                return await self._get_arp_command_table()
+
+            with open(ARP_TABLE_PATH) as f:
+                lines = f.read().splitlines()[1:]
+
+            # Format: IP address  HW type  Flags  HW address  Mask  Device
+            for line in lines:
+                fields = line.split()
+                if len(fields) < 6:
+                    continue
+                ip, flags, mac = fields[0], fields[2], fields[3]
+                # Incomplete entries have no hardware address yet
+                if not int(flags, 16) & ARP_FLAG_COMPLETE or mac == "00:00:00:00:00:00":
+                    continue
 
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    # Parse ARP table entries
-                    # Format: hostname (192.168.1.1) at aa:bb:cc:dd:ee:ff [ether] on eth0
-                    match = re.search(r'\((\d+\.\d+\.\d+\.\d+)\) at ([0-9a-fA-F:]{17})', line)
-                    if match:
-                        ip = match.group(1)
-                        mac = match.group(2)
-
-                        # Extract hostname if available
-                        hostname_match = re.search(r'^(\S+) \(', line)
-                        hostname = hostname_match.group(1) if hostname_match else None
-
-                        devices.append({
-                            "ip": ip,
-                            "mac": mac,
-                            "status": "online",
-                            "discovery_method": "arp_table",
-                            "hostname": hostname
-                        })
+                devices.append({
+                    "ip": ip,
+                    "mac": mac,
+                    "status": "online",
+                    "discovery_method": "arp_table",
+                    "hostname": None
+                })
+
+        except Exception as e:
+            print(f"[!] ARP table error: {e}")
+
+        return devices
+
+    async def _get_arp_command_table(self) -> List[Dict[str, Any]]:
+        """
+        Get devices from the output of `arp -a`
+        """
+        devices = []
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'arp', '-a',
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+
+            for line in stdout.decode(errors="replace").split('\n'):
+                # Parse ARP table entries
+                # Format: hostname (192.168.1.1) at aa:bb:cc:dd:ee:ff [ether] on eth0
+                match = re.search(r'\((\d+\.\d+\.\d+\.\d+)\) at ([0-9a-fA-F:]{17})', line)
+                if match:
+                    # Extract hostname if available
+                    hostname_match = re.search(r'^(\S+) \(', line)
+                    hostname = hostname_match.group(1) if hostname_match else None
+
+                    devices.append({
+                        "ip": match.group(1),
+                        "mac": match.group(2),
+                        "status": "online",
+                        "discovery_method": "arp_table",
+                        "hostname": hostname if hostname != "?" else None
+                    })
 
         except Exception as e:
             print(f"[!] ARP table error: {e}")
@@ -355,85 +584,53 @@ class NetworkDiscovery:
 
     async def _get_hostname(self, ip: str) -> Optional[str]:
         """
-        Try to resolve hostname for IP
+        Try to resolve hostname for IP (cached reverse lookup through the shared resolver)
         """
         try:
-            hostname = socket.gethostbyaddr(ip)[0]
-            return hostname
+            return await get_dns_resolver_service().reverse(ip)
         except Exception:
             return None
 
-    def _merge_device_data(self, *device_lists) -> List[Dict[str, Any]]:
+    def _merge_device(self, merged_devices: Dict[str, Dict[str, Any]], device: Dict[str, Any]) -> bool:
         """
-        Merge device data from multiple discovery methods
+        Merge one device report into merged_devices (keyed by IP), preferring non-None
+        values. Returns True when the device is new or gained a MAC or hostname.
         """
-        merged_devices = {}
+        ip = device["ip"]
 
-        for device_list in device_lists:
-            for device in device_list:
-                ip = device["ip"]
-
-                if ip not in merged_devices:
-                    merged_devices[ip] = device.copy()
-                else:
-                    # Merge data, preferring non-None values
-                    existing = merged_devices[ip]
+        if ip not in merged_devices:
+            merged = {"mac": None, "status": "online", "hostname": None, **device}
+            if merged.get("mac"):
+                merged["vendor"] = self._get_mac_vendor(merged["mac"])
+            merged_devices[ip] = merged
+            return True
 
-                    if not existing.get("mac") and device.get("mac"):
-                        existing["mac"] = device["mac"]
+        existing = merged_devices[ip]
+        changed = False
 
-                    if not existing.get("hostname") and device.get("hostname"):
-                        existing["hostname"] = device["hostname"]
+        if not existing.get("mac") and device.get("mac"):
+            existing["mac"] = device["mac"]
+            existing["vendor"] = self._get_mac_vendor(device["mac"])
+            changed = True
 
-                    # Combine discovery methods
-                    existing_methods = existing.get("discovery_method", "").split(",")
-                    new_method = device.get("discovery_method", "")
-                    if new_method and new_method not in existing_methods:
-                        existing["discovery_method"] = ",".join(existing_methods + [new_method])
+        if not existing.get("hostname") and device.get("hostname"):
+            existing["hostname"] = device["hostname"]
+            changed = True
 
-        # Add vendor information based on MAC
-        for device in merged_devices.values():
-            if device.get("mac"):
-                device["vendor"] = self._get_mac_vendor(device["mac"])
+        # Combine discovery methods
+        existing_methods = existing.get("discovery_method", "").split(",")
+        new_method = device.get("discovery_method", "")
+        if new_method and new_method not in existing_methods:
+            existing["discovery_method"] = ",".join(existing_methods + [new_method])
 
-        return list(merged_devices.values())
+        return changed
 
     def _get_mac_vendor(self, mac: str) -> str:
         """
-        Get vendor information from MAC address (basic OUI lookup)
+        Get vendor information from MAC address (IEEE OUI database lookup)
         """
         try:
-            # Basic vendor lookup based on common OUI prefixes
-            mac_upper = mac.upper().replace(":", "")
-            oui = mac_upper[:6]
-
-            # Common vendor OUIs
-            vendors = {
-                "000C29": "VMware",
-                "000569": "VMware",
-                "001C42": "VMware",
-                "005056": "VMware",
-                "080027": "VirtualBox",
-                "525400": "QEMU",
-                "0003FF": "Microsoft",
-                "000D3A": "Microsoft",
-                "001DD8": "Microsoft",
-                "0050F2": "Microsoft",
-                "00155D": "Microsoft",
-                "000C76": "Cisco",
-                "000142": "Cisco",
-                "0001C7": "Cisco",
-                "001F12": "Dell",
-                "002564": "Dell",
-                "00188B": "Dell",
-                "3C970E": "Apple",
-                "A45E60": "Apple",
-                "AC87A3": "Apple",
-                "00A040": "Apple"
-            }
-
-            return vendors.get(oui, "Unknown")
-
+            return lookup_vendor(mac)
         except Exception:
             return "Unknown"
 
@@ -488,7 +685,9 @@ class NetworkDiscovery:
             Focus on network security analysis and device identification.
             """
 
-            response = self.openai_client.chat.completions.create(
+            # The OpenAI client blocks; keep it off the event loop
+            response = await asyncio.to_thread(
+                self.openai_client.chat.completions.create,
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a network security expert analyzing network discovery results. Provide detailed network security assessments in valid JSON format."},
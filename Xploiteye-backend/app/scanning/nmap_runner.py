@@ -0,0 +1,363 @@
+"""
+Asyncio nmap runner with streaming XML parsing
+Runs nmap as an asyncio subprocess and parses its `-oX -` output incrementally,
+emitting host/port/progress events while the scan is still running.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import signal
+import xml.etree.ElementTree as ET
+from typing import Callable, List, Optional
+
+from app.scanning.scan_context import get_current_scan_context, signal_process_group
+
+# Size of each stdout read; nmap flushes XML per completed host group
+READ_CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait after SIGTERM before escalating to SIGKILL
+TERMINATE_GRACE_PERIOD = 3
+
+
+def port_element_to_dict(port) -> dict:
+    """Convert an nmap <port> element to the port dict used across the scanner."""
+    port_data = {
+        "port": port.get("portid", ""),
+        "protocol": port.get("protocol", ""),
+        "state": "",
+        "service": "",
+        "product": "",
+        "version": "",
+        "cpe": []
+    }
+
+    state = port.find('state')
+    if state is not None:
+        port_data["state"] = state.get("state", "")
+
+    service = port.find('service')
+    if service is not None:
+        port_data["service"] = service.get("name", "")
+        port_data["product"] = service.get("product", "")
+        port_data["version"] = service.get("version", "")
+        port_data["cpe"] = [cpe.text for cpe in service.findall('cpe') if cpe.text]
+
+    return port_data
+
+
+def host_element_to_dict(host) -> dict:
+    """Convert an nmap <host> element to the host dict returned by parse_nmap_xml."""
+    host_data = {"ip": "", "mac": "", "hostname": "", "status": "", "ports": [], "os": "", "os_details": {}}
+
+    # Get IP address
+    address = host.find('address[@addrtype="ipv4"]')
+    if address is not None:
+        host_data["ip"] = address.get("addr", "")
+
+    # MAC address (only reported for hosts on a directly attached network)
+    mac_address = host.find('address[@addrtype="mac"]')
+    if mac_address is not None:
+        host_data["mac"] = mac_address.get("addr", "")
+
+    # Get hostname
+    hostname = host.find('.//hostname')
+    if hostname is not None:
+        host_data["hostname"] = hostname.get("name", "")
+
+    # Get host status
+    status = host.find('status')
+    if status is not None:
+        host_data["status"] = status.get("state", "")
+
+    # Get enhanced OS information
+    os_match = host.find('.//osmatch')
+    if os_match is not None:
+        host_data["os"] = os_match.get("name", "")
+
+        # Simple OS details - only name
+        host_data["os_details"] = {
+            "name": os_match.get("name", "")
+        }
+
+    # Get ports (only open ports are kept)
+    for port in host.findall('.//port'):
+        port_data = port_element_to_dict(port)
+        if port_data["state"] == "open":
+            host_data["ports"].append(port_data)
+
+    return host_data
+
+
+def split_port_range(first: int, last: int, shards: int) -> List[str]:
+    """Split first-last into up to `shards` contiguous nmap port ranges of near-equal size."""
+    total = last - first + 1
+    shards = max(1, min(shards, total))
+    size, extra = divmod(total, shards)
+    ranges, start = [], first
+    for i in range(shards):
+        end = start + size - 1 + (1 if i < extra else 0)
+        ranges.append(f"{start}-{end}")
+        start = end + 1
+    return ranges
+
+
+def split_targets(target: str, groups: int) -> List[str]:
+    """Split a CIDR target into up to `groups` subnets; anything else stays a single target."""
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError:
+        return [target]
+    if groups <= 1 or network.num_addresses <= 1:
+        return [target]
+    extra_bits = min(groups.bit_length() - 1, network.max_prefixlen - network.prefixlen)
+    return [str(subnet) for subnet in network.subnets(prefixlen_diff=extra_bits)]
+
+
+def _port_sort_key(port_data: dict):
+    try:
+        return int(port_data.get("port", 0)), port_data.get("protocol", "")
+    except ValueError:
+        return 0, port_data.get("protocol", "")
+
+
+def merge_parsed_data(parsed_list: List[dict]) -> dict:
+    """
+    Merge several parse_nmap_xml results (one per shard) into one, in the same shape.
+
+    Hosts are matched by IP; ports are de-duplicated by port/protocol, keeping the
+    entry with service details, and the first OS match found is kept.
+    """
+    hosts, errors = {}, []
+    for parsed in parsed_list:
+        if not parsed:
+            continue
+        if parsed.get("error"):
+            errors.append(parsed["error"])
+        for host in parsed.get("hosts", []):
+            key = host.get("ip") or host.get("hostname")
+            merged = hosts.setdefault(key, {**host, "ports": {}})
+            if host.get("status") == "up":
+                merged["status"] = "up"
+            if not merged.get("hostname") and host.get("hostname"):
+                merged["hostname"] = host["hostname"]
+            if not merged.get("mac") and host.get("mac"):
+                merged["mac"] = host["mac"]
+            if not merged.get("os") and host.get("os"):
+                merged["os"] = host["os"]
+                merged["os_details"] = host.get("os_details", {})
+            for port in host.get("ports", []):
+                port_key = (port.get("port"), port.get("protocol"))
+                existing = merged["ports"].get(port_key)
+                if existing is None or ((port.get("service") or port.get("version")) and not existing.get("version")):
+                    merged["ports"][port_key] = port
+
+    results = {"hosts": []}
+    for host in hosts.values():
+        host["ports"] = sorted(host["ports"].values(), key=_port_sort_key)
+        results["hosts"].append(host)
+    if errors and not results["hosts"]:
+        results["error"] = errors[0]
+    return results
+
+
+class NmapXmlStream:
+    """
+    Incremental parser for nmap XML output.
+
+    Feed it stdout chunks as they arrive; every completed <host> is converted to a
+    host dict, reported through the callbacks and then dropped from the tree, so
+    memory stays flat no matter how many hosts the scan covers.
+    """
+
+    def __init__(self,
+                 on_host: Optional[Callable[[dict], None]] = None,
+                 on_port: Optional[Callable[[str, dict], None]] = None,
+                 on_progress: Optional[Callable[[dict], None]] = None):
+        self.on_host = on_host
+        self.on_port = on_port
+        self.on_progress = on_progress
+        self.hosts = []
+        self.error = None
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._current_ip = ""
+
+    def feed(self, data: bytes):
+        """Feed a chunk of nmap stdout into the parser."""
+        if self.error:
+            return
+        try:
+            self._parser.feed(data)
+            self._drain()
+        except ET.ParseError as e:
+            self.error = str(e)
+            logging.warning(f"nmap XML stream parse error: {e}")
+
+    def close(self) -> dict:
+        """Finish parsing and return results in the parse_nmap_xml shape."""
+        if not self.error:
+            try:
+                self._parser.close()
+                self._drain()
+            except ET.ParseError as e:
+                self.error = str(e)
+
+        results = {"hosts": self.hosts}
+        if self.error and not self.hosts:
+            results["error"] = self.error
+        return results
+
+    def _drain(self):
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                elif elem.tag == "host":
+                    self._current_ip = ""
+                continue
+
+            if elem.tag == "address" and elem.get("addrtype") == "ipv4":
+                self._current_ip = elem.get("addr", "")
+            elif elem.tag == "port":
+                port_data = port_element_to_dict(elem)
+                if port_data["state"] == "open" and self.on_port:
+                    self.on_port(self._current_ip, port_data)
+            elif elem.tag == "taskprogress" and self.on_progress:
+                self.on_progress({
+                    "task": elem.get("task", ""),
+                    "percent": float(elem.get("percent", 0) or 0),
+                    "remaining": int(elem.get("remaining", 0) or 0)
+                })
+            elif elem.tag == "host":
+                host_data = host_element_to_dict(elem)
+                self.hosts.append(host_data)
+                if self.on_host:
+                    self.on_host(host_data)
+                # Drop the finished host subtree to keep memory flat
+                elem.clear()
+                if self._root is not None:
+                    try:
+                        self._root.remove(elem)
+                    except ValueError:
+                        pass
+
+
+async def terminate_process(process: asyncio.subprocess.Process):
+    """Stop a subprocess and its process group: SIGTERM first, SIGKILL if it lingers."""
+    if process.returncode is not None:
+        return
+    signal_process_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=TERMINATE_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        signal_process_group(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def start_scan_process(command: list[str]) -> asyncio.subprocess.Process:
+    """
+    Start a subprocess in its own process group, owned by the current scan (if any)
+    so cancelling that scan stops it without touching other scans' processes.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    ctx = get_current_scan_context()
+    if ctx is not None:
+        ctx.track_process(process)
+    return process
+
+
+def _release_scan_process(process: asyncio.subprocess.Process):
+    ctx = get_current_scan_context()
+    if ctx is not None:
+        ctx.untrack_process(process)
+
+
+async def run_command_async(command: list[str], timeout: int = 300) -> dict:
+    """Asyncio counterpart of _run_command_with_timeout with the same result shape."""
+    try:
+        process = await start_scan_process(command)
+    except Exception as e:
+        return {"stdout": "", "stderr": str(e), "returncode": -1, "success": False}
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        await terminate_process(process)
+        return {
+            "stdout": "",
+            "stderr": f"Command timed out after {timeout} seconds",
+            "returncode": -1,
+            "success": False
+        }
+    except asyncio.CancelledError:
+        await terminate_process(process)
+        raise
+    finally:
+        _release_scan_process(process)
+
+    return {
+        "stdout": stdout.decode(errors="replace").strip(),
+        "stderr": stderr.decode(errors="replace").strip(),
+        "returncode": process.returncode,
+        "success": process.returncode == 0
+    }
+
+
+async def run_nmap_streaming(command: list[str], timeout: int = 300,
+                             on_host: Optional[Callable[[dict], None]] = None,
+                             on_port: Optional[Callable[[str, dict], None]] = None,
+                             on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Run an nmap command that writes XML to stdout (`-oX -`) and parse it as it streams.
+
+    Returns a dict with the same success/stderr/returncode keys as
+    _run_command_with_timeout plus "parsed_data" in the parse_nmap_xml shape.
+    Hosts parsed before a timeout are kept in "parsed_data".
+    """
+    stream = NmapXmlStream(on_host=on_host, on_port=on_port, on_progress=on_progress)
+
+    try:
+        process = await start_scan_process(command)
+    except Exception as e:
+        return {"stderr": str(e), "returncode": -1, "success": False, "parsed_data": {"hosts": [], "error": str(e)}}
+
+    async def pump_stdout():
+        while True:
+            chunk = await process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            stream.feed(chunk)
+
+    stderr_task = asyncio.create_task(process.stderr.read())
+    try:
+        await asyncio.wait_for(pump_stdout(), timeout=timeout)
+        await asyncio.wait_for(process.wait(), timeout=TERMINATE_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        await terminate_process(process)
+        stderr_task.cancel()
+        return {
+            "stderr": f"Command timed out after {timeout} seconds",
+            "returncode": -1,
+            "success": False,
+            "parsed_data": stream.close()
+        }
+    except asyncio.CancelledError:
+        await terminate_process(process)
+        stderr_task.cancel()
+        raise
+    finally:
+        _release_scan_process(process)
+
+    stderr = (await stderr_task).decode(errors="replace").strip()
+    return {
+        "stderr": stderr,
+        "returncode": process.returncode,
+        "success": process.returncode == 0,
+        "parsed_data": stream.close()
+    }
@@ -0,0 +1,256 @@
+"""
+MAC vendor (OUI) database
+The IEEE MA-L, MA-M and MA-S registries compiled into one compact sorted binary
+file, memory-mapped read-only and searched with bisect. Pages are shared through
+the page cache, so every worker process uses the same copy and opening it costs
+nothing. The longest matching prefix wins: a 36-bit MA-S block resolves to its
+owner, not to the IEEE Registration Authority that holds the enclosing MA-L block.
+
+File layout (little-endian):
+    header      magic, entry counts per prefix length, vendor blob size
+    keys        sorted uint64 prefixes, one array per length (36, 28, 24 bits)
+    vendors     uint32 blob offsets, parallel to each key array
+    blob        deduplicated vendor names: uint16 length + UTF-8 bytes
+
+Without a built file the small built-in table below is used.
+
+    python -m app.scanning.oui_db build oui.csv mam.csv oui36.csv
+    python -m app.scanning.oui_db lookup 00:0C:29:12:34:56
+    python -m app.scanning.oui_db stats
+"""
+
+import argparse
+import bisect
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+OUI_DB_MAGIC = b"XEOUI2\x00\x00"
+
+# magic, entries with 36/28/24-bit prefixes, vendor blob size, padding (32 bytes, so the
+# uint64 key arrays that follow are 8-byte aligned)
+_HEADER = struct.Struct("<8sIIII8x")
+
+# Prefix lengths in lookup order (longest first) and the IEEE registry for each
+PREFIX_BITS = (36, 28, 24)
+REGISTRY_BITS = {"MA-S": 36, "MA-M": 28, "MA-L": 24}
+
+# Used when no database file has been built
+FALLBACK_VENDORS = {
+    "000C29": "VMware",
+    "000569": "VMware",
+    "001C42": "VMware",
+    "005056": "VMware",
+    "080027": "VirtualBox",
+    "525400": "QEMU",
+    "0003FF": "Microsoft",
+    "000D3A": "Microsoft",
+    "001DD8": "Microsoft",
+    "0050F2": "Microsoft",
+    "00155D": "Microsoft",
+    "000C76": "Cisco",
+    "000142": "Cisco",
+    "0001C7": "Cisco",
+    "001F12": "Dell",
+    "002564": "Dell",
+    "00188B": "Dell",
+    "3C970E": "Apple",
+    "A45E60": "Apple",
+    "AC87A3": "Apple",
+    "00A040": "Apple"
+}
+
+_NON_HEX = re.compile(r"[^0-9A-Fa-f]")
+
+
+def mac_to_int(mac: str) -> Optional[int]:
+    """48-bit integer for a MAC in any common notation (aa:bb:.., aa-bb-.., aabb.ccdd.eeff)."""
+    digits = _NON_HEX.sub("", mac or "")
+    if len(digits) != 12:
+        return None
+    return int(digits, 16)
+
+
+class OuiDatabase:
+    """Read-only view of a compiled OUI database file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, *counts, blob_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != OUI_DB_MAGIC:
+            raise ValueError(f"{path} is not an OUI database")
+        if sys.byteorder != "little":
+            raise ValueError("OUI database files are little-endian")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._keys, self._vendors = {}, {}
+        for bits, count in zip(PREFIX_BITS, counts):
+            self._keys[bits] = view[offset:offset + 8 * count].cast("Q")
+            offset += 8 * count
+        for bits, count in zip(PREFIX_BITS, counts):
+            self._vendors[bits] = view[offset:offset + 4 * count].cast("I")
+            offset += 4 * count
+        self._blob = view[offset:offset + blob_size]
+        self.counts = dict(zip(PREFIX_BITS, counts))
+
+    def lookup(self, mac: str) -> Optional[str]:
+        """Vendor of the longest registered prefix matching mac, or None."""
+        value = mac_to_int(mac)
+        if value is None:
+            return None
+        for bits in PREFIX_BITS:
+            keys = self._keys[bits]
+            prefix = value >> (48 - bits)
+            index = bisect.bisect_left(keys, prefix)
+            if index < len(keys) and keys[index] == prefix:
+                return self._vendor_at(self._vendors[bits][index])
+        return None
+
+    @lru_cache(maxsize=4096)
+    def _vendor_at(self, offset: int) -> str:
+        length = self._blob[offset] | (self._blob[offset + 1] << 8)
+        return bytes(self._blob[offset + 2:offset + 2 + length]).decode("utf-8", errors="replace")
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "bytes": len(self._mmap),
+            "ma_l": self.counts[24],
+            "ma_m": self.counts[28],
+            "ma_s": self.counts[36]
+        }
+
+
+def read_ieee_csv(path: str) -> Dict[tuple, str]:
+    """{(prefix_bits, prefix): vendor} from an IEEE registry CSV (oui.csv, mam.csv or oui36.csv)."""
+    entries = {}
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        for row in csv.DictReader(f):
+            assignment = (row.get("Assignment") or "").strip()
+            vendor = " ".join((row.get("Organization Name") or "").split())
+            bits = REGISTRY_BITS.get((row.get("Registry") or "").strip(), len(assignment) * 4)
+            if not vendor or bits not in PREFIX_BITS or len(assignment) * 4 != bits:
+                continue
+            try:
+                entries[(bits, int(assignment, 16))] = vendor
+            except ValueError:
+                continue
+    return entries
+
+
+def build_oui_database(csv_paths: List[str], output_path: str) -> dict:
+    """
+    Compile IEEE registry CSVs into an OUI database file. The file is written
+    next to the target and renamed into place, so processes that have the old
+    file mapped keep reading it until they reopen.
+    """
+    entries = {}
+    for path in csv_paths:
+        entries.update(read_ieee_csv(path))
+
+    blob, blob_offsets = bytearray(), {}
+    keys = {bits: array("Q") for bits in PREFIX_BITS}
+    vendors = {bits: array("I") for bits in PREFIX_BITS}
+    for (bits, prefix), vendor in sorted(entries.items()):
+        if vendor not in blob_offsets:
+            encoded = vendor.encode("utf-8")[:0xFFFF]
+            blob_offsets[vendor] = len(blob)
+            blob += struct.pack("<H", len(encoded)) + encoded
+        keys[bits].append(prefix)
+        vendors[bits].append(blob_offsets[vendor])
+
+    if sys.byteorder != "little":
+        for table in (*keys.values(), *vendors.values()):
+            table.byteswap()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(OUI_DB_MAGIC, *(len(keys[bits]) for bits in PREFIX_BITS), len(blob)))
+        for bits in PREFIX_BITS:
+            f.write(keys[bits].tobytes())
+        for bits in PREFIX_BITS:
+            f.write(vendors[bits].tobytes())
+        f.write(blob)
+    os.replace(temp_path, output_path)
+
+    return {
+        "path": output_path,
+        "entries": len(entries),
+        "vendors": len(blob_offsets),
+        "bytes": os.path.getsize(output_path)
+    }
+
+
+# Global database instance
+_oui_db = None
+_oui_db_checked = False
+
+
+def get_oui_db() -> Optional[OuiDatabase]:
+    """Get the OUI database, or None if no file has been built."""
+    global _oui_db, _oui_db_checked
+    if not _oui_db_checked:
+        _oui_db_checked = True
+        if os.path.exists(settings.oui_db_path):
+            try:
+                _oui_db = OuiDatabase(settings.oui_db_path)
+            except Exception as e:
+                logging.error(f"OUI database unavailable: {e}")
+    return _oui_db
+
+
+def lookup_vendor(mac: str) -> str:
+    """Vendor for a MAC address ("Unknown" if no registry entry matches)."""
+    db = get_oui_db()
+    if db is not None:
+        return db.lookup(mac) or "Unknown"
+    value = mac_to_int(mac)
+    if value is None:
+        return "Unknown"
+    return FALLBACK_VENDORS.get(f"{value >> 24:06X}", "Unknown")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the MAC vendor (OUI) database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Compile IEEE MA-L/MA-M/MA-S CSV files")
+    build_parser.add_argument("paths", nargs="*", help="CSV files or directories (default: settings.oui_csv_dir)")
+    build_parser.add_argument("--output", default=settings.oui_db_path, help="Database file to write")
+    lookup_parser = subparsers.add_parser("lookup", help="Look up the vendor of MAC addresses")
+    lookup_parser.add_argument("macs", nargs="+")
+    subparsers.add_parser("stats", help="Show database statistics")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        csv_paths = []
+        for path in args.paths or [settings.oui_csv_dir]:
+            if os.path.isdir(path):
+                csv_paths += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".csv"))
+            else:
+                csv_paths.append(path)
+        print(json.dumps(build_oui_database(csv_paths, args.output)))
+    elif args.command == "lookup":
+        for mac in args.macs:
+            print(json.dumps({"mac": mac, "vendor": lookup_vendor(mac)}))
+    else:
+        db = get_oui_db()
+        print(json.dumps(db.stats() if db else {"path": settings.oui_db_path, "built": False}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Scan report builder
+Assembles the structured scan_results_json directly from the collected scan data.
+Only the judgement calls (risk score, risk level, recommendations) come from the
+LLM, through a compact fixed-size prompt; a deterministic heuristic covers them
+when the LLM is unavailable or answers with something unusable.
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+RISK_LEVELS = ("low", "medium", "high", "critical")
+
+# CVSS-like weight used when a vulnerability has a severity but no parsable score
+SEVERITY_SCORES = {"critical": 9.5, "high": 7.5, "medium": 5.0, "low": 3.0}
+
+# Number of vulnerabilities shown to the LLM; keeps the prompt size independent of the CVE count
+PROMPT_TOP_VULNERABILITIES = 5
+
+# Ports running cleartext management/file-transfer protocols
+CLEARTEXT_PORTS = {21: "FTP", 23: "Telnet", 512: "rexec", 513: "rlogin", 514: "rsh"}
+
+
+def _vuln_score(vuln: Dict) -> float:
+    try:
+        return float(vuln.get("cvss_score"))
+    except (TypeError, ValueError):
+        return SEVERITY_SCORES.get(str(vuln.get("severity", "")).lower(), 0.0)
+
+
+def _ranked_vulnerabilities(vulnerabilities: List[Dict]) -> List[Dict]:
+    return sorted(vulnerabilities, key=_vuln_score, reverse=True)
+
+
+def risk_level_for_score(score: int) -> str:
+    if score >= 9:
+        return "critical"
+    if score >= 7:
+        return "high"
+    if score >= 4:
+        return "medium"
+    return "low"
+
+
+def heuristic_risk_assessment(scan_data: Dict) -> Dict:
+    """Deterministic risk score (1-10), level and recommendations from the scan data."""
+    vulnerabilities = _ranked_vulnerabilities(scan_data.get("vulnerabilities", []))
+    open_ports = scan_data.get("open_ports", 0)
+    cves_found = scan_data.get("cves_found", 0)
+
+    if vulnerabilities or cves_found:
+        top_score = _vuln_score(vulnerabilities[0]) if vulnerabilities else SEVERITY_SCORES["medium"]
+        score = top_score * 0.8 + min(2.0, cves_found * 0.25) + min(1.0, open_ports * 0.05)
+    else:
+        score = 1 + min(3, open_ports // 5)
+    risk_score = max(1, min(10, round(score)))
+
+    recommendations = []
+    for vuln in vulnerabilities[:PROMPT_TOP_VULNERABILITIES]:
+        recommendations.append(
+            f"Patch or upgrade {vuln.get('service', 'the affected service')} on port {vuln.get('port', 'N/A')} "
+            f"to fix {vuln.get('cve_id')} ({vuln.get('severity', 'unknown')} severity)"
+        )
+
+    ports = set()
+    for service in scan_data.get("services", []):
+        try:
+            ports.add(int(service.get("port")))
+        except (TypeError, ValueError):
+            continue
+    cleartext = sorted({name for port, name in CLEARTEXT_PORTS.items() if port in ports})
+    if cleartext:
+        recommendations.append(f"Replace cleartext protocols ({', '.join(cleartext)}) with encrypted alternatives such as SSH/SFTP")
+    if open_ports > 10:
+        recommendations.append("Reduce the exposed attack surface by closing or firewalling services that are not required")
+    recommendations.append("Re-scan the target after remediation to verify the fixes")
+
+    return {
+        "risk_score": risk_score,
+        "risk_level": risk_level_for_score(risk_score),
+        "recommendations": recommendations
+    }
+
+
+def build_risk_prompt(scan_data: Dict) -> str:
+    """Compact risk-assessment prompt: summary counts plus the few most severe vulnerabilities."""
+    top_vulns = [
+        {
+            "port": v.get("port"),
+            "service": v.get("service"),
+            "cve_id": v.get("cve_id"),
+            "severity": v.get("severity"),
+            "cvss_score": v.get("cvss_score")
+        }
+        for v in _ranked_vulnerabilities(scan_data.get("vulnerabilities", []))[:PROMPT_TOP_VULNERABILITIES]
+    ]
+    severity_counts: Dict[str, int] = {}
+    for vuln in scan_data.get("vulnerabilities", []):
+        severity = str(vuln.get("severity", "unknown")).lower()
+        severity_counts[severity] = severity_counts.get(severity, 0) + 1
+
+    return f"""Assess the security risk of this network scan.
+
+Target: {scan_data['target']} | {scan_data['scan_type']} scan
+Open ports: {scan_data['open_ports']}/{scan_data['ports_scanned']} | CVEs: {scan_data['cves_found']} | Severity counts: {json.dumps(severity_counts)}
+OS: {scan_data.get('os_details', {}).get('name', 'Unknown')}
+Most severe vulnerabilities: {json.dumps(top_vulns)}
+
+risk_score must be a NUMBER between 1-10 based on the number and severity of CVEs and the exposed ports.
+risk_level must be one of: "low", "medium", "high", "critical".
+Give at most 6 specific security recommendations.
+
+Return ONLY JSON: {{"risk_score": 7, "risk_level": "high", "recommendations": ["..."]}}"""
+
+
+def parse_risk_assessment(response_text: str) -> Optional[Dict]:
+    """Validate the LLM's risk assessment; None if it is unusable."""
+    start, end = response_text.find("{"), response_text.rfind("}") + 1
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(response_text[start:end])
+        risk_score = max(1, min(10, round(float(data["risk_score"]))))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+    risk_level = str(data.get("risk_level", "")).lower()
+    if risk_level not in RISK_LEVELS:
+        risk_level = risk_level_for_score(risk_score)
+    recommendations = [str(r) for r in data.get("recommendations", []) if r][:10]
+    if not recommendations:
+        return None
+    return {"risk_score": risk_score, "risk_level": risk_level, "recommendations": recommendations}
+
+
+def build_scan_results(scan_data: Dict, risk_assessment: Dict) -> Dict:
+    """Assemble the scan_results_json document (same layout the report pipeline already reads)."""
+    return {
+        "summary": {
+            "target": scan_data["target"],
+            "scan_type": scan_data["scan_type"],
+            "scan_duration": scan_data["scan_duration"],
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ports_scanned": scan_data["ports_scanned"],
+            "open_ports": scan_data["open_ports"],
+            "critical_ports": scan_data["critical_ports"],
+            "vulnerable_ports": scan_data["vulnerable_ports"],
+            "cves_found": scan_data["cves_found"],
+            "risk_score": risk_assessment["risk_score"],
+            "risk_level": risk_assessment["risk_level"],
+            "user_id": scan_data.get("user_id", "")
+        },
+        "scan_coverage": scan_data["scan_coverage"],
+        "os_information": scan_data["os_details"] if scan_data["os_details"] else {},
+        "risk_assessment": {
+            "risk_score": risk_assessment["risk_score"],
+            "risk_level": risk_assessment["risk_level"],
+            "recommendations": risk_assessment["recommendations"],
+            "source": risk_assessment.get("source", "heuristic")
+        },
+        "services": scan_data["services"],
+        "gpt_selected_services": scan_data["gpt_selected_services"],
+        "vulnerabilities": scan_data["vulnerabilities"]
+    }
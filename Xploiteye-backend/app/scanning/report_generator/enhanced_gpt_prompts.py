@@ -5,17 +5,49 @@ Written from a Senior Security Consultant perspective
 
 import openai
 import os
+import hashlib
 import json
+import time
+from threading import Lock
 from dotenv import load_dotenv
 
+from config.settings import settings
+from app.scanning.scan_metrics import llm_span
+from .section_cache import get_section_cache, section_key
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Failures worth another attempt: timeouts, dropped connections, rate limits, server errors
+RETRYABLE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# Seconds before the first retry; doubles with each further attempt
+RETRY_BACKOFF_SECONDS = 2
+
+GPT_MODEL = "gpt-3.5-turbo"
+
+# Bump when a change outside the prompt text (system prompt, max_tokens, post-processing)
+# should invalidate cached vulnerability analyses; prompt text changes are detected
+VULNERABILITY_ANALYSIS_TEMPLATE_VERSION = "1"
+
+# Shared client with SDK retries off (call_gpt is the only retry layer); created on first use
+_openai_client = None
+_openai_client_lock = Lock()
+
+# Asset-specific values are kept out of cached analyses and filled in per report
+TARGET_PLACEHOLDER = "[[TARGET_IP]]"
+OS_PLACEHOLDER = "[[TARGET_OS]]"
+PORT_PLACEHOLDER = "[[TARGET_PORT]]"
+
 
 def call_gpt(prompt, content, max_tokens=3000):
     """
     Call GPT-3.5-turbo with security expert system prompt
 
+    Each request is limited to settings.report_gpt_timeout_seconds and retried
+    with backoff (up to settings.report_gpt_max_attempts tries) on timeouts,
+    connection errors, rate limits and server errors.
+
     Args:
         prompt: The specific task prompt
         content: The scan data/content to analyze
@@ -24,26 +56,53 @@ def call_gpt(prompt, content, max_tokens=3000):
     Returns:
         str: GPT response content
     """
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a CISSP-certified Senior Security Consultant with 15+ years of experience in vulnerability assessment and penetration testing. You write professional, board-ready security reports following ISO 27001 and NIST standards. Your tone is authoritative, technical, and business-focused."
-                },
-                {
-                    "role": "user",
-                    "content": f"{prompt}\n\nData to analyze:\n{content}"
-                }
-            ],
-            temperature=0.3,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"GPT Error: {str(e)}")
-        return f"Error generating content: {str(e)}"
+    attempts = max(1, settings.report_gpt_max_attempts)
+    for attempt in range(1, attempts + 1):
+        try:
+            with llm_span("report_section"):
+                return _request_completion(prompt, content, max_tokens)
+        except RETRYABLE_ERRORS as e:
+            if attempt == attempts:
+                print(f"GPT Error: {str(e)}")
+                return f"Error generating content: {str(e)}"
+            print(f"GPT request failed ({type(e).__name__}), retrying ({attempt}/{attempts})...")
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        except Exception as e:
+            print(f"GPT Error: {str(e)}")
+            return f"Error generating content: {str(e)}"
+
+
+def get_openai_client():
+    """Get or create the report OpenAI client (no SDK retries, report_gpt_timeout_seconds per request)"""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            _openai_client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=settings.report_gpt_timeout_seconds
+            )
+        return _openai_client
+
+
+def _request_completion(prompt, content, max_tokens):
+    """One chat completion request for call_gpt"""
+    response = get_openai_client().chat.completions.create(
+        model=GPT_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a CISSP-certified Senior Security Consultant with 15+ years of experience in vulnerability assessment and penetration testing. You write professional, board-ready security reports following ISO 27001 and NIST standards. Your tone is authoritative, technical, and business-focused."
+            },
+            {
+                "role": "user",
+                "content": f"{prompt}\n\nData to analyze:\n{content}"
+            }
+        ],
+        temperature=0.3,
+        max_tokens=max_tokens
+    )
+    return response.choices[0].message.content.strip()
 
 
 def generate_executive_summary(scan_data_json, txt_content):
@@ -197,6 +256,10 @@ def generate_detailed_vulnerability_analysis(vuln, txt_cve_details, scan_summary
     """
     Generate detailed analysis for a single vulnerability
 
+    The analysis is written once per (CVE, service, version, template, model) with
+    placeholders for the target's IP, OS and port, cached (see section_cache) and
+    filled in with this report's values, so recurring CVEs cost no LLM call.
+
     Args:
         vuln: Vulnerability dict from JSON
         txt_cve_details: Extracted details from TXT file for this CVE
@@ -205,6 +268,60 @@ def generate_detailed_vulnerability_analysis(vuln, txt_cve_details, scan_summary
     Returns:
         str: Markdown formatted detailed vulnerability analysis
     """
+    template = vulnerability_analysis_template()
+    cache = get_section_cache(template)
+
+    def generate():
+        generic_vuln = {**vuln, 'port': PORT_PLACEHOLDER}
+        generic_summary = {'target': TARGET_PLACEHOLDER, 'os': OS_PLACEHOLDER}
+        prompt = vulnerability_analysis_prompt(generic_vuln, _without_asset_fields(txt_cve_details), generic_summary)
+        return call_gpt(prompt, "", max_tokens=3000)
+
+    if cache is None:
+        analysis = generate()
+    else:
+        key = section_key(
+            'vulnerability_analysis', vuln.get('cve_id'), vuln.get('service'), vuln.get('version'), template, GPT_MODEL
+        )
+        analysis = cache.get_or_generate(
+            key, template, vuln.get('cve_id', ''), generate,
+            is_cacheable=lambda content: not content.startswith("Error generating content")
+        )
+
+    return (analysis
+            .replace(TARGET_PLACEHOLDER, str(scan_summary.get('target', 'N/A')))
+            .replace(OS_PLACEHOLDER, str(scan_summary.get('os', 'Unknown')))
+            .replace(PORT_PLACEHOLDER, str(vuln.get('port', 'N/A'))))
+
+
+def vulnerability_analysis_template():
+    """
+    Fingerprint of the vulnerability analysis prompt: the template version plus a
+    hash of the prompt rendered for a fixed sample, so editing the prompt text
+    invalidates cached analyses
+    """
+    sample = vulnerability_analysis_prompt(
+        {'cve_id': 'CVE-0000-0000', 'severity': 'high', 'cvss_score': '0.0', 'port': PORT_PLACEHOLDER, 'service': 'sample'},
+        "{}",
+        {'target': TARGET_PLACEHOLDER, 'os': OS_PLACEHOLDER}
+    )
+    digest = hashlib.sha256(sample.encode()).hexdigest()[:16]
+    return f"v{VULNERABILITY_ANALYSIS_TEMPLATE_VERSION}-{digest}"
+
+
+def _without_asset_fields(txt_cve_details):
+    """CVE details JSON without the scanned port, which the cached analysis leaves as a placeholder"""
+    try:
+        details = json.loads(txt_cve_details)
+    except (TypeError, ValueError):
+        return txt_cve_details
+    if isinstance(details, dict):
+        details.pop('port', None)
+    return json.dumps(details, indent=2)
+
+
+def vulnerability_analysis_prompt(vuln, txt_cve_details, scan_summary):
+    """Prompt for generate_detailed_vulnerability_analysis"""
     prompt = f"""
 As a Senior Penetration Tester, provide a comprehensive technical analysis for this vulnerability.
 
@@ -314,8 +431,7 @@ IMPORTANT:
 - Write in a professional, authoritative tone
 - Include real commands and version numbers where applicable
 """
-
-    return call_gpt(prompt, "", max_tokens=3000)
+    return prompt
 
 
 def generate_compliance_assessment(scan_data_json, vulnerabilities):
@@ -184,7 +184,7 @@ def generate_full_report(txt_content):
     return "\n".join(sections)
 
 
-def generate_iso_report(json_file_path, txt_file_path, output_pdf_path):
+def generate_iso_report(json_file_path, cve_file_path, output_pdf_path):
     """
     Generate professional ISO-standard security report with charts and professional formatting
 
@@ -193,11 +193,11 @@ def generate_iso_report(json_file_path, txt_file_path, output_pdf_path):
 
     Args:
         json_file_path: Path to JSON scan results file
-        txt_file_path: Path to TXT CVE details file
+        cve_file_path: Path to CVE records (.jsonl) or legacy TXT CVE details file
         output_pdf_path: Path where PDF should be saved
 
     Returns:
         dict: Status, message, and report details
     """
     from .iso_report_generator import generate_iso_standard_report
-    return generate_iso_standard_report(json_file_path, txt_file_path, output_pdf_path)
\ No newline at end of file
+    return generate_iso_standard_report(json_file_path, cve_file_path, output_pdf_path)
\ No newline at end of file
@@ -6,8 +6,13 @@ Coordinates data parsing, GPT analysis, chart generation, and PDF creation
 import json
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from config.settings import settings
+from app.scanning.cve_records import is_records_file, read_jsonl, render_report_text, to_iso_details
+
 # Import our new modules
 from .enhanced_gpt_prompts import (
     generate_executive_summary,
@@ -30,6 +35,7 @@ from .chart_generators import (
 def parse_txt_cve_details(txt_content):
     """
     Parse TXT file to extract detailed CVE information for each vulnerability
+    (legacy scans that predate the JSON Lines CVE records)
 
     Args:
         txt_content: Complete TXT file content
@@ -161,13 +167,102 @@ def calculate_severity_counts(vulnerabilities):
     return counts
 
 
-def generate_iso_standard_report(json_file_path, txt_file_path, output_pdf_path):
+def load_cve_details(scan_data_json, cve_file_path):
+    """
+    Load the per-CVE details of a scan
+
+    Args:
+        scan_data_json: Parsed JSON scan results
+        cve_file_path: CVE records (.jsonl) or, for older scans, TXT CVE details
+
+    Returns:
+        tuple: (CVE ID -> detailed info mapping, report text)
+    """
+    if is_records_file(cve_file_path):
+        records = read_jsonl(cve_file_path)
+        cve_details = {r['cve_id']: to_iso_details(r) for r in records if r.get('cve_id')}
+        return cve_details, render_report_text(scan_data_json, records)
+
+    with open(cve_file_path, 'r', encoding='utf-8') as f:
+        txt_content = f.read()
+    return parse_txt_cve_details(txt_content), txt_content
+
+
+def generate_gpt_sections(scan_data_json, txt_content, txt_cve_details, complete_vulnerabilities):
+    """
+    Generate the GPT-written report sections concurrently
+
+    Every section (and each critical/high CVE analysis) is an independent request;
+    they run on a pool of settings.report_gpt_concurrency threads, each request
+    with its own timeout and retries (see call_gpt), so the report waits about as
+    long as its slowest section. Results are assembled in the fixed report order.
+
+    Args:
+        scan_data_json: Parsed JSON scan results (with complete_vulnerabilities)
+        txt_content: Report text of the CVE details
+        txt_cve_details: CVE ID -> detailed info mapping
+        complete_vulnerabilities: Merged vulnerability objects
+
+    Returns:
+        dict: Section name -> generated content ('vulnerability_details' is a list)
+    """
+    # (section, label, function, args) in report order
+    requests = [
+        ('executive_summary', 'Executive Summary', generate_executive_summary, (scan_data_json, txt_content)),
+        ('methodology', 'Methodology Section', generate_methodology_section, (scan_data_json,)),
+        ('technical_summary', 'Technical Summary', generate_technical_summary,
+         (scan_data_json.get('services', []), complete_vulnerabilities))
+    ]
+
+    # Detailed vulnerability analysis for each critical/high CVE
+    for vuln in complete_vulnerabilities:
+        if vuln.get('severity', '').lower() in ['critical', 'high']:
+            txt_details = txt_cve_details.get(vuln.get('cve_id', ''), {})
+            requests.append((
+                'vulnerability_details',
+                f"Vulnerability Analysis {vuln.get('cve_id', 'Unknown')}",
+                generate_detailed_vulnerability_analysis,
+                (vuln, json.dumps(txt_details, indent=2), scan_data_json.get('summary', {}))
+            ))
+
+    requests += [
+        ('compliance', 'Compliance Assessment', generate_compliance_assessment, (scan_data_json, complete_vulnerabilities)),
+        ('remediation', 'Remediation Roadmap', generate_remediation_roadmap, (scan_data_json, complete_vulnerabilities))
+    ]
+
+    started = time.perf_counter()
+    workers = max(1, min(settings.report_gpt_concurrency, len(requests)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-gpt") as executor:
+        futures = []
+        for section, label, function, args in requests:
+            print(f"  ✍️  {label}...")
+            futures.append(executor.submit(function, *args))
+
+        gpt_sections = {'vulnerability_details': []}
+        for (section, label, _, _), future in zip(requests, futures):
+            try:
+                content = future.result()
+            except Exception as e:
+                print(f"  ⚠️  {label} failed: {str(e)}")
+                content = f"Error generating content: {str(e)}"
+            if section == 'vulnerability_details':
+                gpt_sections['vulnerability_details'].append(content)
+            else:
+                gpt_sections[section] = content
+
+    print(f"✅ {len(requests)} AI sections generated in {time.perf_counter() - started:.1f}s ({workers} concurrent)")
+    # Keep the historical key order: the CVE analyses come after the technical summary
+    order = ['executive_summary', 'methodology', 'technical_summary', 'vulnerability_details', 'compliance', 'remediation']
+    return {key: gpt_sections[key] for key in order}
+
+
+def generate_iso_standard_report(json_file_path, cve_file_path, output_pdf_path):
     """
     Main function to generate complete ISO-standard security report
 
     Args:
         json_file_path: Path to JSON scan results
-        txt_file_path: Path to TXT CVE details
+        cve_file_path: Path to CVE records (.jsonl) or legacy TXT CVE details
         output_pdf_path: Path to save PDF report
 
     Returns:
@@ -181,12 +276,9 @@ def generate_iso_standard_report(json_file_path, txt_file_path, output_pdf_path)
         with open(json_file_path, 'r', encoding='utf-8') as f:
             scan_data_json = json.load(f)
 
-        with open(txt_file_path, 'r', encoding='utf-8') as f:
-            txt_content = f.read()
-
-        # 2. Parse TXT for detailed CVE info
-        print("🔍 Parsing CVE details from TXT...")
-        txt_cve_details = parse_txt_cve_details(txt_content)
+        # 2. Load detailed CVE info
+        print("🔍 Loading CVE details...")
+        txt_cve_details, txt_content = load_cve_details(scan_data_json, cve_file_path)
 
         # 3. Merge JSON and TXT data
         print("🔗 Merging JSON and TXT data...")
@@ -199,56 +291,9 @@ def generate_iso_standard_report(json_file_path, txt_file_path, output_pdf_path)
         print("📈 Calculating severity metrics...")
         severity_counts = calculate_severity_counts(complete_vulnerabilities)
 
-        # 5. Generate GPT-powered sections
+        # 5. Generate GPT-powered sections (concurrently, assembled in report order)
         print("🤖 Generating AI-powered analysis sections...")
-        gpt_sections = {}
-
-        # Executive Summary
-        print("  ✍️  Executive Summary...")
-        gpt_sections['executive_summary'] = generate_executive_summary(
-            scan_data_json, txt_content
-        )
-
-        # Methodology
-        print("  ✍️  Methodology Section...")
-        gpt_sections['methodology'] = generate_methodology_section(scan_data_json)
-
-        # Technical Summary
-        print("  ✍️  Technical Summary...")
-        gpt_sections['technical_summary'] = generate_technical_summary(
-            scan_data_json.get('services', []),
-            complete_vulnerabilities
-        )
-
-        # Detailed vulnerability analysis for each CVE
-        print("  ✍️  Detailed Vulnerability Analysis...")
-        gpt_sections['vulnerability_details'] = []
-        for vuln in complete_vulnerabilities:
-            if vuln.get('severity', '').lower() in ['critical', 'high']:
-                print(f"    🔎 Analyzing {vuln.get('cve_id', 'Unknown')}...")
-                txt_details = txt_cve_details.get(vuln.get('cve_id', ''), {})
-                txt_details_str = json.dumps(txt_details, indent=2)
-
-                vuln_analysis = generate_detailed_vulnerability_analysis(
-                    vuln,
-                    txt_details_str,
-                    scan_data_json.get('summary', {})
-                )
-                gpt_sections['vulnerability_details'].append(vuln_analysis)
-
-        # Compliance Assessment
-        print("  ✍️  Compliance Assessment...")
-        gpt_sections['compliance'] = generate_compliance_assessment(
-            scan_data_json,
-            complete_vulnerabilities
-        )
-
-        # Remediation Roadmap
-        print("  ✍️  Remediation Roadmap...")
-        gpt_sections['remediation'] = generate_remediation_roadmap(
-            scan_data_json,
-            complete_vulnerabilities
-        )
+        gpt_sections = generate_gpt_sections(scan_data_json, txt_content, txt_cve_details, complete_vulnerabilities)
 
         # 6. Generate charts (keep as Drawing objects, no PNG conversion)
         print("📊 Generating visual charts...")
@@ -0,0 +1,136 @@
+"""
+Report section cache
+SQLite-backed, content-addressed cache of GPT-written report sections. A section
+is keyed by a hash of what determines its text (for CVE analyses: CVE id,
+service, version, prompt template and model), so a recurring CVE is written once
+and reused by every report of every user until its TTL runs out or the template
+changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+from config.settings import settings
+
+
+def section_key(*parts) -> str:
+    """Content address of a section: SHA-256 of its normalized inputs."""
+    normalized = [str(part or "").strip().lower() for part in parts]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+class ReportSectionCache:
+    """
+    Disk-backed cache of generated report sections.
+
+    Entries carry the template fingerprint they were written with; entries of
+    other templates can never be hit again and are purged when the cache opens.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._key_locks: Dict[str, Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS report_sections (
+                       section_key TEXT PRIMARY KEY,
+                       label TEXT,
+                       template TEXT NOT NULL,
+                       content TEXT NOT NULL,
+                       created_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached section content, or None on a miss or expired entry."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM report_sections WHERE section_key = ?", (key,)
+            ).fetchone()
+            if row is not None and time.time() - row[1] <= self.ttl_seconds:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, content: str, template: str, label: str = ""):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO report_sections (section_key, label, template, content, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, label, template, content, time.time())
+                )
+                self._conn.commit()
+                self.stores += 1
+            except sqlite3.Error as e:
+                logging.error(f"Failed to store report section '{label}': {e}")
+
+    def get_or_generate(self, key: str, template: str, label: str, generate: Callable[[], str],
+                        is_cacheable: Callable[[str], bool] = lambda content: True) -> str:
+        """
+        Cached content for key, or generate, store and return it. Concurrent
+        requests for the same key (the same CVE on several ports) wait for the
+        first one instead of generating it again.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, Lock())
+        with key_lock:
+            content = self.get(key)
+            if content is None:
+                content = generate()
+                if is_cacheable(content):
+                    self.put(key, content, template, label)
+        return content
+
+    def purge(self, template: str) -> int:
+        """Delete expired entries and entries written with another template; returns how many."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM report_sections WHERE template != ? OR created_at < ?",
+                (template, time.time() - self.ttl_seconds)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM report_sections").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "entries": entries}
+
+
+# Global cache instance (created under a lock: report sections are generated from pool threads)
+_section_cache = None
+_section_cache_lock = Lock()
+
+
+def get_section_cache(template: str) -> Optional[ReportSectionCache]:
+    """Get or create the report section cache (None when disabled or unavailable)."""
+    global _section_cache
+    with _section_cache_lock:
+        if _section_cache is None and settings.report_section_cache_enabled:
+            db_path = settings.report_section_cache_path or os.path.join(settings.results_dir, "report_section_cache.sqlite3")
+            try:
+                _section_cache = ReportSectionCache(db_path, ttl_seconds=settings.report_section_cache_ttl_days * 86400)
+                purged = _section_cache.purge(template)
+                logging.info(f"🗄️ Report section cache ready: {db_path} ({purged} stale entries purged)")
+            except Exception as e:
+                logging.error(f"Report section cache unavailable, every section will be generated: {e}")
+                return None
+        return _section_cache
@@ -0,0 +1,161 @@
+"""
+Scan results cache
+In-process LRU of parsed scan results files keyed by path, mtime and size. Finished
+scans never change their results file, so each one is read, parsed and re-encoded
+as compact JSON once; the encoded body, its ETag and its compressed variants are
+kept with the entry and served as-is on every later request.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from config.settings import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_compact(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (no indentation), with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class CachedResults:
+    """One parsed results file with its compact encoding, ETag and compressed bodies."""
+
+    def __init__(self, data: Any, body: bytes):
+        self.data = data
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = Lock()
+
+    def encoded(self, encoding: str) -> bytes:
+        """Body compressed with "gzip" or "br" (computed once per entry)."""
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == "br" and brotli is not None:
+                    self._encoded[encoding] = brotli.compress(self.body, quality=5)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+            return self._encoded[encoding]
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(b) for b in self._encoded.values())
+
+
+def pick_encoding(accept_encoding: Optional[str], body_size: int) -> Optional[str]:
+    """Best supported content encoding the client accepts, or None for small bodies / no support."""
+    if not accept_encoding or body_size < settings.results_compress_min_bytes:
+        return None
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class ScanResultsCache:
+    """LRU of CachedResults keyed by (path, mtime_ns, size), bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int, int], CachedResults]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str) -> Optional[CachedResults]:
+        """Parsed results of a file (None if it is missing or not valid JSON)."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            with open(path, "rb") as f:
+                data = loads(f.read())
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to load scan results {path}: {e}")
+            return None
+
+        entry = CachedResults(data, dumps_compact(data))
+        with self._lock:
+            # A rewritten file gets a new key; drop the stale versions of the same path
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[stale]
+            self._entries[key] = entry
+            self._evict()
+        return entry
+
+    def _evict(self):
+        total = sum(entry.size for entry in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.size for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "encoder": "orjson" if orjson is not None else "json"
+            }
+
+
+# Global cache instance
+_results_cache = None
+
+
+def get_results_cache() -> ScanResultsCache:
+    """Get or create the process-wide results cache."""
+    global _results_cache
+    if _results_cache is None:
+        _results_cache = ScanResultsCache(
+            max_entries=max(1, settings.results_cache_max_entries),
+            max_bytes=settings.results_cache_max_mb * 1024 * 1024
+        )
+    return _results_cache
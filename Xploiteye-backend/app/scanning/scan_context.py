@@ -0,0 +1,304 @@
+"""
+Per-scan execution context for the network scanning engine.
+Keeps everything that belongs to one scan out of module globals so several
+scans can run side by side in the same process.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import signal
+import threading
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set
+
+from config.settings import settings
+
+
+# Spans kept per scan (nmap shards and VPN rotations are the only repeated ones)
+MAX_SPANS = 500
+
+
+class ScanContext:
+    """State owned by a single scan run (file paths, selected services, live progress)."""
+
+    def __init__(self, scan_id: str, target: str, scan_type: str, user_id: str = "unknown"):
+        self.scan_id = scan_id
+        self.target = target
+        self.scan_type = scan_type
+        self.user_id = user_id
+        self.created_at = time.time()
+
+        # CVE records (JSON Lines) written by the lookup and renamed by the report node
+        self.cve_records_path: Optional[str] = None
+
+        # Incremental rescans: last fingerprint of this target and the port changes found against it
+        self.incremental = False
+        self.baseline: Optional[Dict] = None
+        self.port_delta: Dict = {}
+
+        # nmap timing profile chosen from the measured RTT/loss (timing_profiles.TimingProfile)
+        self.timing = None
+
+        # Services selected for CVE lookup (backup for state issues)
+        self.selected_services: List[Dict] = []
+
+        # Live progress reported while the scan runs (phase, hosts and open ports found so far)
+        self.progress: Dict = {"phase": "starting", "hosts": {}, "open_ports": 0, "nmap": {}}
+        self._listeners: List[Callable[[str, Dict], None]] = []
+
+        # Timing breakdown: time spent per phase and the timed operations (see scan_metrics)
+        self.phase_timings: List[Dict] = []
+        self.spans: List[Dict] = []
+        self._phase_started = self.created_at
+
+        # Subprocesses and asyncio tasks this scan started; cancel() stops exactly these
+        self.cancel_event = threading.Event()
+        self._processes: Set[asyncio.subprocess.Process] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.cancellation: Optional[Dict] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def track_process(self, process: asyncio.subprocess.Process):
+        self._processes.add(process)
+
+    def untrack_process(self, process: asyncio.subprocess.Process):
+        self._processes.discard(process)
+
+    def track_task(self, task: asyncio.Task):
+        """Register a task running this scan's work; finished tasks drop out on their own."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cancel(self) -> Dict:
+        """
+        Stop this scan: cancel its tasks (their nmap runs terminate their own process
+        groups) and signal any subprocess still running. Lookups see cancel_event and
+        stop waiting. Returns what was abandoned.
+        """
+        if self.cancellation is not None:
+            return self.cancellation
+        self.cancel_event.set()
+
+        tasks = [task for task in self._tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        processes = [process for process in self._processes if process.returncode is None]
+        for process in processes:
+            signal_process_group(process, signal.SIGTERM)
+
+        self.cancellation = {
+            "phase": self.progress["phase"],
+            "elapsed_seconds": round(time.time() - self.created_at, 2),
+            "hosts_found": len(self.progress["hosts"]),
+            "open_ports_found": self.progress["open_ports"],
+            "nmap_percent": self.progress["nmap"].get("percent"),
+            "tasks_cancelled": len(tasks),
+            "processes_terminated": len(processes)
+        }
+        logging.info(f"🛑 Scan {self.scan_id} cancelled in phase {self.progress['phase']}: {self.cancellation}")
+        return self.cancellation
+
+    def add_listener(self, listener: Callable[[str, Dict], None]):
+        """Register a callback receiving (event_type, data) for every progress event."""
+        self._listeners.append(listener)
+
+    def emit(self, event_type: str, data: Dict):
+        """Send a progress event to all listeners; listener failures never break the scan."""
+        for listener in list(self._listeners):
+            try:
+                listener(event_type, data)
+            except Exception as e:
+                logging.error(f"Scan progress listener failed for {self.scan_id}: {e}")
+
+    def set_phase(self, phase: str):
+        """Record the workflow phase the scan has entered."""
+        self.end_phase()
+        self.progress["phase"] = phase
+        self.emit("phase", {"phase": phase})
+
+    def end_phase(self):
+        """Close the timing of the current phase (set_phase does this for the previous one)."""
+        now = time.time()
+        self.phase_timings.append({
+            "phase": self.progress["phase"],
+            "start": round(self._phase_started - self.created_at, 3),
+            "seconds": round(now - self._phase_started, 3)
+        })
+        self._phase_started = now
+
+    def add_span(self, span: Dict):
+        """Keep a finished span; very long scans stop recording after MAX_SPANS."""
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+
+    def record_port(self, ip: str, port_data: Dict):
+        """Record an open port as soon as nmap reports it."""
+        host = self.progress["hosts"].setdefault(ip or self.target, {"ports": {}, "os": ""})
+        key = f"{port_data.get('port')}/{port_data.get('protocol', 'tcp')}"
+        is_new = key not in host["ports"]
+        # Version scans report the same port again with service details; keep the richest entry
+        host["ports"][key] = {
+            "port": port_data.get("port"),
+            "protocol": port_data.get("protocol", "tcp"),
+            "service": port_data.get("service", ""),
+            "version": port_data.get("version", "")
+        }
+        if is_new:
+            self.progress["open_ports"] += 1
+        self.emit("port", {"ip": ip or self.target, **host["ports"][key]})
+
+    def record_host(self, host_data: Dict):
+        """Record a host once nmap has finished with it."""
+        ip = host_data.get("ip") or self.target
+        host = self.progress["hosts"].setdefault(ip, {"ports": {}, "os": ""})
+        if host_data.get("os"):
+            host["os"] = host_data["os"]
+        self.emit("host", {"ip": ip, "os": host["os"], "open_ports": len(host_data.get("ports", []))})
+
+    def record_nmap_progress(self, info: Dict):
+        """Record nmap's own task progress (from --stats-every)."""
+        self.progress["nmap"] = info
+        self.emit("nmap_progress", info)
+
+    def progress_snapshot(self) -> Dict:
+        """JSON-friendly copy of the live progress for status responses and Mongo."""
+        return {
+            "phase": self.progress["phase"],
+            "open_ports": self.progress["open_ports"],
+            "nmap": dict(self.progress["nmap"]),
+            "hosts": [
+                {"ip": ip, "os": host["os"], "ports": list(host["ports"].values())}
+                for ip, host in self.progress["hosts"].items()
+            ]
+        }
+
+
+def signal_process_group(process, sig: int) -> bool:
+    """
+    Signal a subprocess started with start_new_session=True and everything it spawned
+    (sudo and its nmap, vulnx children). Falls back to the process alone.
+    """
+    try:
+        # Only a group of its own; never signal the backend's process group
+        if os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+        return True
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        try:
+            process.send_signal(sig)
+            return True
+        except ProcessLookupError:
+            return False
+
+
+# Context of the scan running in the current task/thread. asyncio tasks and
+# asyncio.to_thread copy it automatically; plain executors must be given the context explicitly.
+_current_scan_context: contextvars.ContextVar[Optional[ScanContext]] = contextvars.ContextVar(
+    "current_scan_context", default=None
+)
+
+# Registry of running scans, keyed by scan_id
+_active_contexts: Dict[str, ScanContext] = {}
+
+
+def register_scan_context(ctx: ScanContext) -> contextvars.Token:
+    """Register a scan context and make it current for the calling task."""
+    _active_contexts[ctx.scan_id] = ctx
+    return _current_scan_context.set(ctx)
+
+
+def release_scan_context(ctx: ScanContext, token: Optional[contextvars.Token] = None):
+    """Remove a scan context from the registry once its scan has finished."""
+    _active_contexts.pop(ctx.scan_id, None)
+    if token is not None:
+        try:
+            _current_scan_context.reset(token)
+        except ValueError:
+            # Token created in a different context; nothing to reset here
+            pass
+
+
+def get_current_scan_context() -> Optional[ScanContext]:
+    """Get the scan context of the running task, if any."""
+    return _current_scan_context.get()
+
+
+def get_scan_context(scan_id: str) -> Optional[ScanContext]:
+    """Look up the context of a running scan."""
+    return _active_contexts.get(scan_id)
+
+
+def get_active_scan_count() -> int:
+    """Number of scans currently executing in this process."""
+    return len(_active_contexts)
+
+
+def get_running_process_count() -> int:
+    """Subprocesses (nmap runs) the running scans have started and that are still alive."""
+    return sum(
+        1 for ctx in list(_active_contexts.values()) for process in list(ctx._processes) if process.returncode is None
+    )
+
+
+# --- SCAN CONCURRENCY LIMIT ---
+_scan_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_scan_slots() -> asyncio.Semaphore:
+    """Get the semaphore that caps how many scans run at once in this process."""
+    global _scan_slots
+    if _scan_slots is None:
+        _scan_slots = asyncio.Semaphore(max(1, settings.max_concurrent_network_scans))
+    return _scan_slots
+
+
+# --- SHARED VPN ROTATION STATE ---
+class VpnRotationState:
+    """
+    Host-wide VPN rotation bookkeeping.
+
+    The VPN tunnel belongs to the host's public IP, not to a scan, so this state is
+    shared by every CVE lookup in the process. The ground truth
+    IP is established when the first lookup starts and the VPN is disconnected when
+    the last one finishes, instead of every scan resetting it for everybody.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.cycle_index = -1
+        self.true_public_ip: Optional[str] = None
+        self.active_lookups = 0
+
+    def acquire(self, establish_ip) -> Optional[str]:
+        """Register a CVE lookup run, establishing the ground truth IP if it is the first one."""
+        with self.lock:
+            if self.active_lookups == 0 or not self.true_public_ip:
+                self.cycle_index = -1
+                self.true_public_ip = establish_ip()
+            if self.true_public_ip:
+                self.active_lookups += 1
+            return self.true_public_ip
+
+    def release(self, disconnect) -> bool:
+        """Unregister a CVE lookup run; the last run out disconnects the VPN."""
+        with self.lock:
+            self.active_lookups = max(0, self.active_lookups - 1)
+            if self.active_lookups > 0:
+                logging.info(f"🔌 {self.active_lookups} CVE lookup(s) still running, keeping VPN state")
+                return False
+            self.cycle_index = -1
+            disconnect()
+        return True
+
+
+vpn_rotation = VpnRotationState()
@@ -0,0 +1,122 @@
+"""
+Scan event stream
+Per-scan log of progress events (phase changes, hosts, open ports and services,
+nmap progress, CVE counts, status changes) numbered with increasing sequence
+numbers. The scan's progress listener publishes into it and the SSE endpoint reads
+from it; a client that reconnects resumes after the last sequence number it saw.
+Logs stay around for a while after the scan ends so late clients get the final event.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+# Status values that end a stream
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "completed_file_missing"}
+
+
+class ScanEventLog:
+    """Bounded, resumable event log of one scan. Created on the event loop; publish() is thread-safe."""
+
+    def __init__(self, scan_id: str, user_id: str, max_events: int):
+        self.scan_id = scan_id
+        self.user_id = str(user_id)
+        self.events: deque = deque(maxlen=max_events)
+        self.seq = 0
+        self.closed_at: Optional[float] = None
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+    def publish(self, event_type: str, data: Dict):
+        """Append an event; callable from the event loop or from worker threads."""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._append(event_type, data)
+        else:
+            self._loop.call_soon_threadsafe(self._append, event_type, data)
+
+    def close(self, status_data: Dict):
+        """Publish the final status event; subscribers end their stream after it."""
+        self.publish("status", {**status_data, "final": True})
+
+    def _append(self, event_type: str, data: Dict):
+        if self.closed_at is not None:
+            return
+        self.seq += 1
+        self.events.append({"id": self.seq, "event": event_type, "data": data, "at": time.time()})
+        if event_type == "status" and data.get("final"):
+            self.closed_at = time.time()
+        # Wake every waiting subscriber; later waits use a fresh event
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def events_after(self, last_seq: int) -> Tuple[List[Dict], bool]:
+        """Events newer than last_seq, and whether some were already dropped from the buffer."""
+        events = [event for event in self.events if event["id"] > last_seq]
+        missed = bool(self.events) and self.events[0]["id"] > last_seq + 1
+        return events, missed
+
+    async def subscribe(self, last_seq: int = 0, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """
+        Yield events after last_seq as they are published, None as a keep-alive when
+        nothing happened for `heartbeat` seconds; ends after the final status event.
+        A {"event": "resync"} marker precedes the events when the buffer no longer
+        holds everything after last_seq.
+        """
+        events, missed = self.events_after(last_seq)
+        if missed:
+            yield {"id": last_seq, "event": "resync", "data": {"oldest_id": self.events[0]["id"]}}
+        while True:
+            for event in events:
+                yield event
+                last_seq = event["id"]
+                if event["event"] == "status" and event["data"].get("final"):
+                    return
+            if self.closed_at is not None:
+                return
+            # Nothing is published between reading the events and taking the wakeup (same loop)
+            wakeup = self._wakeup
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+            events, _ = self.events_after(last_seq)
+
+
+def format_sse(event: Optional[Dict]) -> str:
+    """Render an event (or a keep-alive for None) in text/event-stream format."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+# Event logs of running and recently finished scans, keyed by scan_id (or batch_id)
+_event_logs: Dict[str, ScanEventLog] = {}
+
+
+def _prune_event_logs():
+    cutoff = time.time() - settings.scan_event_retention_seconds
+    for scan_id, event_log in list(_event_logs.items()):
+        if event_log.closed_at is not None and event_log.closed_at < cutoff:
+            del _event_logs[scan_id]
+
+
+def open_scan_event_log(scan_id: str, user_id: str) -> ScanEventLog:
+    """Create the event log of a new scan. Must be called on the event loop."""
+    _prune_event_logs()
+    event_log = ScanEventLog(scan_id, user_id, max(1, settings.scan_event_buffer_size))
+    _event_logs[scan_id] = event_log
+    return event_log
+
+
+def get_scan_event_log(scan_id: str) -> Optional[ScanEventLog]:
+    """Event log of a running or recently finished scan started by this process."""
+    _prune_event_logs()
+    return _event_logs.get(scan_id)
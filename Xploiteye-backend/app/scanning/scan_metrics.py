@@ -0,0 +1,242 @@
+"""
+Scan metrics
+Span-style timings for the scanning engine and the process-wide metrics served
+on /scanning/metrics in the Prometheus text format.
+
+Every timed operation (workflow node, tool, nmap pass, CVE lookup pass, VPN
+rotation, LLM call) is recorded as a span on the scan's context, which is stored
+with the scan as its timing breakdown, and observed in a latency histogram.
+Phase durations (ScanContext.set_phase) are observed once the scan finishes.
+"""
+
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.scanning.cve_scheduler import get_cve_scheduler
+from app.scanning.results_cache import get_results_cache
+from app.scanning.scan_context import (
+    ScanContext, get_active_scan_count, get_current_scan_context, get_running_process_count
+)
+
+# Bucket upper bounds in seconds: sub-second LLM and vulnx calls up to hour-long deep scans
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    rendered = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return f"{{{rendered}}}" if rendered else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram keyed by label values (thread-safe)."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], Dict] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                pairs = list(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_labels(pairs)} {round(series['sum'], 6)}")
+                lines.append(f"{self.name}_count{_labels(pairs)} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic Prometheus counter keyed by label values (thread-safe)."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(zip(self.label_names, key))} {_number(value)}")
+        return lines
+
+
+def render_values(name: str, help_text: str, value, metric_type: str = "gauge") -> List[str]:
+    """Lines for a single value or a {label_value: value} dict (labelled "kind")."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    if isinstance(value, dict):
+        lines += [f"{name}{_labels([('kind', kind)])} {_number(v)}" for kind, v in sorted(value.items())]
+    else:
+        lines.append(f"{name} {_number(value)}")
+    return lines
+
+
+SPAN_SECONDS = Histogram(
+    "xploiteye_scan_span_seconds",
+    "Duration of timed scan operations (workflow nodes, tools, nmap passes, CVE passes, VPN rotations, LLM calls)",
+    ("span", "status")
+)
+PHASE_SECONDS = Histogram("xploiteye_scan_phase_seconds", "Time finished scans spent in each phase", ("scan_type", "phase"))
+SCAN_SECONDS = Histogram("xploiteye_scan_duration_seconds", "End-to-end duration of finished scans", ("scan_type", "status"))
+LLM_SECONDS = Histogram("xploiteye_llm_request_seconds", "Latency of LLM calls made by the scanning engine", ("purpose", "status"))
+CVE_QUERY_SECONDS = Histogram(
+    "xploiteye_cve_query_seconds", "Time from queuing a vulnx CVE query to its answer (queue wait included)", ("pass",)
+)
+SCANS_TOTAL = Counter("xploiteye_scans_total", "Finished scans by type and final status", ("scan_type", "status"))
+
+
+def record_span(name: str, started_at: float, seconds: float, status: str = "ok",
+                ctx: Optional[ScanContext] = None, **attrs):
+    """Observe a finished span and keep it on the scan's context (if there is one)."""
+    SPAN_SECONDS.observe(seconds, span=name, status=status)
+    if ctx is not None:
+        ctx.add_span({
+            "name": name,
+            "start": round(started_at - ctx.created_at, 3),
+            "seconds": round(seconds, 3),
+            "status": status,
+            **attrs
+        })
+
+
+@contextmanager
+def span(name: str, ctx: Optional[ScanContext] = None, **attrs):
+    """
+    Time the enclosed block as a span of the current scan (or of ctx). Yields the
+    span's attribute dict; callers may add attributes, and a "status" entry
+    overrides the ok/error/cancelled status derived from how the block ended.
+    """
+    ctx = ctx or get_current_scan_context()
+    started_at, started = time.time(), time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        status = attrs.pop("status", status)
+        record_span(name, started_at, time.perf_counter() - started, status, ctx, **attrs)
+
+
+@contextmanager
+def llm_span(purpose: str):
+    """span() for an LLM call that also feeds the LLM latency histogram."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with span(f"llm.{purpose}") as attrs:
+            yield attrs
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - started, purpose=purpose, status=status)
+
+
+def timed(name: str):
+    """Decorator timing every call of an async function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def scan_timings(ctx: ScanContext) -> Dict:
+    """Timing breakdown stored with a scan: phases, per-span totals and the spans themselves."""
+    totals: Dict[str, Dict] = {}
+    for entry in ctx.spans:
+        total = totals.setdefault(entry["name"], {"count": 0, "seconds": 0.0})
+        total["count"] += 1
+        total["seconds"] = round(total["seconds"] + entry["seconds"], 3)
+    return {
+        "total_seconds": round(time.time() - ctx.created_at, 3),
+        "phases": list(ctx.phase_timings),
+        "totals": totals,
+        "spans": list(ctx.spans)
+    }
+
+
+def finish_scan_timings(ctx: ScanContext, status: str) -> Dict:
+    """Close the last phase, observe the scan's phase and total durations and return its timings."""
+    ctx.end_phase()
+    for phase in ctx.phase_timings:
+        PHASE_SECONDS.observe(phase["seconds"], scan_type=ctx.scan_type, phase=phase["phase"])
+    SCAN_SECONDS.observe(time.time() - ctx.created_at, scan_type=ctx.scan_type, status=status)
+    SCANS_TOTAL.inc(scan_type=ctx.scan_type, status=status)
+    return scan_timings(ctx)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format: live gauges, then counters and histograms."""
+    lines = render_values("xploiteye_active_scans", "Scans and batch scans running in this process", get_active_scan_count())
+    lines += render_values(
+        "xploiteye_scan_subprocesses", "nmap processes started by running scans that are still alive", get_running_process_count()
+    )
+
+    cve_scheduler = get_cve_scheduler()
+    if cve_scheduler is not None:
+        stats = cve_scheduler.stats()
+        lines += render_values("xploiteye_cve_queue_depth", "vulnx queries waiting for a worker", stats["queue_depth"])
+        lines += render_values("xploiteye_cve_queries_in_flight", "vulnx queries (subprocesses) running now", stats["in_flight"])
+        lines += render_values("xploiteye_cve_rate_limit_tokens", "vulnx rate-limit tokens left before a VPN rotation",
+                               stats["tokens_available"])
+        lines += render_values("xploiteye_cve_queries_total", "vulnx queries by outcome", {
+            kind: stats[kind] for kind in ("submitted", "coalesced", "executed", "rate_limited", "cancelled")
+        }, "counter")
+        lines += render_values("xploiteye_cve_bucket_refills_total", "Rate-limit budget refills (VPN rotations or window resets)",
+                               stats["bucket_refills"], "counter")
+
+    cache_stats = get_results_cache().stats()
+    lines += render_values("xploiteye_results_cache_entries", "Parsed scan results files held in memory", cache_stats["entries"])
+    lines += render_values("xploiteye_results_cache_bytes", "Memory used by cached scan results", cache_stats["bytes"])
+    lines += render_values("xploiteye_results_cache_requests_total", "Scan results cache lookups", {
+        "hit": cache_stats["hits"], "miss": cache_stats["misses"]
+    }, "counter")
+
+    for metric in (SCANS_TOTAL, SCAN_SECONDS, PHASE_SECONDS, SPAN_SECONDS, LLM_SECONDS, CVE_QUERY_SECONDS):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,154 @@
+"""
+Declarative scan plans
+Each scan type maps to a small DAG of scan tools. Plans are validated and compiled
+into execution stages once at startup, so choosing the tools for a scan is a dict
+lookup instead of an LLM call. Custom profiles (global or per user) can be loaded
+from the JSON file in settings.scan_profiles_file:
+
+    {
+        "profiles": {"light": {"description": "...", "steps": [{"tool": "...", "after": ["..."]}]}},
+        "users": {"<user_id>": {"medium": {"steps": [...]}}}
+    }
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from config.settings import settings
+
+# Built-in plans; "after" lists the steps whose results a tool needs
+BUILTIN_SCAN_PLANS = {
+    "light": {
+        "description": "Light Scan - connectivity, ports/OS and versions (1-1000 ports), HTTP check, CVE lookup",
+        "steps": [
+            {"tool": "host_connectivity_tool"},
+            {"tool": "light_scan_ports_os"},
+            {"tool": "light_scan_versions"},
+            {"tool": "http_service_tool"},
+            {"tool": "cvelook_light", "after": ["light_scan_versions"]}
+        ]
+    },
+    "medium": {
+        "description": "Medium Scan - ports/OS and versions (1-5000 ports), CVE lookup",
+        "steps": [
+            {"tool": "medium_scan_ports_os"},
+            {"tool": "medium_scan_versions"},
+            {"tool": "cvelook_medium", "after": ["medium_scan_versions"]}
+        ]
+    },
+    "deep": {
+        "description": "Deep Scan - ports/OS and versions (1-15000 ports), CVE lookup",
+        "steps": [
+            {"tool": "deep_scan_ports_os"},
+            {"tool": "deep_scan_versions"},
+            {"tool": "cvelook_deep", "after": ["deep_scan_versions"]}
+        ]
+    }
+}
+
+
+class ScanPlanError(ValueError):
+    """Raised when a scan plan references unknown tools or has a dependency cycle."""
+
+
+class CompiledScanPlan:
+    """A validated scan plan with its tools grouped into dependency-ordered stages."""
+
+    def __init__(self, name: str, description: str, stages: List[List[str]]):
+        self.name = name
+        self.description = description
+        self.stages = stages
+
+    @property
+    def tool_names(self) -> List[str]:
+        return [name for stage in self.stages for name in stage]
+
+
+def compile_scan_plan(name: str, plan: Dict, known_tools: Iterable[str]) -> CompiledScanPlan:
+    """Validate a plan definition and group its steps into stages (a topological layering)."""
+    known_tools = set(known_tools)
+    steps = plan.get("steps", [])
+    if not steps:
+        raise ScanPlanError(f"Scan plan '{name}' has no steps")
+
+    dependencies: Dict[str, List[str]] = {}
+    for step in steps:
+        tool_name = step.get("tool")
+        if tool_name not in known_tools:
+            raise ScanPlanError(f"Scan plan '{name}' uses unknown tool '{tool_name}'")
+        dependencies[tool_name] = list(step.get("after", []))
+
+    for tool_name, after in dependencies.items():
+        missing = [dep for dep in after if dep not in dependencies]
+        if missing:
+            raise ScanPlanError(f"Scan plan '{name}': '{tool_name}' depends on steps not in the plan: {missing}")
+        # CVE lookup consumes the version scan's services
+        if tool_name.startswith("cvelook_") and not any("versions" in dep for dep in after):
+            raise ScanPlanError(f"Scan plan '{name}': '{tool_name}' must run after a version scan step")
+
+    stages, placed = [], set()
+    while len(placed) < len(dependencies):
+        stage = [t for t, after in dependencies.items() if t not in placed and all(d in placed for d in after)]
+        if not stage:
+            raise ScanPlanError(f"Scan plan '{name}' has a dependency cycle")
+        stages.append(stage)
+        placed.update(stage)
+
+    return CompiledScanPlan(name, plan.get("description", name), stages)
+
+
+# Compiled plans, filled by load_scan_plans()
+_builtin_plans: Dict[str, CompiledScanPlan] = {}
+_custom_plans: Dict[str, CompiledScanPlan] = {}
+_user_plans: Dict[str, Dict[str, CompiledScanPlan]] = {}
+
+
+def _load_profiles_file(path: str, known_tools: set):
+    with open(path, "r", encoding="utf-8") as f:
+        profiles = json.load(f)
+
+    for name, plan in profiles.get("profiles", {}).items():
+        try:
+            _custom_plans[name.lower()] = compile_scan_plan(name, plan, known_tools)
+        except ScanPlanError as e:
+            logging.error(f"Skipping custom scan profile: {e}")
+
+    for user_id, user_profiles in profiles.get("users", {}).items():
+        for name, plan in user_profiles.items():
+            try:
+                _user_plans.setdefault(str(user_id), {})[name.lower()] = compile_scan_plan(name, plan, known_tools)
+            except ScanPlanError as e:
+                logging.error(f"Skipping scan profile for user {user_id}: {e}")
+
+
+def load_scan_plans(known_tools: Iterable[str]):
+    """Compile the built-in plans and any custom profiles. Called once when the workflow is built."""
+    known_tools = set(known_tools)
+    _builtin_plans.clear()
+    _custom_plans.clear()
+    _user_plans.clear()
+
+    for name, plan in BUILTIN_SCAN_PLANS.items():
+        _builtin_plans[name] = compile_scan_plan(name, plan, known_tools)
+
+    profiles_file = settings.scan_profiles_file
+    if profiles_file and os.path.exists(profiles_file):
+        try:
+            _load_profiles_file(profiles_file, known_tools)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Failed to load scan profiles from {profiles_file}: {e}")
+
+    logging.info(
+        f"📋 Scan plans compiled: {sorted(_builtin_plans)} built-in, {sorted(_custom_plans)} custom, "
+        f"{len(_user_plans)} users with own profiles"
+    )
+
+
+def get_scan_plan(scan_type: str, user_id: Optional[str] = None) -> Optional[CompiledScanPlan]:
+    """Plan for a scan type: the user's own profile first, then custom profiles, then built-ins."""
+    key = (scan_type or "").lower()
+    if user_id and key in _user_plans.get(str(user_id), {}):
+        return _user_plans[str(user_id)][key]
+    return _custom_plans.get(key) or _builtin_plans.get(key)
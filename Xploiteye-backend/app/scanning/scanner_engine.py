@@ -15,9 +15,7 @@ import json
 import xml.etree.ElementTree as ET
 import time
 import logging
-from threading import Lock
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+from concurrent.futures import FIRST_COMPLETED, wait
 from config.logging_config import scanning_logger
 from datetime import datetime
 
@@ -29,31 +27,34 @@ from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage
 from langchain_openai import ChatOpenAI
 
 from config.settings import settings
-
-# Global variable to store .txt file path for enhancement
-txt_file_path = None
-
-# Global variable to store GPT-selected services (backup for state issues)
-global_selected_services = []
-
-def reset_scan_globals():
-    """Reset all global variables to ensure clean state for each new scan."""
-    global txt_file_path, global_selected_services, fallback_services, TRUE_PUBLIC_IP
-    global request_count, cycle_index
-
-    logging.info("🔄 Resetting global scan state for new scan...")
-
-    # Reset file paths and service data
-    txt_file_path = None
-    global_selected_services = []
-
-    # Reset CVE lookup state
-    fallback_services = []
-    TRUE_PUBLIC_IP = None
-    request_count = 0
-    cycle_index = -1
-
-    logging.info("✅ Global scan state reset completed")
+from app.scanning.cve_cache import get_cve_cache
+from app.scanning.cve_index import get_cve_index
+from app.scanning.cve_records import make_record, to_report_vulnerability, write_jsonl
+from app.scanning.timing_profiles import TimingProfile, get_timing_history, parse_ping_output
+from app.scanning.fingerprint_store import (
+    build_fingerprint, compute_delta, get_fingerprint_store, split_incremental_services
+)
+from app.scanning.cve_scheduler import (
+    PRIORITY_FALLBACK, PRIORITY_PRIMARY, CveQueryScheduler, TokenBucket, attach_process, get_cve_scheduler,
+    init_cve_scheduler
+)
+from app.scanning.report_builder import (
+    build_risk_prompt, build_scan_results, heuristic_risk_assessment, parse_risk_assessment
+)
+from app.scanning.scan_plans import get_scan_plan, load_scan_plans
+from app.scanning.scan_metrics import CVE_QUERY_SECONDS, finish_scan_timings, llm_span, record_span, span, timed
+from app.scanning.service_normalizer import normalize_services
+from app.scanning.nmap_runner import (
+    host_element_to_dict, merge_parsed_data, run_command_async, run_nmap_streaming, split_port_range, split_targets
+)
+from app.scanning.scan_context import (
+    ScanContext,
+    get_current_scan_context,
+    get_scan_context,
+    register_scan_context,
+    release_scan_context,
+    vpn_rotation,
+)
 
 # --- 1. STATE DEFINITION ---
 class ScanState(TypedDict):
@@ -62,8 +63,10 @@ class ScanState(TypedDict):
     scan_type: str
     user_id: str
     scan_id: str  # Add scan_id for UUID-based file naming
+    scan_context: ScanContext  # Per-scan execution context (file paths, selected services, live progress)
     messages: Annotated[list[BaseMessage], add_messages]
     selected_tools: list
+    tool_stages: list  # Tool names grouped by scan plan stage; each stage runs after the previous one
     tool_results: dict
     open_ports: list
     services: list
@@ -130,109 +133,288 @@ def parse_nmap_xml(xml_content: str) -> dict:
         results = {"hosts": []}
 
         for host in root.findall('.//host'):
-            host_data = {"ip": "", "hostname": "", "status": "", "ports": [], "os": "", "os_details": {}}
-
-            # Get IP address
-            address = host.find('address[@addrtype="ipv4"]')
-            if address is not None:
-                host_data["ip"] = address.get("addr", "")
-
-            # Get hostname
-            hostname = host.find('.//hostname')
-            if hostname is not None:
-                host_data["hostname"] = hostname.get("name", "")
-
-            # Get host status
-            status = host.find('status')
-            if status is not None:
-                host_data["status"] = status.get("state", "")
-
-            # Get enhanced OS information
-            os_match = host.find('.//osmatch')
-            if os_match is not None:
-                host_data["os"] = os_match.get("name", "")
-
-                # Simple OS details - only name
-                host_data["os_details"] = {
-                    "name": os_match.get("name", "")
-                }
-
-            # Get ports
-            for port in host.findall('.//port'):
-                port_data = {
-                    "port": port.get("portid", ""),
-                    "protocol": port.get("protocol", ""),
-                    "state": "",
-                    "service": "",
-                    "version": ""
-                }
-
-                state = port.find('state')
-                if state is not None:
-                    port_data["state"] = state.get("state", "")
-
-                service = port.find('service')
-                if service is not None:
-                    port_data["service"] = service.get("name", "")
-                    port_data["version"] = service.get("version", "")
-
-                if port_data["state"] == "open":
-                    host_data["ports"].append(port_data)
-
-            results["hosts"].append(host_data)
+            results["hosts"].append(host_element_to_dict(host))
 
         return results
     except Exception as e:
         return {"hosts": [], "error": str(e)}
 
+def _nmap_event_callbacks(ctx: ScanContext) -> dict:
+    """Streaming callbacks that push nmap host/port/progress events into the scan context."""
+    if ctx is None:
+        return {}
+    return {
+        "on_host": ctx.record_host,
+        "on_port": ctx.record_port,
+        "on_progress": ctx.record_nmap_progress
+    }
+
 # --- 2. UNIVERSAL SCAN TOOLS ---
+# A few quick echo requests: enough to measure RTT and loss for the timing profile
+PING_PROBE_COMMAND = ["ping", "-c", "3", "-i", "0.2", "-W", "2"]
+
+async def probe_target(target: str) -> dict:
+    """Ping the target; run_command_async's result plus the measured rtt_ms and loss."""
+    ping_result = await run_command_async([*PING_PROBE_COMMAND, target], timeout=10)
+    return {**ping_result, **parse_ping_output(ping_result["stdout"])}
+
+def _set_timing_profile(ctx: ScanContext, probe: dict):
+    """Pick the scan's nmap timing profile from the first ping measurement."""
+    if ctx is None or ctx.timing is not None or not settings.adaptive_timing_enabled:
+        return
+    ctx.timing = TimingProfile(probe["rtt_ms"], probe["loss"])
+    logging.info(f"⏱️ Timing profile '{ctx.timing.name}' for {ctx.target} (rtt {probe['rtt_ms']} ms, loss {probe['loss']}%)")
+
+@timed("host_check")
 async def host_connectivity_check(target: str) -> dict:
     """Quick ping check to verify target accessibility."""
 
-    def run_ping():
-        ping_cmd = ["ping", "-c", "1", target]
-        return _run_command_with_timeout(ping_cmd, timeout=10)
-
-    ping_result = await asyncio.to_thread(run_ping)
+    ping_result = await probe_target(target)
+    _set_timing_profile(get_current_scan_context(), ping_result)
 
     result = {
         "status": "success" if ping_result["success"] else "failed",
         "data": {
             "alive": ping_result["success"],
             "response_time": ping_result["stdout"] if ping_result["success"] else None,
+            "rtt_ms": ping_result["rtt_ms"],
+            "packet_loss": ping_result["loss"],
             "error": ping_result["stderr"] if not ping_result["success"] else None
         }
     }
 
     return result
 
+# nmap prints <taskprogress> elements into the XML stream at this interval
+NMAP_STATS_INTERVAL = "5s"
+
+# Version detection flags when adaptive timing is off
+DEFAULT_VERSION_TIMING = ["--version-light", "-T5"]
+
+def _target_args(target) -> list:
+    """nmap target arguments: one target string, or a list of hosts scanned by one process."""
+    return [target] if isinstance(target, str) else list(target)
+
+def _discovery_command(target, port_range: str, os_detection: bool = True, timing_flags: list = None) -> list:
+    """nmap port discovery (SYN scan, optionally with OS detection) writing XML to stdout."""
+    os_flags = ["-O", "--osscan-guess", "--osscan-limit"] if os_detection else []
+    return [
+        "sudo", "nmap", *os_flags, *(timing_flags or []),
+        "-Pn", "-n", "--disable-arp-ping", "-p", port_range,
+        "--stats-every", NMAP_STATS_INTERVAL, "-oX", "-", *_target_args(target)
+    ]
+
+def _version_command(target, ports: str, timing_flags: list = None) -> list:
+    """nmap service version detection on already known open ports."""
+    return [
+        "sudo", "nmap", "-sV", *(timing_flags or DEFAULT_VERSION_TIMING),
+        "--disable-arp-ping", "-n", "-p", ports,
+        "--stats-every", NMAP_STATS_INTERVAL, "-oX", "-", *_target_args(target)
+    ]
+
+async def run_nmap_phase(phase: str, target: str, ports: str, port_count: int, timeout: int,
+                         os_detection: bool = True, callbacks: dict = None,
+                         processes: int = 1, observe: bool = True) -> dict:
+    """
+    Run one "discovery" or "version" nmap pass with the scan's timing profile.
+
+    The profile sets the timing flags and scales the timeout; afterwards the pass's
+    throughput is fed back so the next phase is re-tuned (unless observe is False,
+    e.g. for shards that are observed together).
+    """
+    ctx = get_current_scan_context()
+    timing = ctx.timing if ctx is not None else None
+    if timing:
+        timeout = timing.scale_timeout(timeout)
+
+    if phase == "version":
+        command = _version_command(target, ports, timing.version_flags(timeout, processes) if timing else None)
+    else:
+        command = _discovery_command(target, ports, os_detection, timing.discovery_flags(timeout, processes) if timing else None)
+
+    started = time.monotonic()
+    with span(f"nmap.{phase}", ports=port_count, processes=processes) as attrs:
+        result = await run_nmap_streaming(
+            command, timeout=timeout, **(callbacks if callbacks is not None else _nmap_event_callbacks(ctx))
+        )
+        if not result["success"]:
+            attrs["status"] = "failed"
+    if timing and observe:
+        timing.observe(phase, port_count, time.monotonic() - started, result["success"])
+    return result
+
+def _range_size(port_range: str) -> int:
+    first, _, last = port_range.partition("-")
+    return int(last or first) - int(first) + 1
+
+def _open_ports(parsed_data: dict) -> list:
+    """Open port numbers across all hosts of a parse_nmap_xml result (no duplicates, in order)."""
+    open_ports = []
+    for host in (parsed_data or {}).get("hosts", []):
+        for port in host.get("ports", []):
+            if port.get("state") == "open" and port["port"] not in open_ports:
+                open_ports.append(port["port"])
+    return open_ports
+
+def plan_nmap_shards(target: str, max_ports: int) -> list:
+    """
+    Split a scan into (target, port_range, os_detection) shards.
+
+    Wide port ranges are split across CPU cores; CIDR targets are additionally split
+    into subnets. Only the first port shard of each target runs OS detection, since
+    nmap fingerprints a host once per process.
+    """
+    min_ports = settings.nmap_shard_min_ports
+    if min_ports <= 0 or max_ports < min_ports:
+        return [(target, f"1-{max_ports}", True)]
+
+    shard_count = settings.nmap_shard_count or os.cpu_count() or 1
+    target_groups = split_targets(target, shard_count)
+    port_shards = max(1, shard_count // len(target_groups))
+    return [
+        (group, port_range, index == 0)
+        for group in target_groups
+        for index, port_range in enumerate(split_port_range(1, max_ports, port_shards))
+    ]
+
+def _incremental_baseline(ctx: ScanContext):
+    """Fingerprint to diff against when the scan is an incremental rescan that has one."""
+    if ctx is not None and ctx.incremental and ctx.baseline:
+        return ctx.baseline
+    return None
+
+def _without_os_detection(shards: list) -> list:
+    return [(shard_target, port_range, False) for shard_target, port_range, _ in shards]
+
+def _shard_progress_callback(ctx: ScanContext, shard_count: int):
+    """Report the mean progress of all shards as one nmap progress stream."""
+    if ctx is None:
+        return lambda index: None
+    percents = [0.0] * shard_count
+
+    def for_shard(index):
+        def on_progress(info):
+            percents[index] = info.get("percent", 0.0)
+            ctx.record_nmap_progress({**info, "percent": round(sum(percents) / shard_count, 2), "shards": shard_count})
+        return on_progress
+    return for_shard
+
+# Shared by every sharded scan in the process, so concurrent scans (and the two
+# sharded tools of a deep scan) never run more than nmap_shard_parallelism shards
+_shard_semaphore = None
+
+def _get_shard_semaphore() -> asyncio.Semaphore:
+    global _shard_semaphore
+    if _shard_semaphore is None:
+        _shard_semaphore = asyncio.Semaphore(settings.nmap_shard_parallelism or os.cpu_count() or 1)
+    return _shard_semaphore
+
+async def run_sharded_scan(shards: list, discovery_timeout: int, version_timeout: int = None) -> dict:
+    """
+    Run port discovery as parallel nmap shards and merge their results.
+
+    With version_timeout set, each shard starts its -sV pass as soon as its own open
+    ports are known instead of waiting for the slowest shard. Returns success/stderr,
+    the merged discovery "parsed_data", the merged "version_data" (or None) and the
+    number of failed shards.
+    """
+    ctx = get_current_scan_context()
+    parallelism = settings.nmap_shard_parallelism or os.cpu_count() or 1
+    processes = min(parallelism, len(shards))
+    semaphore = _get_shard_semaphore()
+    progress_for_shard = _shard_progress_callback(ctx, len(shards))
+    logging.info(f"🧩 Sharded nmap: {len(shards)} shards, up to {parallelism} processes at once across all scans")
+
+    async def run_shard(index, shard_target, port_range, os_detection):
+        callbacks = {**_nmap_event_callbacks(ctx), "on_progress": progress_for_shard(index)} if ctx else {}
+        async with semaphore:
+            discovery = await run_nmap_phase(
+                "discovery", shard_target, port_range, _range_size(port_range), discovery_timeout,
+                os_detection=os_detection, callbacks=callbacks, processes=processes, observe=False
+            )
+        if not discovery["success"] or version_timeout is None:
+            return discovery, None
+        open_ports = _open_ports(discovery["parsed_data"])
+        if not open_ports:
+            return discovery, None
+        async with semaphore:
+            version = await run_nmap_phase(
+                "version", shard_target, ",".join(open_ports), len(open_ports), version_timeout,
+                callbacks=callbacks, processes=processes, observe=False
+            )
+        return discovery, version
+
+    started = time.monotonic()
+    shard_results = await asyncio.gather(*(run_shard(i, *shard) for i, shard in enumerate(shards)))
+    if ctx is not None and ctx.timing:
+        # Shards share one profile, so it is re-tuned once from the whole sharded run
+        ctx.timing.observe(
+            "sharded_discovery" if version_timeout is None else "sharded_discovery_and_version",
+            sum(_range_size(port_range) for _, port_range, _ in shards),
+            time.monotonic() - started,
+            all(d["success"] for d, _ in shard_results)
+        )
+
+    discovery_runs = [d for d, _ in shard_results]
+    version_runs = [v for _, v in shard_results if v is not None]
+    failed = [r for r in discovery_runs + version_runs if not r["success"]]
+    if failed:
+        logging.warning(f"⚠️ {len(failed)} of {len(discovery_runs) + len(version_runs)} nmap shard runs failed: {failed[0]['stderr']}")
+
+    discoveries = [d["parsed_data"] for d in discovery_runs if d["success"]]
+    versions = [v["parsed_data"] for v in version_runs if v["success"]]
+    error = None
+    if not discoveries:
+        error = f"Port discovery failed: {discovery_runs[0]['stderr']}"
+    elif version_runs and not versions:
+        error = f"Version detection failed: {version_runs[0]['stderr']}"
+
+    return {
+        "success": error is None,
+        "error": error,
+        "parsed_data": merge_parsed_data(discoveries),
+        "version_data": merge_parsed_data(versions) if version_runs else None,
+        "failed_shards": len(failed)
+    }
+
+@timed("port_os_scan")
 async def port_and_os_scan(target: str, max_ports: int = 1000) -> dict:
     """Universal port scanning and OS detection tool. Scans ports 1-max_ports."""
+    ctx = get_current_scan_context()
+
+    ping_result = await probe_target(target)
+    _set_timing_profile(ctx, ping_result)
+
+    if not ping_result["success"]:
+        return {
+            "status": "failed",
+            "data": {"error": f"Host unreachable: {ping_result['stderr']}"}
+        }
 
-    def run_scan():
-        ping_cmd = ["ping", "-c", "1", target]
-        ping_result = _run_command_with_timeout(ping_cmd, timeout=10)
+    # Calculate timeout based on port range
+    if max_ports <= 1000:
+        timeout = 45
+    elif max_ports <= 5000:
+        timeout = 250
+    else:
+        timeout = 600
+
+    # Incremental rescans keep the stored OS match and only sweep port states
+    baseline = _incremental_baseline(ctx)
+    shards = plan_nmap_shards(target, max_ports)
+    if baseline:
+        shards = _without_os_detection(shards)
 
-        if not ping_result["success"]:
+    if len(shards) > 1:
+        sharded_result = await run_sharded_scan(shards, timeout)
+        if not sharded_result["success"]:
             return {
                 "status": "failed",
-                "data": {"error": f"Host unreachable: {ping_result['stderr']}"}
+                "data": {"error": sharded_result["error"]}
             }
-
-        # Calculate timeout based on port range
-        if max_ports <= 1000:
-            timeout = 45
-        elif max_ports <= 5000:
-            timeout = 250
-        else:
-            timeout = 600
-
-        port_discovery_cmd = [
-            "sudo", "nmap", "-O", "--osscan-guess", "--osscan-limit",
-            "-Pn", "-n", "--disable-arp-ping", "-p", f"1-{max_ports}",
-            "-oX", "-", target
-        ]
-        port_result = _run_command_with_timeout(port_discovery_cmd, timeout=timeout)
+        parsed_data = sharded_result["parsed_data"]
+    else:
+        port_result = await run_nmap_phase("discovery", target, f"1-{max_ports}", max_ports, timeout, os_detection=not baseline)
 
         if not port_result["success"]:
             return {
@@ -240,52 +422,70 @@ async def port_and_os_scan(target: str, max_ports: int = 1000) -> dict:
                 "data": {"error": f"Port discovery failed: {port_result['stderr']}"}
             }
 
-        parsed_data = parse_nmap_xml(port_result["stdout"])
-        open_ports = []
-        os_info = ""
+        parsed_data = port_result["parsed_data"]
 
-        if parsed_data and "hosts" in parsed_data and parsed_data["hosts"]:
-            host = parsed_data["hosts"][0]
-            open_ports = [p["port"] for p in host.get("ports", []) if p.get("state") == "open"]
-            os_info = host.get("os", "")
+    open_ports = []
+    os_info = ""
 
-        result = {
-            "status": "success",
-            "data": {
-                "open_ports": open_ports,
-                "os_info": os_info,
-                "host_status": "up",
-                "total_ports_scanned": max_ports,
-                "discovered_ports": len(open_ports),
-                "parsed_data": parsed_data  # Store full parsed data for later use
-            }
-        }
-        return result
+    if parsed_data and "hosts" in parsed_data and parsed_data["hosts"]:
+        host = parsed_data["hosts"][0]
+        if baseline and not host.get("os"):
+            host["os"], host["os_details"] = baseline.get("os", ""), baseline.get("os_details", {})
+        open_ports = [p["port"] for p in host.get("ports", []) if p.get("state") == "open"]
+        os_info = host.get("os", "")
 
-    result = await asyncio.to_thread(run_scan)
+    result = {
+        "status": "success",
+        "data": {
+            "open_ports": open_ports,
+            "os_info": os_info,
+            "host_status": "up",
+            "total_ports_scanned": max_ports,
+            "discovered_ports": len(open_ports),
+            "parsed_data": parsed_data  # Store full parsed data for later use
+        }
+    }
     return result
 
+@timed("version_scan")
 async def service_version_detection(target: str, max_ports: int = 1000) -> dict:
     """Universal service version detection tool. Detects versions on ports 1-max_ports."""
-
-    def run_version_detection():
-        # Calculate timeout based on port range
-        if max_ports <= 1000:
-            discovery_timeout = 45
-            version_timeout = 60
-        elif max_ports <= 5000:
-            discovery_timeout = 250
-            version_timeout = 80
-        else:
-            discovery_timeout = 600
-            version_timeout = 180
-
-        discovery_cmd = [
-            "sudo", "nmap", "-O", "--osscan-guess", "--osscan-limit",
-            "-Pn", "-n", "--disable-arp-ping", "-p", f"1-{max_ports}",
-            "-oX", "-", target
-        ]
-        discovery_result = _run_command_with_timeout(discovery_cmd, timeout=discovery_timeout)
+    ctx = get_current_scan_context()
+    if ctx is not None and ctx.timing is None and settings.adaptive_timing_enabled:
+        _set_timing_profile(ctx, await probe_target(target))
+
+    # Calculate timeout based on port range
+    if max_ports <= 1000:
+        discovery_timeout = 45
+        version_timeout = 60
+    elif max_ports <= 5000:
+        discovery_timeout = 250
+        version_timeout = 80
+    else:
+        discovery_timeout = 600
+        version_timeout = 180
+
+    # Incremental rescans sweep port states only and fingerprint just the new ports
+    baseline = _incremental_baseline(ctx)
+    shards = plan_nmap_shards(target, max_ports)
+    if baseline:
+        shards = _without_os_detection(shards)
+
+    # Sharded scans run -sV per shard as soon as that shard's open ports are known
+    if len(shards) > 1:
+        sharded_result = await run_sharded_scan(shards, discovery_timeout, None if baseline else version_timeout)
+        if not sharded_result["success"]:
+            return {
+                "status": "failed",
+                "data": {"error": sharded_result["error"]}
+            }
+        open_ports = _open_ports(sharded_result["parsed_data"])
+        if open_ports and not baseline:
+            return _version_detection_result(sharded_result["version_data"], open_ports, max_ports)
+    else:
+        discovery_result = await run_nmap_phase(
+            "discovery", target, f"1-{max_ports}", max_ports, discovery_timeout, os_detection=not baseline
+        )
 
         if not discovery_result["success"]:
             return {
@@ -293,75 +493,100 @@ async def service_version_detection(target: str, max_ports: int = 1000) -> dict:
                 "data": {"error": f"Port discovery failed: {discovery_result['stderr']}"}
             }
 
-        parsed_data = parse_nmap_xml(discovery_result["stdout"])
-        open_ports = []
-        if parsed_data and "hosts" in parsed_data and parsed_data["hosts"]:
-            for host in parsed_data["hosts"]:
-                for port in host.get("ports", []):
-                    if port.get("state") == "open":
-                        open_ports.append(port["port"])
+        open_ports = _open_ports(discovery_result["parsed_data"])
 
-        if not open_ports:
-            return {
-                "status": "success",
-                "data": {"services": [], "message": "No open ports found for version detection", "total_ports_scanned": max_ports}
-            }
+    if not open_ports:
+        return {
+            "status": "success",
+            "data": {"services": [], "message": "No open ports found for version detection", "total_ports_scanned": max_ports}
+        }
 
-        open_ports_str = ",".join(open_ports)
-
-        # Adjust version timeout based on number of discovered ports
-        if max_ports > 5000 and len(open_ports) > 50:
-            version_timeout = 180
-
-        version_cmd = [
-            "sudo", "nmap", "-sV", "--version-light", "-T5",
-            "--disable-arp-ping", "-n", "-p", open_ports_str,
-            "-oX", "-", target
-        ]
-        version_result = _run_command_with_timeout(version_cmd, timeout=version_timeout)
-
-        if version_result["success"]:
-            parsed_versions = parse_nmap_xml(version_result["stdout"])
-            services = []
-            if parsed_versions and "hosts" in parsed_versions and parsed_versions["hosts"]:
-                for host in parsed_versions["hosts"]:
-                    for port in host.get("ports", []):
-                        services.append({
-                            "port": port["port"],
-                            "protocol": port["protocol"],
-                            "service": port["service"],
-                            "version": port["version"],
-                            "state": port["state"]
-                        })
+    if baseline:
+        return await incremental_version_detection(target, open_ports, baseline, max_ports, version_timeout)
 
-            result = {
-                "status": "success",
-                "data": {
-                    "services": services,
-                    "total_services": len(services),
-                    "discovered_ports": len(open_ports),
-                    "total_ports_scanned": max_ports,
-                    "parsed_data": parsed_versions  # Store full parsed data
-                }
-            }
-        else:
-            result = {
+    open_ports_str = ",".join(open_ports)
+
+    # Adjust version timeout based on number of discovered ports
+    if max_ports > 5000 and len(open_ports) > 50:
+        version_timeout = 180
+
+    version_result = await run_nmap_phase("version", target, open_ports_str, len(open_ports), version_timeout)
+
+    if not version_result["success"]:
+        return {
+            "status": "failed",
+            "data": {"error": f"Version detection failed: {version_result['stderr']}"}
+        }
+    return _version_detection_result(version_result["parsed_data"], open_ports, max_ports)
+
+async def incremental_version_detection(target: str, open_ports: list, baseline: dict,
+                                        max_ports: int, version_timeout: int) -> dict:
+    """
+    Version detection for an incremental rescan: ports that were open last time keep
+    their stored fingerprint, only newly opened ports get an -sV pass.
+    """
+    ctx = get_current_scan_context()
+    previous = {str(svc.get("port")): svc for svc in baseline.get("services", [])}
+    new_ports = [port for port in open_ports if port not in previous]
+    reused_ports = [port for port in open_ports if port in previous]
+    closed_ports = [port for port in previous if port not in open_ports]
+    if ctx is not None:
+        ctx.port_delta = {"new_ports": new_ports, "closed_ports": closed_ports, "reused_ports": reused_ports}
+    logging.info(f"♻️ Incremental rescan: {len(reused_ports)} unchanged ports reused, {len(new_ports)} new, {len(closed_ports)} closed")
+
+    reused = {"hosts": [{
+        "ip": baseline.get("ip") or target, "hostname": "", "status": "up",
+        "ports": [previous[port] for port in reused_ports],
+        "os": baseline.get("os", ""), "os_details": baseline.get("os_details", {})
+    }]}
+    parsed_versions = [reused]
+
+    if new_ports:
+        version_result = await run_nmap_phase("version", target, ",".join(new_ports), len(new_ports), version_timeout)
+        if not version_result["success"]:
+            return {
                 "status": "failed",
                 "data": {"error": f"Version detection failed: {version_result['stderr']}"}
             }
-        return result
+        parsed_versions.append(version_result["parsed_data"])
 
-    result = await asyncio.to_thread(run_version_detection)
+    result = _version_detection_result(merge_parsed_data(parsed_versions), open_ports, max_ports)
+    result["data"]["incremental"] = {"new_ports": new_ports, "closed_ports": closed_ports, "reused_ports": reused_ports}
     return result
 
+def _version_detection_result(parsed_versions: dict, open_ports: list, max_ports: int) -> dict:
+    """Tool result of service_version_detection from parsed -sV output."""
+    services = []
+    if parsed_versions and "hosts" in parsed_versions and parsed_versions["hosts"]:
+        for host in parsed_versions["hosts"]:
+            for port in host.get("ports", []):
+                services.append({
+                    "port": port["port"],
+                    "protocol": port["protocol"],
+                    "service": port["service"],
+                    "product": port.get("product", ""),
+                    "version": port["version"],
+                    "cpe": port.get("cpe", []),
+                    "state": port["state"]
+                })
+
+    return {
+        "status": "success",
+        "data": {
+            "services": services,
+            "total_services": len(services),
+            "discovered_ports": len(open_ports),
+            "total_ports_scanned": max_ports,
+            "parsed_data": parsed_versions  # Store full parsed data
+        }
+    }
+
+@timed("http_check")
 async def http_service_check(target: str) -> dict:
     """Quick HTTP/HTTPS accessibility check."""
 
-    def run_curl():
-        http_cmd = ["curl", "-s", "-D", "-", f"http://{target}", "-o", "/dev/null"]
-        return _run_command_with_timeout(http_cmd, timeout=10)
-
-    http_result = await asyncio.to_thread(run_curl)
+    http_cmd = ["curl", "-s", "-D", "-", f"http://{target}", "-o", "/dev/null"]
+    http_result = await run_command_async(http_cmd, timeout=10)
 
     result = {
         "status": "success" if http_result["success"] else "failed",
@@ -380,13 +605,9 @@ RATE_LIMIT = 8
 MAX_WORKERS = 10
 VPN_CYCLE_PLAN = ["J", "J", "U", "U", "N", "N"]
 
-# Global state for a single CVE lookup run
-vpn_lock = Lock()
-request_count = 0
-cycle_index = -1
-fallback_services = []
-fallback_lock = Lock()
-TRUE_PUBLIC_IP = None
+# VPN rotation state (cycle position, ground truth IP) is host-wide and lives in
+# scan_context.vpn_rotation; the rate-limit budget is the CVE scheduler's token bucket.
+vpn_lock = vpn_rotation.lock
 
 # Global cleanup tracking
 active_executors = []
@@ -404,6 +625,11 @@ def cleanup_all_processes():
         except Exception as e:
             logging.error(f"Error terminating executor: {e}")
 
+    # Stop the shared CVE query scheduler
+    cve_scheduler = get_cve_scheduler()
+    if cve_scheduler:
+        cve_scheduler.shutdown()
+
     # Kill all active subprocesses
     for process in active_processes:
         try:
@@ -460,9 +686,8 @@ def execute_vpn_command(command_args):
     """
     CRITICAL FIX: Execute VPN control commands, passing the true public IP.
     """
-    global TRUE_PUBLIC_IP
     # The true IP is now passed as the final argument
-    cmd = ["python3", VPN_CONTROLLER_SCRIPT] + command_args + [TRUE_PUBLIC_IP]
+    cmd = ["python3", VPN_CONTROLLER_SCRIPT] + command_args + [vpn_rotation.true_public_ip or ""]
     try:
         result = subprocess.run(cmd, check=True, timeout=180, capture_output=True, text=True)
         # Log VPN output for debugging
@@ -477,20 +702,27 @@ def execute_vpn_command(command_args):
             logging.error(f"VPN script stdout:\n{e.stdout}")
         return False
 
-def handle_rate_limit():
-    """Handle VPN switching when rate limit is hit."""
-    global request_count, cycle_index
-    if request_count < RATE_LIMIT:
-        return True
+def rotate_vpn_connection():
+    """
+    Move to the next connection in VPN_CYCLE_PLAN for a fresh rate-limit budget.
+    Called by the CVE scheduler's token bucket when it runs empty.
+    """
+    # Rotations run on scheduler threads for every scan's queries: metrics only, not a scan's spans
+    with vpn_lock, span("vpn_rotation") as attrs:
+        vpn_success = _rotate_vpn_connection_locked()
+        if not vpn_success:
+            attrs["status"] = "failed"
+        return vpn_success
+
+def _rotate_vpn_connection_locked():
     scanning_logger.vpn_switch("rate limit")
-    request_count = 0
-    cycle_index += 1
-    if cycle_index >= len(VPN_CYCLE_PLAN):
+    vpn_rotation.cycle_index += 1
+    if vpn_rotation.cycle_index >= len(VPN_CYCLE_PLAN):
         print("\n" + "="*80)
         print("🔌 VPN CYCLE FINISHED - DISCONNECTING VPN")
         print("="*80)
         logging.info("VPN cycle finished. Disconnecting.")
-        cycle_index = -1
+        vpn_rotation.cycle_index = -1
         vpn_success = execute_vpn_command(["disconnect"])
         if vpn_success:
             try:
@@ -501,7 +733,7 @@ def handle_rate_limit():
             except:
                 pass
         return vpn_success
-    next_region = VPN_CYCLE_PLAN[cycle_index]
+    next_region = VPN_CYCLE_PLAN[vpn_rotation.cycle_index]
     print("\n" + "="*80)
     print(f"🔄 VPN SWITCHING - Connecting to Region: {next_region}")
     print("="*80)
@@ -525,297 +757,353 @@ def handle_rate_limit():
 
     return vpn_success
 
+# vulnx outcomes that say nothing about the service itself and must not be cached
+VULNX_RATE_LIMIT = "RATE_LIMIT"
+VULNX_TIMEOUT = "TIMEOUT"
+VULNX_ERROR = "ERROR"
+
 def run_vulnx_search_with_retry(query):
     """Run vulnx search with retry logic."""
-    cmd = ["/home/kali/go/bin/vulnx", "search", query, "--limit", "1", "--json"]
+    cmd = [settings.vulnx_path, "search", query, "--limit", "1", "--json"]
     for attempt in range(2):
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=40)
-            if "Rate limit exceeded" in result.stderr:
-                return "RATE_LIMIT"
-            if result.returncode == 0 and result.stdout and result.stdout.find('{') != -1:
-                return result.stdout[result.stdout.find('{'):].strip()
+            # Own process group so a cancelled scan can kill just this query
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+            attach_process(process)
+            try:
+                stdout, stderr = process.communicate(timeout=40)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            if "Rate limit exceeded" in stderr:
+                return VULNX_RATE_LIMIT
+            if process.returncode != 0:
+                logging.warning(f"vulnx exited with {process.returncode} for query '{query}': {stderr.strip()[:200]}")
+                return VULNX_ERROR
+            if stdout and stdout.find('{') != -1:
+                return stdout[stdout.find('{'):].strip()
             return None
         except subprocess.TimeoutExpired:
             logging.warning(f"API timeout for query: '{query}' on attempt {attempt + 1}")
             if attempt == 0:
                 time.sleep(2)
     logging.error(f"Query '{query}' failed with timeout after 2 attempts.")
-    return None
+    return VULNX_TIMEOUT
 
-def process_service(is_fallback_pass, svc):
-    """
-    CORRECTED: Process a single service for CVE lookup with robust rate limit logic.
-    Now handles version-first, then service-name fallback strategy.
-    """
-    global request_count
-
-    # Determine query strategy based on pass type and version availability
+def build_cve_query(svc, is_fallback_pass):
+    """Version-first query for the primary pass, service name only for the fallback pass."""
     if is_fallback_pass:
         # Fallback pass: always use service name only
-        query = svc['service']
-    else:
-        # Primary pass: use version if available, otherwise service name only
-        if svc.get('version') and svc['version'] != 'None':
-            query = f"{svc['service']} {svc['version']}"
-        else:
-            query = svc['service']
+        return svc['service']
+    # Primary pass: use version if available, otherwise service name only
+    if svc.get('version') and svc['version'] != 'None':
+        return f"{svc['service']} {svc['version']}"
+    return svc['service']
 
-    with vpn_lock:
-        # Check rate limit from previous task first
-        if not handle_rate_limit():
-           logging.error(f"Aborting task for '{query}' due to VPN failure.")
-           return None
+def needs_fallback(svc, is_fallback_pass):
+    """Only a failed primary lookup that used a version gets a service-name retry."""
+    return not is_fallback_pass and bool(svc.get('version')) and svc['version'] != 'None'
 
-        # Now, increment for the current task
-        request_count += 1
-        conn_type = "Direct" if cycle_index == -1 else f"VPN-{VPN_CYCLE_PLAN[cycle_index]}"
-        pass_type_str = "Fallback" if is_fallback_pass else "Primary"
-        logging.info(f"▶️ {pass_type_str} Scan: '{query}' (Req #{request_count}/{RATE_LIMIT} on {conn_type})")
-
-    data_raw = run_vulnx_search_with_retry(query)
-    if data_raw:
-        try:
-            data = json.loads(data_raw)
-            if data and data.get("results"):
-                vuln = data["results"][0]
-                logging.info(f"✅ Success for '{query}'")
-                # Return the formatted string, don't write to file here
-                return format_output(svc, vuln, is_fallback_pass)
-        except (json.JSONDecodeError, IndexError):
-            pass
-
-    # Only queue for fallback if this was a primary pass with version and it failed
-    if not is_fallback_pass and svc.get('version') and svc['version'] != 'None':
-        logging.warning(f"∅ Primary version scan failed for '{query}'. Queuing for service-name fallback.")
-        with fallback_lock:
-            fallback_services.append(svc)
-
-    return None
-
-def extract_all_links(vuln):
-    """Extract all relevant links from vulnerability data."""
-    links, citations = [], vuln.get("citations", [])
-    links.extend(vuln.get("references", [])); links.extend(vuln.get("exploits", []))
-    keywords = ["exploit", "metasploit", "db", "poc"]
-    matching = [c.get("url") for c in citations if c.get("url") and any(k in c.get("url").lower() for k in keywords)]
-    if matching: links.extend(matching)
-    else: links.extend([c.get("url") for c in citations if c.get("url")][:2])
-    return list(sorted({link for link in links if link}))
-
-def format_output(svc, vuln, is_fallback):
-    """Format CVE vulnerability output."""
-    # Determine scan type based on whether version was used
-    if is_fallback:
-        scan_type = "(Service-Name Fallback)"
-    else:
-        if svc.get('version') and svc['version'] != 'None':
-            scan_type = "(Version-Based)"
-        else:
-            scan_type = "(Service-Name Only)"
-
-    links = extract_all_links(vuln)
-    output = (
-        f"[Port: {svc['port']} | Service: {svc['service']} | Version: {svc.get('version', 'None')} {scan_type}]\n"
-        f"CVE ID: {vuln.get('cve_id', 'Not Available')}\n"
-        f"Name: {vuln.get('name', 'Not Available')}\n"
-        f"Description: {vuln.get('description', 'Not Available')}\n"
-        f"Impact: {vuln.get('impact', 'Not Available')}\n"
-        f"Severity: {vuln.get('severity', 'Not Available')}\n"
-        f"CVSS Score: {vuln.get('cvss_score', 'Not Available')}\n"
-        f"EPSS Score: {vuln.get('epss_score', 'Not Available')}\n"
-        f"Age in Days: {vuln.get('age_in_days', 'Not Available')}\n"
-        f"Remediation: {vuln.get('remediation', 'Not Available')}\n"
-        f"Exploit Available: {'Yes' if links else 'No'}\n"
-        f"Exploit/PoC Links:\n"
-    )
-    if links:
-        for link in links:
-            output += f"- {link}\n"
-    else:
-        output += "No specific exploit links found.\n"
-    output += "----------------------------------------\n\n"
-    return output
-
-def run_scan_pass(service_list, is_fallback_pass):
+def parse_vulnx_result(query, data_raw):
     """
-    CORRECTED: Run CVE scan pass that is self-contained and returns its results.
-    """
-    pass_results = []
-    pass_name = "FALLBACK" if is_fallback_pass else "PRIMARY"
-    logging.info(f"\n--- STARTING PASS: {pass_name} SCAN ---")
-    if not service_list:
-        logging.info("Service list is empty. Skipping pass.")
-        return []
-    logging.info(f"Processing {len(service_list)} services in this pass...")
-
-    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
-    active_executors.append(executor)
+    Interpret a vulnx answer.
 
+    Returns (vuln, cacheable): vuln is the top result or None; cacheable is False for
+    answers that say nothing about the service (rate limit, timeout, error, bad output).
+    """
+    if data_raw is None:
+        # vulnx answered but found nothing for this query
+        return None, True
+    if data_raw in (VULNX_RATE_LIMIT, VULNX_TIMEOUT, VULNX_ERROR):
+        return None, False
     try:
-        task = partial(process_service, is_fallback_pass)
-        results = executor.map(task, service_list)
-        pass_results = [res for res in results if res is not None]
-        logging.info(f"--- {pass_name} SCAN PASS COMPLETE ---")
-        logging.info(f"📊 Found {len(pass_results)} new results in this pass.")
-    finally:
-        executor.shutdown(wait=True)
-        if executor in active_executors:
-            active_executors.remove(executor)
+        data = json.loads(data_raw)
+        if data and data.get("results"):
+            logging.info(f"✅ Success for '{query}'")
+            return data["results"][0], True
+        return None, True
+    except (json.JSONDecodeError, IndexError, AttributeError):
+        return None, False
+
+def _new_cve_scheduler():
+    bucket = TokenBucket(
+        capacity=RATE_LIMIT,
+        refill_period=settings.cve_rate_limit_window_seconds,
+        on_empty=rotate_vpn_connection
+    )
+    return CveQueryScheduler(
+        runner=run_vulnx_search_with_retry,
+        bucket=bucket,
+        workers=MAX_WORKERS,
+        is_rate_limited=lambda result: result == VULNX_RATE_LIMIT
+    )
 
-    return pass_results
+# How often a lookup thread waiting on CVE queries checks whether its scan was cancelled
+CANCEL_POLL_INTERVAL = 1.0
 
-async def preprocess_services_with_gpt(nmap_services_data: str, scan_type: str) -> list:
-    """Use GPT to clean and preprocess service versions from nmap data."""
+def run_scheduled_lookup(ctx, services_list):
+    """
+    Resolve services through the shared CVE query scheduler into CVE records.
 
-    # Define the maximum number of services based on scan type
-    max_services = {
-        'light': 5,
-        'medium': 10,
-        'deep': 999  # No practical limit for deep scan
-    }
+    Primary queries are submitted up front; a failed version-based query queues its
+    service-name fallback immediately (at lower priority) instead of waiting for the
+    whole primary pass. Cached answers never reach the scheduler.
+    """
+    scheduler = init_cve_scheduler(_new_cve_scheduler)
+    cve_cache = get_cve_cache()
+    primary_results, fallback_results = [], []
+    pending = {}
+    # Primary and fallback queries interleave; each pass spans its first submission to its last answer
+    passes = {False: {"name": "cve_primary"}, True: {"name": "cve_fallback"}}
+
+    def pass_started(is_fallback_pass):
+        pass_timing = passes[is_fallback_pass]
+        if "started_at" not in pass_timing:
+            pass_timing.update(started_at=time.time(), started=time.perf_counter(), ended=time.perf_counter(), queries=0)
+
+    def record(svc, is_fallback_pass, vuln):
+        if vuln:
+            (fallback_results if is_fallback_pass else primary_results).append(make_record(svc, vuln, is_fallback_pass))
+            return True
+        return False
 
-    service_limit = max_services.get(scan_type.lower(), 5)
+    def schedule(svc, is_fallback_pass):
+        query = build_cve_query(svc, is_fallback_pass)
+        pass_started(is_fallback_pass)
+        if cve_cache:
+            found, cached_vuln = cve_cache.get(query)
+            if found:
+                logging.info(f"🗄️ Cache hit for '{query}'" if cached_vuln else f"🗄️ Cached empty result for '{query}'")
+                if not record(svc, is_fallback_pass, json.loads(cached_vuln) if cached_vuln else None) \
+                        and needs_fallback(svc, is_fallback_pass):
+                    schedule(svc, True)
+                return
 
-    # Create concise prompt for faster GPT processing
-    preprocessing_prompt = f"""Extract {service_limit} most critical services for {scan_type} scan.
+        pass_type_str = "Fallback" if is_fallback_pass else "Primary"
+        logging.info(f"▶️ {pass_type_str} query queued: '{query}' (scan {ctx.scan_id[:8]})")
+        future = scheduler.submit(query, PRIORITY_FALLBACK if is_fallback_pass else PRIORITY_PRIMARY, owner=ctx.scan_id)
+        pending[future] = (svc, is_fallback_pass, query, time.perf_counter())
+        passes[is_fallback_pass]["queries"] += 1
+
+    for svc in services_list:
+        schedule(svc, False)
+
+    while pending and not ctx.cancelled:
+        done, _ = wait(list(pending), timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+        for future in done:
+            svc, is_fallback_pass, query, submitted = pending.pop(future)
+            if future.cancelled():
+                continue
+            passes[is_fallback_pass]["ended"] = time.perf_counter()
+            CVE_QUERY_SECONDS.observe(time.perf_counter() - submitted, **{"pass": "fallback" if is_fallback_pass else "primary"})
+            try:
+                data_raw = future.result()
+            except Exception as e:
+                logging.error(f"CVE query '{query}' failed: {e}")
+                continue
 
-IMPORTANT RULES:
-1. Remove duplicates - if same service runs on multiple ports, keep only ONE entry (highest priority port)
-2. Clean versions - if version looks confusing, incomplete, or unlikely to find CVE results, set to null
-3. Set version to null for generic versions like "1.0", "2.x", incomplete versions, or when uncertain
+            vuln, cacheable = parse_vulnx_result(query, data_raw)
+            if cve_cache and cacheable:
+                cve_cache.put(query, json.dumps(vuln) if vuln else None)
+            if not record(svc, is_fallback_pass, vuln) and needs_fallback(svc, is_fallback_pass):
+                logging.warning(f"∅ Primary version scan failed for '{query}'. Queuing service-name fallback.")
+                schedule(svc, True)
+
+    for pass_timing in passes.values():
+        if "started_at" in pass_timing:
+            record_span(
+                pass_timing["name"], pass_timing["started_at"], pass_timing["ended"] - pass_timing["started"],
+                "cancelled" if ctx.cancelled else "ok", ctx, queries=pass_timing["queries"], engine="vulnx"
+            )
 
-Return JSON array with exactly {service_limit} unique services:
-[{{"port": int, "service": "name", "version": "clean_version_or_null"}}]
+    if ctx.cancelled:
+        # Withdraw anything queued after the cancel; this thread stops waiting now
+        scheduler.cancel_owner(ctx.scan_id)
+        logging.info(f"🛑 CVE lookup of scan {ctx.scan_id[:8]} cancelled with {len(pending)} queries outstanding")
+    logging.info(f"📊 CVE scheduler: {scheduler.stats()}")
+    return primary_results, fallback_results
 
-Examples of version cleaning:
-- "Apache 2.2.8" → "2.2.8"
-- "OpenSSH 4.7p1 Debian 8ubuntu1" → "4.7p1"
-- "MySQL 5.x" → null (too generic)
-- "httpd 1.0" → null (too generic)
-- "ProFTPD" → null (no version)
+async def clean_versions_with_gpt(unparsed_services: list) -> dict:
+    """
+    Opt-in LLM fallback for version strings the rule-based normalizer could not parse.
+    Returns {port: version} for the entries the model could clean.
+    """
+    versions_data = "\n".join(
+        f"Port {svc['port']}: {svc['service']} version string \"{svc['raw_version']}\"" for svc in unparsed_services
+    )
+    prompt = f"""Extract a clean, CVE-searchable version number from each nmap version string.
+Use null when the string holds no specific version or is too generic (e.g. "5.x", "1.0").
+
+Return a JSON object mapping port to version: {{"22": "4.7p1", "80": null}}
 
 Data:
-{nmap_services_data}
+{versions_data}
 
 JSON:"""
 
     try:
         llm = get_llm()
-        response = await llm.ainvoke([HumanMessage(content=preprocessing_prompt)])
-
-        # Debug: Log GPT preprocessing response
-        logging.info(f"🔍 DEBUG: GPT preprocessing response length: {len(response.content)}")
-        logging.info(f"🔍 DEBUG: GPT preprocessing response: {response.content[:500]}...")
-
-        # Parse the response
-        services_data = json.loads(response.content)
-
-        # Validate that GPT returned the correct number of services
-        if scan_type.lower() != 'deep':  # Deep scan has no limit
-            if len(services_data) != service_limit:
-                logging.warning(f"GPT returned {len(services_data)} services, expected {service_limit}. Truncating to {service_limit}.")
-                services_data = services_data[:service_limit]
+        with llm_span("version_cleaning"):
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+        cleaned = json.loads(response.content)
+        return {str(port): version for port, version in cleaned.items() if version}
+    except Exception as e:
+        logging.error(f"GPT version cleaning failed: {e}")
+        return {}
+
+@timed("service_preprocessing")
+async def select_services_for_cve_lookup(version_services: list, scan_type: str) -> list:
+    """Deduplicate, clean and rank nmap services for CVE lookup (LLM only for unparseable versions)."""
+    start_time = time.perf_counter()
+    selected, unparsed = normalize_services(version_services, scan_type)
+    logging.info(f"✅ Service normalizer: {scan_type} scan selected {len(selected)} of {len(version_services)} services in {(time.perf_counter() - start_time) * 1000:.2f} ms")
+
+    if unparsed:
+        logging.info(f"🔍 {len(unparsed)} version strings could not be parsed: {[svc['raw_version'] for svc in unparsed]}")
+        if settings.service_normalizer_llm_fallback:
+            cleaned = await clean_versions_with_gpt(unparsed)
+            for svc in selected:
+                if str(svc["port"]) in cleaned:
+                    svc["version"] = cleaned[str(svc["port"])]
+    return selected
+
+def run_offline_lookup(cve_index, services_list):
+    """
+    Resolve all services against the offline CVE index in two batched queries, returning CVE records.
+    Mirrors the vulnx two-pass strategy: version-based first, then service-name
+    fallback for versioned services that matched nothing.
+    """
+    logging.info(f"\n--- STARTING OFFLINE INDEX LOOKUP for {len(services_list)} services ---")
+    primary_results, fallback_services = [], []
+    with span("cve_primary", queries=len(services_list), engine="offline_index"):
+        primary_matches = cve_index.lookup_services(services_list)
+    for svc, vulns in zip(services_list, primary_matches):
+        if vulns:
+            primary_results.append(make_record(svc, vulns[0], False))
+        elif svc.get('version') and svc['version'] != 'None':
+            fallback_services.append(svc)
 
-        logging.info(f"✅ GPT preprocessing: {scan_type} scan processed {len(services_data)} services")
-        return services_data
+    fallback_results = []
+    if fallback_services:
+        logging.info(f"🔄 Offline fallback for {len(fallback_services)} services without a version match")
+        with span("cve_fallback", queries=len(fallback_services), engine="offline_index"):
+            fallback_matches = cve_index.lookup_services(fallback_services, use_version=False)
+        for svc, vulns in zip(fallback_services, fallback_matches):
+            if vulns:
+                fallback_results.append(make_record(svc, vulns[0], True))
+    return primary_results, fallback_results
+
+def save_cve_results(ctx, primary_results, fallback_results, start_time, engine):
+    """Write the CVE records file for a finished lookup and build the tool result."""
+    all_results = primary_results + fallback_results
+    total_time = time.time() - start_time
+    logging.info(f"\n✅🎉 CVE LOOKUP COMPLETED in {total_time:.2f} seconds ({engine}).")
+    logging.info(f"📊 Final Results: {len(primary_results)} primary + {len(fallback_results)} fallback = {len(all_results)} total vulnerabilities")
+
+    # Create result folder using settings
+    result_folder = settings.results_dir
+    os.makedirs(result_folder, exist_ok=True)
+
+    # Save records as JSON Lines in result folder with scan-specific naming
+    output_file = None
+    if all_results:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Include scan_id so concurrent scans never share a temporary file
+        output_file = f"{result_folder}/cve_results_{ctx.scan_id}_{timestamp}.jsonl"
 
-    except Exception as e:
-        logging.error(f"🔍 DEBUG: GPT preprocessing failed with error: {e}")
-        logging.error(f"🔍 DEBUG: GPT preprocessing failed - input data length: {len(nmap_services_data)}")
-        # Fallback: return empty list if GPT fails
-        return []
+        try:
+            write_jsonl(output_file, all_results)
+            # The report node renames it next to the scan JSON
+            ctx.cve_records_path = output_file
+            logging.info(f"✍️ CVE records saved to: {output_file}")
+        except Exception as e:
+            logging.error(f"Failed to save CVE records to file: {e}")
+            ctx.cve_records_path = None
+            output_file = None
 
-async def cve_vulnerability_lookup(services_list: list) -> dict:
-    """Main CVE lookup function that orchestrates the two-pass scan."""
+    severity_counts = {}
+    for record in all_results:
+        severity = (record.get("severity") or "unknown").lower()
+        severity_counts[severity] = severity_counts.get(severity, 0) + 1
+    ctx.emit("cves", {"vulnerabilities_found": len(all_results), "severity_counts": severity_counts, "engine": engine})
 
-    def run_cve_lookup():
-        global fallback_services, TRUE_PUBLIC_IP, request_count, cycle_index
-        # Reset state for each run
-        fallback_services = []
-        all_results = []
-        request_count = 0
-        cycle_index = -1
-
-        # Establish the ground truth IP for this specific run
-        TRUE_PUBLIC_IP = get_initial_public_ip()
-        if not TRUE_PUBLIC_IP:
-            return {
-                "status": "failed",
-                "data": {"error": "Could not establish ground truth IP for VPN operations"}
-            }
+    return {
+        "status": "success" if all_results else "partial",
+        "data": {
+            "vulnerabilities_found": len(all_results),
+            "records": all_results,
+            "processing_time": total_time,
+            "output_file": output_file,
+            "engine": engine
+        }
+    }
 
+def lookup_cve_records(ctx, services_list):
+    """
+    Resolve services into CVE records: the offline index when available, otherwise
+    vulnx through the scheduler behind the shared VPN. Blocking; returns
+    (primary_results, fallback_results, engine) and raises if the lookup fails.
+    """
+    # Offline index answers in-process: no vulnx, no rate limit, no VPN rotation
+    cve_index = get_cve_index()
+    if cve_index:
         try:
-            start_time = time.time()
-
-            logging.info(f"🔍 Starting CVE lookup for {len(services_list)} services (version-first strategy)")
+            primary_results, fallback_results = run_offline_lookup(cve_index, services_list)
+            return primary_results, fallback_results, "offline_index"
+        except Exception as e:
+            logging.error(f"Offline CVE lookup failed, falling back to vulnx: {e}")
 
-            # Pass 1: Primary Scan (version-based where available, otherwise service-name)
-            primary_results = run_scan_pass(services_list, is_fallback_pass=False)
-            all_results.extend(primary_results)
+    # Establish the ground truth IP (only the first concurrent lookup does the real work)
+    if not vpn_rotation.acquire(get_initial_public_ip):
+        raise RuntimeError("Could not establish ground truth IP for VPN operations")
 
-            # Pass 2: Fallback Scan (service-name only for failed version-based searches)
-            fallback_results = []
-            if fallback_services:
-                logging.info(f"🔄 Starting fallback scan for {len(fallback_services)} services that failed version-based lookup")
-                fallback_results = run_scan_pass(fallback_services, is_fallback_pass=True)
-                all_results.extend(fallback_results)
+    try:
+        logging.info(f"🔍 Starting CVE lookup for {len(services_list)} services (version-first strategy, scheduled)")
 
-            total_time = time.time() - start_time
-            logging.info(f"\n✅🎉 CVE LOOKUP COMPLETED in {total_time:.2f} seconds.")
-            logging.info(f"📊 Final Results: {len(primary_results)} primary + {len(fallback_results)} fallback = {len(all_results)} total vulnerabilities")
+        # Primary and service-name fallback queries share the scheduler's priority queue
+        primary_results, fallback_results = run_scheduled_lookup(ctx, services_list)
 
-            # Create result folder using settings
-            result_folder = settings.results_dir
-            os.makedirs(result_folder, exist_ok=True)
+        cve_cache = get_cve_cache()
+        if cve_cache:
+            logging.info(f"🗄️ CVE cache stats: {cve_cache.stats()}")
+        return primary_results, fallback_results, "vulnx"
+    finally:
+        logging.info("🔌 CVE lookup finished. Triggering final cleanup...")
+        vpn_rotation.release(lambda: execute_vpn_command(["disconnect"]))
+        logging.info("✅ CVE cleanup complete.")
 
-            # Save results to .txt file in result folder with scan-specific naming
-            output_file = None
-            if all_results:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                # Use scan_id for unique naming - will be set in report formatting
-                output_file = f"{result_folder}/cve_results_{timestamp}.txt"
+@timed("cve_lookup")
+async def cve_vulnerability_lookup(services_list: list, ctx: ScanContext = None) -> dict:
+    """Main CVE lookup function that orchestrates the two-pass scan."""
+    if ctx is None:
+        ctx = get_current_scan_context() or ScanContext("standalone", "", "")
 
-                try:
-                    with open(output_file, "w", encoding="utf-8") as f:
-                        f.write(f"CVE Vulnerability Scan Results\n")
-                        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                        f.write(f"Total vulnerabilities found: {len(all_results)}\n")
-                        f.write(f"Processing time: {total_time:.2f} seconds\n")
-                        f.write("=" * 80 + "\n\n")
-                        f.writelines(all_results)
-
-                    # Store the .txt file path in global state for later enhancement
-                    global txt_file_path
-                    txt_file_path = output_file
-                    logging.info(f"✍️ CVE results saved to: {output_file}")
-                except Exception as e:
-                    logging.error(f"Failed to save CVE results to file: {e}")
-                    # Still set txt_file_path to None explicitly on failure
-                    txt_file_path = None
-                    output_file = None
+    # Incremental rescans reuse the stored CVE records of services that did not change
+    reused_records = []
+    baseline = _incremental_baseline(ctx)
+    if baseline:
+        reused_records, services_list = split_incremental_services(services_list, baseline)
+        logging.info(f"♻️ Reusing CVE results of {len(reused_records)} records; {len(services_list)} new or changed services to look up")
 
-            return {
-                "status": "success" if all_results else "partial",
-                "data": {
-                    "vulnerabilities_found": len(all_results),
-                    "detailed_results": "".join(all_results) if all_results else "",
-                    "processing_time": total_time,
-                    "output_file": output_file
-                }
-            }
+    def run_cve_lookup():
+        if not services_list:
+            return save_cve_results(ctx, reused_records, [], time.time(), "fingerprint")
 
+        start_time = time.time()
+        try:
+            primary_results, fallback_results, engine = lookup_cve_records(ctx, services_list)
         except Exception as e:
             logging.error(f"CVE lookup failed: {e}")
             return {"status": "failed", "data": {"error": str(e)}}
-        finally:
-            logging.info("🔌 CVE lookup finished. Triggering final cleanup...")
-            execute_vpn_command(["disconnect"])
-            logging.info("✅ CVE cleanup complete.")
+        return save_cve_results(ctx, reused_records + primary_results, fallback_results, start_time, engine)
 
     return await asyncio.to_thread(run_cve_lookup)
 
 # --- 4. LANGGRAPH STATE NODES ---
+# Output budget for the risk-assessment call (score, level and a handful of recommendations)
+REPORT_RISK_MAX_TOKENS = 400
+
 # Initialize LLM
 _llm_instance = None
 
@@ -943,81 +1231,90 @@ def get_all_scan_tools():
         'deep': [deep_scan_ports_os, deep_scan_versions, cvelook_deep]
     }
 
+@timed("node.tool_selection")
 async def tool_selection_node(state: ScanState) -> ScanState:
-    """LangGraph Node 1: Tool selection based on scan type."""
+    """LangGraph Node 1: Tool selection from the compiled scan plan (LLM only for free-form scan types)."""
+    state["scan_context"].set_phase("tool_selection")
 
-    llm = get_llm()
     all_tools = get_all_scan_tools()
+    all_tool_functions = {tool.name: tool for tool_list in all_tools.values() for tool in tool_list}
 
-    # Create tool selection prompt
-    tool_selection_prompt = f"""You are a cybersecurity scanning expert. You MUST select ALL the appropriate tools for a {state['scan_type']} scan on target: {state['target']}
+    plan = get_scan_plan(state['scan_type'], state.get('user_id'))
+    if plan is not None:
+        state["selected_tools"] = [all_tool_functions[name] for name in plan.tool_names]
+        state["tool_stages"] = plan.stages
+        state["messages"].append(HumanMessage(content=f"Selected {len(plan.tool_names)} tools for {state['scan_type']} scan (plan: {plan.name})"))
+        return state
 
-Available tools by scan type:
-- Light Scan Tools: host_connectivity_tool, light_scan_ports_os, light_scan_versions, http_service_tool, cvelook_light (SELECT ALL 5 FOR LIGHT)
-- Medium Scan Tools: medium_scan_ports_os, medium_scan_versions, cvelook_medium (SELECT ALL 3 FOR MEDIUM)
-- Deep Scan Tools: deep_scan_ports_os, deep_scan_versions, cvelook_deep (SELECT ALL 3 FOR DEEP)
+    # Free-form scan request: let the LLM pick from the available tools
+    llm = get_llm()
+    tool_descriptions = "\n".join(f"- {tool.name}: {tool.description}" for tool in all_tool_functions.values())
+    tool_selection_prompt = f"""You are a cybersecurity scanning expert. Select the tools needed for this scan request on target: {state['target']}
 
-IMPORTANT: For a {state['scan_type']} scan, you MUST select ALL tools for that scan type.
-- cvelook_* tools perform CVE vulnerability lookup using vulnx with VPN rotation
-- These tools require nmap version scan data as input to find vulnerabilities
+Scan request: {state['scan_type']}
 
-Respond with ONLY a comma-separated list of tool names. DO NOT include any explanations.
+Available tools:
+{tool_descriptions}
 
-REQUIRED responses:
-- For light scan: host_connectivity_tool,light_scan_ports_os,light_scan_versions,http_service_tool,cvelook_light
-- For medium scan: medium_scan_ports_os,medium_scan_versions,cvelook_medium
-- For deep scan: deep_scan_ports_os,deep_scan_versions,cvelook_deep
+IMPORTANT:
+- cvelook_* tools perform CVE vulnerability lookup and require a *_versions tool in the selection
+- Select one ports_os/versions pair matching the requested depth
 
-Your response for {state['scan_type']} scan:"""
+Respond with ONLY a comma-separated list of tool names. DO NOT include any explanations.
+
+Your response:"""
 
     try:
-        response = await asyncio.to_thread(llm.invoke, tool_selection_prompt)
+        with llm_span("tool_selection"):
+            response = await asyncio.to_thread(llm.invoke, tool_selection_prompt)
         selected_tool_names = [name.strip() for name in response.content.split(',')]
+        selected_tools = [all_tool_functions[name] for name in selected_tool_names if name in all_tool_functions]
 
-        # Map tool names to actual tool functions
-        all_tool_functions = {}
-        for tool_list in all_tools.values():
-            for tool in tool_list:
-                all_tool_functions[tool.name] = tool
-
-        selected_tools = []
-        for tool_name in selected_tool_names:
-            if tool_name in all_tool_functions:
-                selected_tools.append(all_tool_functions[tool_name])
-
-        # Validation: Ensure we have the correct number of tools for the scan type
-        expected_counts = {'light': 5, 'medium': 3, 'deep': 3}
-        expected_count = expected_counts.get(state['scan_type'].lower(), 0)
-
-        if len(selected_tools) != expected_count:
-            selected_tools = all_tools.get(state['scan_type'].lower(), [])
-
+        if not selected_tools:
+            selected_tools = all_tools['light']
         state["selected_tools"] = selected_tools
         state["messages"].append(HumanMessage(content=f"Selected {len(selected_tools)} tools for {state['scan_type']} scan"))
-
         return state
 
     except Exception as e:
         state["errors"].append(f"Tool selection failed: {str(e)}")
-        state["selected_tools"] = all_tools.get(state['scan_type'].lower(), [])
+        state["selected_tools"] = all_tools['light']
         return state
 
+async def invoke_timed_tool(scan_tool, tool_input):
+    """Run a LangGraph tool as a span named after it; a failed result marks the span failed."""
+    with span(f"tool.{scan_tool.name}") as attrs:
+        result = await scan_tool.ainvoke(tool_input)
+        if isinstance(result, dict) and result.get("status") == "failed":
+            attrs["status"] = "failed"
+        return result
+
+@timed("node.tool_execution")
 async def tool_execution_node(state: ScanState) -> ScanState:
     """LangGraph Node 2: Execute selected tools in parallel."""
 
     try:
+        state["scan_context"].set_phase("port_and_service_scan")
         # Execute non-CVE tools first, then CVE tools
         non_cve_tools = [tool for tool in state['selected_tools'] if not tool.name.startswith('cvelook_')]
         cve_tools = [tool for tool in state['selected_tools'] if tool.name.startswith('cvelook_')]
 
-        # Create tasks for parallel execution of non-CVE tools
-        tasks = []
-        for tool in non_cve_tools:
-            task = tool.ainvoke(state['target'])
-            tasks.append(task)
-
-        # Execute all non-CVE tools in parallel
-        non_cve_results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Run non-CVE tools stage by stage as laid out by the scan plan (one parallel stage otherwise)
+        tools_by_name = {tool.name: tool for tool in non_cve_tools}
+        stages = [[tools_by_name[name] for name in stage if name in tools_by_name] for stage in state.get('tool_stages') or []]
+        staged = {tool.name for stage in stages for tool in stage}
+        unstaged = [tool for tool in non_cve_tools if tool.name not in staged]
+        if unstaged:
+            stages.append(unstaged)
+
+        non_cve_tools, non_cve_results = [], []
+        for stage in stages:
+            if not stage:
+                continue
+            # Execute the tools of this stage in parallel
+            stage_results = await asyncio.gather(*[invoke_timed_tool(tool, state['target']) for tool in stage], return_exceptions=True)
+            non_cve_tools.extend(stage)
+            non_cve_results.extend(stage_results)
 
         # Combine all results
         tool_results = []
@@ -1029,35 +1326,21 @@ async def tool_execution_node(state: ScanState) -> ScanState:
 
         # Execute CVE tools if we have them
         if cve_tools:
-            # Get nmap version data from version scan results and preprocess with GPT
-            nmap_version_data = ""
+            # Get nmap services from the version scan results
+            version_services = []
             for i, result in enumerate(non_cve_results):
                 tool_name = non_cve_tools[i].name
                 if 'version' in tool_name and isinstance(result, dict) and result.get("status") == "success":
                     data = result.get("data", {})
                     if "services" in data and data["services"]:
-                        # Format the services data in a way GPT can understand
-                        services_info = []
-                        for svc in data["services"]:
-                            port = svc.get('port', '')
-                            service = svc.get('service', '')
-                            version = svc.get('version', '').strip()
-                            svc_state = svc.get('state', 'unknown')
-                            protocol = svc.get('protocol', 'tcp')
-
-                            # Format with full details for GPT processing
-                            if version:
-                                services_info.append(f"Port {port}/{protocol}: {service} version {version} (state: {svc_state})")
-                            else:
-                                services_info.append(f"Port {port}/{protocol}: {service} (no version detected) (state: {svc_state})")
-                        nmap_version_data = "\n".join(services_info)
+                        version_services = data["services"]
                         break
 
-            # Initialize GPT-selected services (will be populated if GPT preprocessing succeeds)
+            # Initialize selected services (will be populated once services are normalized)
             state["gpt_selected_services"] = []
 
-            # Preprocess nmap data with GPT and execute CVE tools
-            if nmap_version_data:
+            # Normalize services and execute CVE tools
+            if version_services:
                 # Determine scan type from current state
                 try:
                     scan_type = state['scan_type']
@@ -1066,31 +1349,28 @@ async def tool_execution_node(state: ScanState) -> ScanState:
                     # Fallback to a default scan type
                     scan_type = "light"
 
-                # Preprocess services with GPT first
                 try:
-                    logging.info(f"🔄 Starting GPT preprocessing for {scan_type} scan...")
-                    processed_services = await preprocess_services_with_gpt(nmap_version_data, scan_type)
-                    logging.info(f"✅ GPT preprocessing completed: {len(processed_services) if processed_services else 0} services")
+                    processed_services = await select_services_for_cve_lookup(version_services, scan_type)
 
-                    # Store GPT-selected services in state for reporting
-                    state["gpt_selected_services"] = processed_services if processed_services else []
+                    # Store selected services in state for reporting
+                    state["gpt_selected_services"] = processed_services
 
-                    # BACKUP: Also store in global variable
-                    global global_selected_services
-                    global_selected_services = processed_services if processed_services else []
+                    # BACKUP: Also store in the scan context
+                    ctx = state["scan_context"]
+                    ctx.selected_services = processed_services
                     logging.info(f"🔍 DEBUG: tool_execution_node stored {len(state.get('gpt_selected_services', []))} selected services in state")
-                    logging.info(f"🔍 DEBUG: tool_execution_node stored {len(global_selected_services)} selected services in global variable")
+                    logging.info(f"🔍 DEBUG: tool_execution_node stored {len(ctx.selected_services)} selected services in scan context")
 
                     if processed_services:
-                        # Execute CVE tools with preprocessed services list as JSON string
-                        import json
+                        # Execute CVE tools with the selected services list as JSON string
                         services_json = json.dumps(processed_services)
                         logging.info(f"🔍 Starting CVE lookup for {len(cve_tools)} CVE tools...")
+                        ctx.set_phase("cve_lookup")
 
                         cve_tasks = []
                         for tool in cve_tools:
                             logging.info(f"📡 Calling CVE tool: {tool.name}")
-                            task = tool.ainvoke(services_json)
+                            task = invoke_timed_tool(tool, services_json)
                             cve_tasks.append(task)
 
                         cve_results = await asyncio.gather(*cve_tasks, return_exceptions=True)
@@ -1112,17 +1392,16 @@ async def tool_execution_node(state: ScanState) -> ScanState:
                             }
                         })
                     else:
-                        # If GPT preprocessing failed, create dummy results
+                        # No open service qualified for CVE lookup
                         for tool in cve_tools:
-                            tool_results.append({"status": "failed", "data": {"error": "GPT preprocessing returned no services"}})
+                            tool_results.append({"status": "failed", "data": {"error": "No services selected for CVE lookup"}})
                 except Exception as e:
-                    # If GPT preprocessing failed, create dummy results
-                    logging.error(f"🔍 DEBUG: GPT preprocessing failed in tool_execution_node: {e}")
+                    logging.error(f"🔍 DEBUG: Service selection failed in tool_execution_node: {e}")
                     for tool in cve_tools:
-                        tool_results.append({"status": "failed", "data": {"error": f"GPT preprocessing failed: {str(e)}"}})
+                        tool_results.append({"status": "failed", "data": {"error": f"Service selection failed: {str(e)}"}})
             else:
                 # If no nmap version data available, create dummy results
-                logging.warning("🔍 DEBUG: No nmap version data available - GPT preprocessing skipped")
+                logging.warning("🔍 DEBUG: No nmap version data available - CVE lookup skipped")
                 for tool in cve_tools:
                     tool_results.append({"status": "failed", "data": {"error": "No nmap version data available"}})
 
@@ -1180,11 +1459,11 @@ async def tool_execution_node(state: ScanState) -> ScanState:
 
                 # Handle CVE vulnerability data from cvelook tools
                 if tool_name.startswith('cvelook_'):
-                    if "detailed_results" in data and data["detailed_results"]:
+                    if data.get("records"):
                         all_vulnerabilities.append({
                             "tool": tool_name,
                             "vulnerabilities_found": data.get("vulnerabilities_found", 0),
-                            "detailed_results": data["detailed_results"],
+                            "records": data["records"],
                             "processing_time": data.get("processing_time", 0)
                         })
 
@@ -1212,10 +1491,33 @@ async def tool_execution_node(state: ScanState) -> ScanState:
             logging.error(f"Failed to append error to state: {append_error}")
         return state
 
+async def assess_scan_risk(scan_data: dict) -> dict:
+    """Ask the LLM for risk score, level and recommendations; heuristic fallback if that fails."""
+    try:
+        llm = get_llm()
+        with llm_span("risk_assessment"):
+            response = await llm.ainvoke(
+                [HumanMessage(content=build_risk_prompt(scan_data))],
+                max_tokens=REPORT_RISK_MAX_TOKENS
+            )
+        assessment = parse_risk_assessment(response.content)
+        if assessment:
+            assessment["source"] = "llm"
+            return assessment
+        logging.warning(f"Unusable LLM risk assessment, using heuristic: {response.content[:200]}")
+    except Exception as e:
+        logging.error(f"LLM risk assessment failed, using heuristic: {e}")
+
+    assessment = heuristic_risk_assessment(scan_data)
+    assessment["source"] = "heuristic"
+    return assessment
+
+@timed("node.report_formatting")
 async def report_formatting_node(state: ScanState) -> ScanState:
     """LangGraph Node 3: Create a fast, focused summary report."""
 
     try:
+        state["scan_context"].set_phase("report_formatting")
         import time
         from datetime import datetime
         scan_start = state.get("scan_start_time", 0)
@@ -1252,9 +1554,13 @@ async def report_formatting_node(state: ScanState) -> ScanState:
 
         # Extract actual service data from tool results if services state is empty/incorrect
         actual_services = []
+        version_scan_ok, scanned_ip = False, ""
         for tool_name, result in state.get("tool_results", {}).items():
             if "version" in tool_name and isinstance(result, dict) and result.get("status") == "success":
                 data = result.get("data", {})
+                version_scan_ok = True
+                hosts = (data.get("parsed_data") or {}).get("hosts") or []
+                scanned_ip = hosts[0].get("ip", "") if hosts else ""
                 if "services" in data and data["services"]:
                     actual_services = data["services"]
                     logging.info(f"🔧 Found {len(actual_services)} services from {tool_name}")
@@ -1300,7 +1606,6 @@ async def report_formatting_node(state: ScanState) -> ScanState:
 
         # Count critical/vulnerable ports (ports with services that have versions)
         critical_ports = []
-        vulnerable_ports = []
 
         for service in final_services:
             if isinstance(service, dict):
@@ -1309,19 +1614,16 @@ async def report_formatting_node(state: ScanState) -> ScanState:
                 if port and version and version.strip():
                     critical_ports.append(port)
 
-        # Count vulnerable ports from CVE results
+        # Count vulnerable ports from the CVE records
         total_cves = 0
-        cve_details = []
+        cve_records = []
 
         for vuln_result in vulnerabilities:
             if isinstance(vuln_result, dict):
-                vuln_count = vuln_result.get("vulnerabilities_found", 0)
-                total_cves += vuln_count
+                total_cves += vuln_result.get("vulnerabilities_found", 0)
+                cve_records.extend(vuln_result.get("records", []))
 
-                # Extract CVE details from detailed results
-                detailed = vuln_result.get("detailed_results", "")
-                if detailed and "CVE ID:" in detailed:
-                    vulnerable_ports.extend([p for p in critical_ports])  # All critical ports are potentially vulnerable
+        vulnerable_ports = [record["port"] for record in cve_records if record.get("cve_id")]
 
         # Extract services data properly - use actual detected services (all of them)
         services_list = []
@@ -1338,11 +1640,11 @@ async def report_formatting_node(state: ScanState) -> ScanState:
         # Get GPT-selected services for inclusion in JSON - multiple fallback sources (MOVED UP)
         gpt_selected_services = state.get("gpt_selected_services", [])
 
-        # Fallback 1: Check global variable
+        # Fallback 1: Check the scan context
+        ctx = state["scan_context"]
         if not gpt_selected_services:
-            global global_selected_services
-            gpt_selected_services = global_selected_services
-            logging.info(f"🔍 DEBUG: Using global fallback - found {len(gpt_selected_services)} selected services")
+            gpt_selected_services = ctx.selected_services
+            logging.info(f"🔍 DEBUG: Using scan context fallback - found {len(gpt_selected_services)} selected services")
 
         # Fallback 2: Check tool results for selected services carrier
         if not gpt_selected_services:
@@ -1358,51 +1660,9 @@ async def report_formatting_node(state: ScanState) -> ScanState:
         # Determine max CVEs based on number of GPT-selected services (should match)
         max_cves = len(gpt_selected_services) if gpt_selected_services else 999  # No limit if no GPT services
 
-        cve_list = []
-        for vuln_result in vulnerabilities:
-            if isinstance(vuln_result, dict) and vuln_result.get("detailed_results"):
-                detailed = vuln_result.get("detailed_results", "")
-                # Parse CVE details from the formatted output
-                if "CVE ID:" in detailed:
-                    cve_blocks = detailed.split("----------------------------------------")
-                    for block in cve_blocks[:max_cves]:  # Limit based on selected services count
-                        if "CVE ID:" in block:
-                            cve_info = {}
-                            lines = block.split('\n')
-
-                            # Parse all lines to find header and extract information
-                            for line in lines:
-                                line = line.strip()
-
-                                # Look for header line anywhere in the block: [Port: 80 | Service: http | Version: 2.2.8 (Version-Based)]
-                                if line.startswith('[Port:') and '|' in line:
-                                    parts = line.split('|')
-                                    # Extract port
-                                    if len(parts) > 0:
-                                        port_part = parts[0].replace('[Port:', '').strip()
-                                        if port_part:
-                                            cve_info['port'] = port_part
-                                    # Extract service
-                                    if len(parts) > 1:
-                                        service_part = parts[1].replace('Service:', '').strip()
-                                        if service_part:
-                                            cve_info['service'] = service_part
-
-                                # Parse other CVE details
-                                elif 'CVE ID:' in line:
-                                    cve_info['cve_id'] = line.split('CVE ID:')[1].strip()
-                                elif 'Description:' in line:
-                                    cve_info['description'] = line.split('Description:')[1].strip()
-                                elif 'Impact:' in line:
-                                    cve_info['impact'] = line.split('Impact:')[1].strip()
-                                elif 'Severity:' in line:
-                                    cve_info['severity'] = line.split('Severity:')[1].strip()
-                                elif 'CVSS Score:' in line:
-                                    cve_info['cvss_score'] = line.split('CVSS Score:')[1].strip()
-                            if cve_info.get('cve_id'):
-                                cve_list.append(cve_info)
-
-        # Create structured data for GPT to format as JSON
+        cve_list = [to_report_vulnerability(record) for record in cve_records[:max_cves] if record.get("cve_id")]
+
+        # Structured scan data the report is built from
         scan_data = {
             "target": state['target'],
             "scan_type": state['scan_type'],
@@ -1421,149 +1681,34 @@ async def report_formatting_node(state: ScanState) -> ScanState:
             "vulnerabilities": cve_list
         }
 
-        # Debug: Log the data being sent to GPT
-        logging.info(f"📤 Sending to GPT - Scan duration: {scan_data.get('scan_duration', 0)}s")
-        logging.info(f"📤 Sending to GPT - Services count: {len(scan_data.get('services', []))}")
-        logging.info(f"📤 Sending to GPT - GPT selected services count: {len(scan_data.get('gpt_selected_services', []))}")
-        logging.info(f"📤 Sending to GPT - OS info: {scan_data.get('os_details', {}).get('name', 'None')}")
-        logging.info(f"📤 Sending to GPT - CVEs: {scan_data.get('cves_found', 0)}")
-
-        # Create compact summary for GPT instead of full data
-        compact_data = {
-            "target": scan_data["target"],
-            "scan_type": scan_data["scan_type"],
-            "scan_duration": scan_data["scan_duration"],
-            "ports_scanned": scan_data["ports_scanned"],
-            "open_ports": scan_data["open_ports"],
-            "critical_ports": scan_data["critical_ports"],
-            "vulnerable_ports": scan_data["vulnerable_ports"],
-            "cves_found": scan_data["cves_found"],
-            "port_range": scan_data["scan_coverage"]["port_range"],
-            "os_data": scan_data["os_details"] if scan_data["os_details"] else {},
-            "services_count": len(scan_data["services"]),
-            "vuln_count": len(scan_data["vulnerabilities"])
-        }
-
-        # Fast GPT call to format as clean JSON
-        llm = get_llm()
-
-        # Create compact services string (first 5 services)
-        services_str = str(scan_data["services"][:5]) if scan_data["services"] else "[]"
-        vulns_str = str(scan_data["vulnerabilities"][:3]) if scan_data["vulnerabilities"] else "[]"
-
-        prompt = f"""Format scan data as complete JSON report:
-
-Stats: {compact_data['target']} | {compact_data['scan_type']} scan | {compact_data['scan_duration']}s
-Ports: {compact_data['open_ports']}/{compact_data['ports_scanned']} open | CVEs: {compact_data['cves_found']}
-OS: {compact_data['os_data']}
-Services (top 5): {services_str}
-Vulnerabilities (top 3): {vulns_str}
-
-Based on the scan data with {compact_data['open_ports']} open ports and {compact_data['cves_found']} CVEs found, calculate appropriate risk score 1-10 and generate recommendations.
-
-IMPORTANT: risk_score must be a NUMBER between 1-10 (not a string). Calculate based on:
-- Number of CVEs found (more CVEs = higher score)
-- Number of open/vulnerable ports (more ports = higher score)
-- Severity of vulnerabilities
-
-risk_level must be one of: "low", "medium", "high", "critical"
-
-Return complete valid JSON:
-
-{{
-  "summary": {{
-    "target": "{compact_data['target']}",
-    "scan_type": "{compact_data['scan_type']}",
-    "scan_duration": {compact_data['scan_duration']},
-    "timestamp": "current_timestamp",
-    "ports_scanned": {compact_data['ports_scanned']},
-    "open_ports": {compact_data['open_ports']},
-    "critical_ports": {compact_data['critical_ports']},
-    "vulnerable_ports": {compact_data['vulnerable_ports']},
-    "cves_found": {compact_data['cves_found']},
-    "risk_score": calculate_numeric_value_1_to_10,
-    "risk_level": "low_medium_high_or_critical"
-  }},
-  "scan_coverage": {{
-    "port_range": "{compact_data['port_range']}",
-    "total_ports_scanned": {compact_data['ports_scanned']},
-    "scan_techniques": ["TCP SYN scan", "OS detection", "Service detection", "CVE lookup"]
-  }},
-  "os_information": {json.dumps(compact_data['os_data']) if compact_data['os_data'] else "{}"},
-  "risk_assessment": {{
-    "risk_score": use_same_numeric_value_as_summary_risk_score,
-    "risk_level": use_same_value_as_summary_risk_level,
-    "recommendations": ["generate", "array", "of", "specific", "security", "recommendations"]
-  }},
-  "services": {json.dumps(scan_data["services"]) if scan_data["services"] else "[]"},
-  "gpt_selected_services": {json.dumps(scan_data["gpt_selected_services"]) if scan_data["gpt_selected_services"] else "[]"},
-  "vulnerabilities": {json.dumps(scan_data["vulnerabilities"]) if scan_data["vulnerabilities"] else "[]"}
-}}"""
-
-        response = await asyncio.to_thread(llm.invoke, [HumanMessage(content=prompt)])
-        gpt_json_response = response.content
-
-        # Debug: Log the GPT response length and first part
-        logging.info(f"📥 GPT response length: {len(gpt_json_response)} characters")
-        logging.info(f"📥 GPT response starts with: {gpt_json_response[:200]}")
-        logging.info(f"📥 GPT response ends with: {gpt_json_response[-200:]}")
-
-        # Parse and validate the JSON response
-        try:
-            # Clean the response - sometimes GPT includes extra text
-            json_start = gpt_json_response.find('{')
-            json_end = gpt_json_response.rfind('}') + 1
-
-            if json_start >= 0 and json_end > json_start:
-                clean_json = gpt_json_response[json_start:json_end]
-                formatted_data = json.loads(clean_json)
-
-                # Add real timestamp and user_id
-                if "summary" in formatted_data:
-                    formatted_data["summary"]["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    formatted_data["summary"]["user_id"] = state.get('user_id', '')
-
-                logging.info("✅ Successfully parsed GPT JSON response")
-
-                # ALWAYS ensure GPT-selected services are included (use the fallback-resolved variable)
-                formatted_data["gpt_selected_services"] = gpt_selected_services
-                logging.info(f"🎯 Added {len(gpt_selected_services)} selected services to formatted data")
-            else:
-                raise json.JSONDecodeError("No valid JSON found", gpt_json_response, 0)
-
-        except json.JSONDecodeError as e:
-            # If GPT fails to return valid JSON, log the error and create structured fallback
-            logging.error(f"❌ GPT JSON parsing failed: {e}")
-            logging.error(f"📝 Raw GPT response: {gpt_json_response}")
-
-            formatted_data = {
-                "error": "GPT JSON parsing failed",
-                "raw_gpt_response": gpt_json_response,
-                "summary": {
-                    "target": state['target'],
-                    "scan_type": state['scan_type'],
-                    "user_id": state.get('user_id', ''),
-                    "scan_duration": round(scan_duration, 2),
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "ports_scanned": scan_coverage["total_ports_scanned"],
-                    "open_ports": len(open_ports),
-                    "critical_ports": len(set(critical_ports)),
-                    "vulnerable_ports": len(set(vulnerable_ports)),
-                    "cves_found": total_cves,
-                    "risk_score": 0,
-                    "risk_level": "unknown"
-                },
-                "scan_coverage": scan_coverage,
-                "os_information": os_details if os_details else {},
-                "risk_assessment": {
-                    "risk_score": 0,
-                    "risk_level": "unknown",
-                    "recommendations": ["GPT processing failed"]
-                },
-                "services": services_list,
-                "gpt_selected_services": state.get("gpt_selected_services", []),
-                "vulnerabilities": cve_list
-            }
+        logging.info(f"📊 Report data - Services: {len(scan_data['services'])}, Selected: {len(scan_data['gpt_selected_services'])}, CVEs: {scan_data['cves_found']}, Duration: {scan_data['scan_duration']}s")
+
+        # Only the risk score and recommendations need judgement; everything else is assembled in code
+        risk_assessment = await assess_scan_risk(scan_data)
+        formatted_data = build_scan_results(scan_data, risk_assessment)
+        logging.info(f"✅ Scan results built (risk {risk_assessment['risk_score']}/10 {risk_assessment['risk_level']}, source: {risk_assessment['source']})")
+
+        # Timing stats go into the results and the history used to calibrate the profiles
+        if ctx.timing is not None:
+            formatted_data["scan_coverage"]["timing"] = ctx.timing.summary()
+            timing_history = get_timing_history()
+            if timing_history:
+                await asyncio.to_thread(timing_history.record, state.get('scan_id', 'unknown'), state['target'], state['scan_type'], ctx.timing)
+
+        # Fingerprint this scan; the delta shows what changed since the last one
+        baseline = _incremental_baseline(ctx)
+        formatted_data["summary"]["incremental"] = bool(baseline)
+        if version_scan_ok:
+            fingerprint = build_fingerprint(
+                state.get('user_id', 'unknown'), state['target'], state['scan_type'], scanned_ip,
+                final_services, os_info if isinstance(os_info, str) else "", os_details, gpt_selected_services, cve_records,
+                full_scanned_at=(baseline.get("full_scanned_at") or baseline.get("scanned_at")) if baseline else None
+            )
+            if ctx.baseline:
+                formatted_data["delta"] = compute_delta(ctx.baseline, fingerprint)
+            fingerprint_store = get_fingerprint_store()
+            if fingerprint_store:
+                fingerprint_store.put(fingerprint)
 
         # Create result folder using settings
         result_folder = settings.results_dir
@@ -1584,85 +1729,18 @@ Return complete valid JSON:
         except Exception as save_error:
             logging.error(f"Failed to save JSON file: {save_error}")
 
-        # Enhance the .txt file with JSON data for PDF generation
-        global txt_file_path
-
-        # Only process txt file if it exists and is valid
-        if txt_file_path is not None and isinstance(txt_file_path, str) and os.path.exists(txt_file_path):
+        # Keep the CVE records next to the scan JSON; the text report is rendered from them on demand
+        records_path = ctx.cve_records_path
+        if records_path and os.path.exists(records_path):
+            final_records_path = f"{result_folder}/{user_id}_{target_clean}_{scan_type}_{scan_id}_cves_{timestamp}.jsonl"
             try:
-                # Read existing CVE content
-                with open(txt_file_path, "r", encoding="utf-8") as f:
-                    existing_content = f.read()
-
-                # Create meaningful name for the final .txt file including scan_id
-                target_clean = state['target'].replace('.', '_').replace(':', '_')
-                scan_type = state['scan_type']
-                user_id = state.get('user_id', 'unknown')
-                scan_id = state.get('scan_id', 'unknown')
-                final_txt_filename = f"{result_folder}/{user_id}_{target_clean}_{scan_type}_{scan_id}_report_{timestamp}.txt"
-
-                # Write enhanced content with JSON data to final file
-                with open(final_txt_filename, "w", encoding="utf-8") as f:
-                    # Write summary section
-                    f.write("NETWORK SECURITY SCAN REPORT\n")
-                    f.write("=" * 80 + "\n\n")
-
-                    if "summary" in formatted_data:
-                        summary = formatted_data["summary"]
-                        f.write("SCAN SUMMARY:\n")
-                        f.write(f"Target: {summary.get('target', 'N/A')}\n")
-                        f.write(f"User ID: {summary.get('user_id', 'N/A')}\n")
-                        f.write(f"Scan Type: {summary.get('scan_type', 'N/A')}\n")
-                        f.write(f"Scan Duration: {summary.get('scan_duration', 'N/A')}s\n")
-                        f.write(f"Timestamp: {summary.get('timestamp', 'N/A')}\n")
-                        f.write(f"Ports Scanned: {summary.get('ports_scanned', 'N/A')}\n")
-                        f.write(f"Open Ports: {summary.get('open_ports', 'N/A')}\n")
-                        f.write(f"Critical Ports: {summary.get('critical_ports', 'N/A')}\n")
-                        f.write(f"CVEs Found: {summary.get('cves_found', 'N/A')}\n")
-                        f.write(f"Risk Score: {summary.get('risk_score', 'N/A')}/10\n")
-                        f.write(f"Risk Level: {summary.get('risk_level', 'N/A')}\n")
-                        f.write("\n")
-
-                    # Write detected services (all discovered services)
-                    if "services" in formatted_data and formatted_data["services"]:
-                        f.write("DETECTED SERVICES:\n")
-                        services = formatted_data["services"]
-                        for service in services:
-                            if isinstance(service, dict):
-                                port = service.get('port', 'N/A')
-                                svc_name = service.get('service', 'N/A')
-                                version = service.get('version', 'N/A')
-                                protocol = service.get('protocol', 'tcp')
-                                f.write(f"  Port {port}/{protocol}: {svc_name} {version}\n")
-                        f.write("\n")
-
-                    # Write GPT-selected services for CVE lookup (use the resolved gpt_selected_services variable)
-                    if gpt_selected_services:
-                        f.write("SELECTED SERVICES FOR CVE LOOKUP:\n")
-                        for service in gpt_selected_services:
-                            if isinstance(service, dict):
-                                port = service.get('port', 'N/A')
-                                svc_name = service.get('service', 'N/A')
-                                version = service.get('version', 'N/A')
-                                f.write(f"  Port {port}: {svc_name} {version}\n")
-                        f.write("\n")
-
-                    # Write the original CVE content (without duplication)
-                    f.write(existing_content.replace("CVE Vulnerability Scan Results", "CVE VULNERABILITY DETAILS"))
-
-                # Remove the temporary file
-                try:
-                    os.remove(txt_file_path)
-                except:
-                    pass  # Ignore if file removal fails
-
-                scanning_logger.file_generated("txt", final_txt_filename, state['target'])
-                txt_file_path = final_txt_filename  # Update the path for state
-
+                os.replace(records_path, final_records_path)
+                scanning_logger.file_generated("jsonl", final_records_path, state['target'])
+                ctx.cve_records_path = final_records_path
             except Exception as e:
-                logging.error(f"Failed to enhance .txt file: {e}")
+                logging.error(f"Failed to move CVE records file: {e}")
         else:
-            logging.warning("No .txt file path found to enhance")
+            logging.warning("No CVE records file to keep")
 
         # Store both JSON data and file path in state
         state["formatted_report"] = json.dumps(formatted_data, indent=2)
@@ -1768,34 +1846,57 @@ def get_workflow():
     """Get or create the workflow instance."""
     global _workflow
     if _workflow is None:
+        # Compile the scan plans once, against the tools the workflow actually provides
+        load_scan_plans(tool.name for tool_list in get_all_scan_tools().values() for tool in tool_list)
         _workflow = create_scan_workflow()
     return _workflow
 
 # --- 6. MAIN EXECUTION CONTROLLER ---
-async def execute_scan_with_controller(scan_type: str, target: str, user_id: str = "unknown", scan_id: str = None) -> dict:
-    """Main scan execution using LangGraph StateGraph workflow."""
-    global txt_file_path
+async def execute_scan_with_controller(scan_type: str, target: str, user_id: str = "unknown", scan_id: str = None,
+                                       progress_callback=None, incremental: bool = False) -> dict:
+    """
+    Main scan execution using LangGraph StateGraph workflow.
 
+    progress_callback, if given, receives (event_type, data) for phase changes and for
+    every host/port nmap reports while the scan is still running.
+    incremental reuses the last fingerprint of the target: only ports whose state
+    changed get version detection and CVE lookup (a full scan runs when there is none).
+    """
+    # Generate scan_id if not provided
+    if scan_id is None:
+        import uuid
+        scan_id = str(uuid.uuid4())
+
+    # Scan-scoped state replaces the old module globals, so concurrent scans never reset each other
+    ctx = ScanContext(scan_id, target, scan_type, user_id)
+    if progress_callback is not None:
+        ctx.add_listener(progress_callback)
+    ctx_token = register_scan_context(ctx)
+    # Cancelling the scan cancels the task running it (and with it every nmap run it awaits)
+    ctx.track_task(asyncio.current_task())
+
+    fingerprint_store = get_fingerprint_store()
+    if fingerprint_store:
+        ctx.baseline = await asyncio.to_thread(fingerprint_store.get, user_id, target, scan_type)
+    ctx.incremental = incremental
+    if incremental and not ctx.baseline:
+        logging.info(f"♻️ No recent fingerprint for {target} ({scan_type}); running a full scan")
+
+    timings = None
     try:
-        # Reset all global variables for clean scan state
-        reset_scan_globals()
-
         import time
         scan_start_time = time.time()
 
-        # Generate scan_id if not provided
-        if scan_id is None:
-            import uuid
-            scan_id = str(uuid.uuid4())
-
         # Initialize state with timing information
         initial_state: ScanState = {
             "target": target,
             "scan_type": scan_type,
             "user_id": user_id,
             "scan_id": scan_id,
+            "scan_context": ctx,
             "messages": [SystemMessage(content=f"Starting {scan_type} scan on {target} for user {user_id} (scan_id: {scan_id})")],
             "selected_tools": [],
+            "tool_stages": [],
             "tool_results": {},
             "open_ports": [],
             "services": [],
@@ -1819,7 +1920,7 @@ async def execute_scan_with_controller(scan_type: str, target: str, user_id: str
             "status": final_state["status"],
             "scan_results": final_state.get("scan_results_json", {}),  # Structured JSON for frontend
             "json_file_path": final_state.get("json_file_path", ""),  # File path for PDF generator
-            "txt_file_path": txt_file_path if txt_file_path else "",  # TXT file path for GPT report generation
+            "cve_records_path": ctx.cve_records_path or "",  # CVE records (JSON Lines) for the PDF generator and CVE store
             "open_ports": final_state["open_ports"],
             "services_detected": final_state["services"],
             "vulnerabilities": final_state["vulnerabilities"],
@@ -1832,10 +1933,12 @@ async def execute_scan_with_controller(scan_type: str, target: str, user_id: str
             },
             "workflow_messages": [msg.content for msg in final_state["messages"] if hasattr(msg, 'content')]
         }
+        timings = final_result["timings"] = finish_scan_timings(ctx, final_result["status"])
 
         return final_result
 
     except Exception as e:
+        timings = finish_scan_timings(ctx, "failed")
         return {
             "target": target,
             "scan_type": scan_type,
@@ -1848,5 +1951,26 @@ async def execute_scan_with_controller(scan_type: str, target: str, user_id: str
             "recommendations": ["Scan failed - check system configuration"],
             "workflow_error": str(e),
             "json_file_path": "",
-            "txt_file_path": txt_file_path if txt_file_path else ""
-        }
\ No newline at end of file
+            "cve_records_path": ctx.cve_records_path or "",
+            "timings": timings
+        }
+    finally:
+        if timings is None:
+            # Cancelled: the phase metrics still count it
+            finish_scan_timings(ctx, "cancelled")
+        release_scan_context(ctx, ctx_token)
+
+def cancel_scan_execution(scan_id: str):
+    """
+    Stop a scan running in this process: its tasks, its nmap/vulnx process groups and
+    the CVE queries only it was waiting for. Other scans and the shared VPN connection
+    are left alone. Returns what was abandoned, or None if the scan is not running here.
+    """
+    ctx = get_scan_context(scan_id)
+    if ctx is None:
+        return None
+    abandoned = dict(ctx.cancel())
+    cve_scheduler = get_cve_scheduler()
+    if cve_scheduler:
+        abandoned.update(cve_scheduler.cancel_owner(scan_id))
+    return abandoned
@@ -0,0 +1,135 @@
+"""
+Rule-based service normalizer
+Turns nmap version-detection output into the short, deduplicated service list used
+for CVE lookup: versions are cleaned with CPE/regex rules, services are ranked with
+a port-priority table, and the list is capped per scan type.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Maximum number of services sent to CVE lookup per scan type
+MAX_SERVICES = {
+    'light': 5,
+    'medium': 10,
+    'deep': 999  # No practical limit for deep scan
+}
+
+# Ports ranked by how attractive they usually are to an attacker (lower = more critical)
+PORT_PRIORITY = {
+    21: 1, 22: 2, 23: 3, 445: 4, 3389: 5, 80: 6, 443: 7, 139: 8, 3306: 9, 5432: 10,
+    1433: 11, 25: 12, 5900: 13, 8080: 14, 8443: 15, 6379: 16, 27017: 17, 9200: 18,
+    111: 19, 2049: 20, 53: 21, 110: 22, 143: 23, 1521: 24, 5985: 25, 161: 26,
+    389: 27, 636: 28, 993: 29, 995: 30, 512: 31, 513: 32, 514: 33, 1099: 34,
+    2121: 35, 3632: 36, 6667: 37, 8009: 38, 8180: 39
+}
+DEFAULT_PORT_PRIORITY = 100
+
+# A version token: starts with a digit, keeps dots/letters/dashes ("4.7p1", "2.2.8", "1.3.5a")
+VERSION_PATTERN = re.compile(r"\d+(?:\.\d+)*[a-z]*\d*(?:[.\-]?[a-z0-9]+)*", re.IGNORECASE)
+
+# Distribution packaging suffixes ("5.0.51a-3ubuntu5", "7.4p1+deb9u1") are not part of the upstream version
+DISTRO_SUFFIX_PATTERN = re.compile(r"[-+~]\d*(?:ubuntu|debian|deb|dfsg|bpo|el|fc|rhel|build).*$", re.IGNORECASE)
+
+# Versions too vague to return useful CVE results
+GENERIC_VERSION_PATTERN = re.compile(r"^\d+(?:\.0)?$")
+
+
+def _cpe_version(cpes) -> str:
+    """Version field of the first nmap CPE that carries one (cpe:/a:openbsd:openssh:4.7p1)."""
+    for cpe in [cpes] if isinstance(cpes, str) else (cpes or []):
+        fields = cpe.split(":")
+        if len(fields) > 4 and fields[4]:
+            return fields[4]
+    return ""
+
+
+def clean_version(version: str, cpes=None) -> Tuple[Optional[str], bool]:
+    """
+    Reduce an nmap version string to a CVE-searchable version.
+
+    Returns (version, parsed): version is None when there is no usable version;
+    parsed is False only when a non-empty string could not be understood at all,
+    which is the case the optional LLM fallback is for.
+    """
+    cpe_version = _cpe_version(cpes)
+    if cpe_version and not GENERIC_VERSION_PATTERN.match(cpe_version):
+        return cpe_version, True
+
+    raw = (version or "").strip()
+    if not raw or raw.lower() in ("none", "unknown"):
+        return None, True
+
+    # Wildcards and ranges ("5.x", "3.X - 4.X") are too generic to search for
+    if re.search(r"\d\.[xX*]\b", raw) or " - " in raw:
+        return None, True
+
+    match = VERSION_PATTERN.search(raw)
+    if not match:
+        return None, False
+
+    token = DISTRO_SUFFIX_PATTERN.sub("", match.group(0)).rstrip(".-")
+    if GENERIC_VERSION_PATTERN.match(token):
+        return None, True
+    return token, True
+
+
+def port_priority(port) -> int:
+    try:
+        return PORT_PRIORITY.get(int(port), DEFAULT_PORT_PRIORITY)
+    except (TypeError, ValueError):
+        return DEFAULT_PORT_PRIORITY
+
+
+def normalize_services(services: List[Dict], scan_type: str) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Build the CVE lookup list from nmap service dicts.
+
+    Returns (selected, unparsed): selected is a list of
+    {"port", "service", "version", "product", "cpe"} dicts (version None when unusable),
+    most critical first and capped for the scan type; unparsed holds the selected
+    entries whose raw version string could not be parsed, with it under "raw_version".
+    """
+    service_limit = MAX_SERVICES.get((scan_type or "").lower(), 5)
+
+    candidates = []
+    for svc in services:
+        if svc.get("state", "open") not in ("open", "unknown"):
+            continue
+        name = (svc.get("service") or "").strip()
+        if not name:
+            continue
+        version, parsed = clean_version(svc.get("version", ""), svc.get("cpe"))
+        try:
+            port = int(svc.get("port"))
+        except (TypeError, ValueError):
+            port = svc.get("port")
+        candidates.append({
+            "port": port,
+            "service": name,
+            "version": version,
+            "product": svc.get("product", ""),
+            "cpe": svc.get("cpe", []),
+            "_raw_version": None if parsed else (svc.get("version") or "").strip()
+        })
+
+    # Most critical first: known-risky ports, then services with a searchable version
+    candidates.sort(key=lambda c: (port_priority(c["port"]), c["version"] is None, str(c["port"])))
+
+    # Same service and version on several ports is one CVE query: keep the highest priority port
+    selected, seen = [], set()
+    for candidate in candidates:
+        key = (candidate["service"].lower(), candidate["version"])
+        if key in seen:
+            continue
+        seen.add(key)
+        selected.append(candidate)
+        if len(selected) >= service_limit:
+            break
+
+    unparsed = []
+    for svc in selected:
+        raw_version = svc.pop("_raw_version")
+        if raw_version:
+            unparsed.append({**svc, "raw_version": raw_version})
+    return selected, unparsed
@@ -0,0 +1,257 @@
+"""
+Adaptive nmap timing profiles
+Turns the RTT and packet loss measured by pinging the target into nmap timing
+flags (template, --min-rate, --max-retries, RTT timeouts, parallelism and
+--host-timeout), re-tunes them between scan phases from how fast the previous
+phase actually went, and keeps a SQLite history of per-phase timings so the
+profile thresholds can be calibrated.
+
+    python -m app.scanning.timing_profiles stats
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+# Ordered fastest to slowest; a target gets the first profile whose RTT and loss limits it fits
+TIMING_PROFILES = [
+    {
+        "name": "lan", "max_rtt_ms": 5, "max_loss": 1.0,
+        "template": "-T5", "min_rate": 5000, "max_retries": 1, "min_parallelism": 64,
+        "version_intensity": 5, "timeout_factor": 1.0
+    },
+    {
+        "name": "regional", "max_rtt_ms": 50, "max_loss": 5.0,
+        "template": "-T4", "min_rate": 1000, "max_retries": 2, "min_parallelism": 32,
+        "version_intensity": 3, "timeout_factor": 1.0
+    },
+    {
+        "name": "wan", "max_rtt_ms": 200, "max_loss": 10.0,
+        "template": "-T4", "min_rate": 300, "max_retries": 3, "min_parallelism": 0,
+        "version_intensity": 2, "timeout_factor": 1.5
+    },
+    {
+        "name": "distant", "max_rtt_ms": None, "max_loss": None,
+        "template": "-T3", "min_rate": 100, "max_retries": 5, "min_parallelism": 0,
+        "version_intensity": 2, "timeout_factor": 2.5
+    }
+]
+
+# Profile used when the target does not answer ping (nmap still scans it with -Pn)
+UNMEASURED_PROFILE = "wan"
+
+# A phase slower than this fraction of the profile's --min-rate is treated as a congested path
+SLOW_RATE_FRACTION = 0.25
+# A phase faster than this multiple of --min-rate can move to the next faster profile
+FAST_RATE_MULTIPLE = 4
+
+PING_RTT_PATTERN = re.compile(r"=\s*[\d.]+/([\d.]+)/[\d.]+")
+PING_LOSS_PATTERN = re.compile(r"([\d.]+)% packet loss")
+
+
+def parse_ping_output(stdout: str) -> Dict:
+    """Average RTT (ms, None if no reply) and packet loss (%) from `ping` output."""
+    rtt_match = PING_RTT_PATTERN.search(stdout or "")
+    loss_match = PING_LOSS_PATTERN.search(stdout or "")
+    return {
+        "rtt_ms": float(rtt_match.group(1)) if rtt_match else None,
+        "loss": float(loss_match.group(1)) if loss_match else 100.0
+    }
+
+
+def _profile_index(name: str) -> int:
+    return next(i for i, profile in enumerate(TIMING_PROFILES) if profile["name"] == name)
+
+
+def select_profile_index(rtt_ms: Optional[float], loss: float) -> int:
+    if rtt_ms is None:
+        return _profile_index(UNMEASURED_PROFILE)
+    for i, profile in enumerate(TIMING_PROFILES):
+        if profile["max_rtt_ms"] is None or (rtt_ms <= profile["max_rtt_ms"] and loss <= profile["max_loss"]):
+            return i
+    return len(TIMING_PROFILES) - 1
+
+
+class TimingProfile:
+    """Timing settings of one scan; observe() re-tunes them after each phase."""
+
+    def __init__(self, rtt_ms: Optional[float], loss: float):
+        self.rtt_ms = rtt_ms
+        self.loss = loss
+        self.index = select_profile_index(rtt_ms, loss)
+        self.initial_profile = self.profile["name"]
+        self.phases: List[Dict] = []
+
+    @property
+    def profile(self) -> Dict:
+        return TIMING_PROFILES[self.index]
+
+    @property
+    def name(self) -> str:
+        return self.profile["name"]
+
+    def scale_timeout(self, timeout: int) -> int:
+        """Process timeout for this profile (distant targets get proportionally longer)."""
+        return int(timeout * self.profile["timeout_factor"])
+
+    def _common_flags(self, timeout: int, processes: int) -> List[str]:
+        profile = self.profile
+        # --min-rate applies per process; shards share the profile's budget
+        min_rate = max(10, profile["min_rate"] // max(1, processes))
+        flags = [
+            profile["template"],
+            "--min-rate", str(min_rate),
+            "--max-retries", str(profile["max_retries"]),
+            # Finish with partial results shortly before the process is killed
+            "--host-timeout", f"{max(10, int(timeout * 0.9))}s"
+        ]
+        if self.rtt_ms is not None:
+            flags += ["--initial-rtt-timeout", f"{max(100, int(self.rtt_ms * 3))}ms"]
+        if profile["min_parallelism"]:
+            flags += ["--min-parallelism", str(profile["min_parallelism"])]
+        return flags
+
+    def discovery_flags(self, timeout: int, processes: int = 1) -> List[str]:
+        """Timing flags for a port discovery pass."""
+        return self._common_flags(timeout, processes)
+
+    def version_flags(self, timeout: int, processes: int = 1) -> List[str]:
+        """Timing flags for an -sV pass."""
+        return self._common_flags(timeout, processes) + ["--version-intensity", str(self.profile["version_intensity"])]
+
+    def observe(self, phase: str, ports: int, elapsed: float, success: bool):
+        """Record a finished phase and re-tune the profile for the next one."""
+        rate = ports / elapsed if elapsed > 0 else 0.0
+        previous = self.name
+        if not success:
+            # Timed out: give the next phase more patience
+            self.index = min(self.index + 1, len(TIMING_PROFILES) - 1)
+        elif ports >= 1000 and rate < self.profile["min_rate"] * SLOW_RATE_FRACTION:
+            self.index = min(self.index + 1, len(TIMING_PROFILES) - 1)
+        elif ports >= 1000 and rate > self.profile["min_rate"] * FAST_RATE_MULTIPLE and self.loss <= 1.0:
+            self.index = max(self.index - 1, 0)
+
+        self.phases.append({
+            "phase": phase,
+            "profile": previous,
+            "ports": ports,
+            "elapsed": round(elapsed, 2),
+            "ports_per_second": round(rate, 1),
+            "success": success
+        })
+        if self.name != previous:
+            logging.info(f"⏱️ Timing re-tuned after {phase}: {previous} -> {self.name} ({rate:.0f} ports/s, success={success})")
+
+    def summary(self) -> Dict:
+        """Timing stats stored with the scan results and in the history."""
+        return {
+            "rtt_ms": self.rtt_ms,
+            "loss": self.loss,
+            "initial_profile": self.initial_profile,
+            "final_profile": self.name,
+            "phases": self.phases
+        }
+
+
+class TimingHistory:
+    """SQLite history of scan phase timings per profile, for calibrating the profile table."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS scan_timings (
+                       scan_id TEXT NOT NULL,
+                       target TEXT NOT NULL,
+                       scan_type TEXT NOT NULL,
+                       rtt_ms REAL,
+                       loss REAL,
+                       phase TEXT NOT NULL,
+                       profile TEXT NOT NULL,
+                       ports INTEGER NOT NULL,
+                       elapsed REAL NOT NULL,
+                       success INTEGER NOT NULL,
+                       recorded_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.commit()
+
+    def record(self, scan_id: str, target: str, scan_type: str, timing: TimingProfile):
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT INTO scan_timings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (scan_id, target, scan_type, timing.rtt_ms, timing.loss, phase["phase"], phase["profile"],
+                         phase["ports"], phase["elapsed"], 1 if phase["success"] else 0, time.time())
+                        for phase in timing.phases
+                    ]
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to record scan timings for {scan_id}: {e}")
+
+    def calibration(self) -> List[Dict]:
+        """Per profile and phase: runs, timeout rate, RTT range, average throughput and duration."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT profile, phase, COUNT(*), AVG(1 - success), MIN(rtt_ms), MAX(rtt_ms),
+                          AVG(CASE WHEN elapsed > 0 THEN ports / elapsed END), AVG(elapsed)
+                   FROM scan_timings GROUP BY profile, phase ORDER BY profile, phase"""
+            ).fetchall()
+        return [
+            {
+                "profile": profile, "phase": phase, "runs": runs,
+                "timeout_rate": round(timeout_rate or 0, 3),
+                "rtt_ms_range": [min_rtt, max_rtt],
+                "avg_ports_per_second": round(rate or 0, 1),
+                "avg_elapsed": round(elapsed or 0, 2)
+            }
+            for profile, phase, runs, timeout_rate, min_rtt, max_rtt, rate, elapsed in rows
+        ]
+
+
+# Global history instance
+_timing_history = None
+
+
+def get_timing_history() -> Optional[TimingHistory]:
+    """Get or create the timing history (None when adaptive timing is disabled or unavailable)."""
+    global _timing_history
+    if _timing_history is None and settings.adaptive_timing_enabled:
+        db_path = settings.timing_history_path or os.path.join(settings.results_dir, "scan_timings.sqlite3")
+        try:
+            _timing_history = TimingHistory(db_path)
+        except Exception as e:
+            logging.error(f"Scan timing history unavailable: {e}")
+            return None
+    return _timing_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect recorded nmap scan timings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show per-profile timing statistics")
+    parser.parse_args()
+
+    history = get_timing_history()
+    if history is None:
+        print(json.dumps({"error": "adaptive timing is disabled"}))
+        return
+    print(json.dumps(history.calibration(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+DNS Resolver Service - Shared async resolver with a TTL cache
+Forward and reverse lookups for discovery, scans and web recon go through one
+resolver: concurrency is bounded, answers are cached for their record TTL,
+names that do not exist (NXDOMAIN, no answer) are cached briefly while timeouts
+and server failures are not, and concurrent lookups of the same name share one query. Bulk lookups run in parallel under
+one overall time budget, so a few hundred hosts take about one timeout window.
+
+dnspython's async resolver is used when installed (record TTLs are honoured);
+otherwise the event loop's getaddrinfo/getnameinfo with the default TTL. Address
+lookups dnspython cannot answer also go to getaddrinfo, so /etc/hosts entries and
+resolv.conf search domains keep working.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.resolver
+    DNSPYTHON_AVAILABLE = True
+except ImportError:
+    DNSPYTHON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Record types the getaddrinfo fallback can answer
+_FALLBACK_FAMILIES = {"A": socket.AF_INET, "AAAA": socket.AF_INET6}
+
+# getaddrinfo errors meaning the name does not exist (anything else may be transient)
+_NONEXISTENT_ERRORS = {socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)}
+
+
+class DnsResolverService:
+    """Async DNS lookups with per-record TTL caching, negative caching and bounded concurrency"""
+
+    def __init__(self):
+        self.timeout = settings.dns_timeout_seconds
+        self._semaphore = asyncio.Semaphore(settings.dns_max_concurrency)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, List[str]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "failures": 0, "timeouts": 0, "over_budget": 0}
+        self._resolver = None
+
+        if DNSPYTHON_AVAILABLE:
+            try:
+                self._resolver = dns.asyncresolver.Resolver()
+                self._resolver.lifetime = self.timeout
+                self._resolver.timeout = self.timeout
+            except Exception as e:
+                logger.warning(f"dnspython resolver unavailable, using system resolver: {e}")
+                self._resolver = None
+
+    async def resolve(self, name: str, rdtype: str = "A") -> List[str]:
+        """Records of one type for a name (empty if it has none or the lookup failed)"""
+        key = (name.lower().rstrip("."), rdtype.upper())
+
+        # An address literal is its own A/AAAA record
+        try:
+            address = ipaddress.ip_address(key[0])
+            if key[1] == ("A" if address.version == 4 else "AAAA"):
+                return [str(address)]
+        except ValueError:
+            pass
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, values = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return list(values)
+            del self._cache[key]
+
+        # Concurrent lookups of the same record share one query
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._stats["coalesced"] += 1
+            try:
+                return list(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The query we waited on was cancelled, not us: run our own
+                return await self.resolve(name, rdtype)
+
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            async with self._semaphore:
+                values, ttl = await self._query(*key)
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        self._store(key, values, ttl)
+        future.set_result(values)
+        return list(values)
+
+    async def reverse(self, ip: str) -> Optional[str]:
+        """Hostname (PTR record) for an IP address, or None"""
+        try:
+            pointer = ipaddress.ip_address(ip).reverse_pointer
+        except ValueError:
+            return None
+        names = await self.resolve(pointer, "PTR")
+        return names[0] if names else None
+
+    async def resolve_many(self, names: Iterable[str], rdtype: str = "A",
+                           budget: Optional[float] = None) -> Dict[str, List[str]]:
+        """
+        Resolve many names at once. Lookups still running when the budget
+        (default settings.dns_bulk_timeout_seconds) runs out are reported as empty.
+        """
+        return await self._bulk({name: self.resolve(name, rdtype) for name in dict.fromkeys(names)}, [], budget)
+
+    async def reverse_many(self, ips: Iterable[str], budget: Optional[float] = None) -> Dict[str, Optional[str]]:
+        """Hostnames for many IPs at once ({ip: hostname or None}), under one time budget"""
+        return await self._bulk({ip: self.reverse(ip) for ip in dict.fromkeys(ips)}, None, budget)
+
+    async def _bulk(self, lookups: Dict, default, budget: Optional[float]) -> Dict:
+        if not lookups:
+            return {}
+        tasks = {key: asyncio.ensure_future(coro) for key, coro in lookups.items()}
+        done, not_done = await asyncio.wait(tasks.values(), timeout=budget or settings.dns_bulk_timeout_seconds)
+        for task in not_done:
+            task.cancel()
+        if not_done:
+            self._stats["over_budget"] += len(not_done)
+            await asyncio.gather(*not_done, return_exceptions=True)
+
+        results = {}
+        for key, task in tasks.items():
+            if task in done and not task.cancelled() and task.exception() is None:
+                results[key] = task.result()
+            else:
+                results[key] = default
+        return results
+
+    async def _query(self, name: str, rdtype: str) -> Tuple[List[str], float]:
+        """(values, ttl) for one record; failures give ([], negative or failure TTL)"""
+        if self._resolver is None:
+            return await self._query_system(name, rdtype)
+        values, ttl = await self._query_dnspython(name, rdtype)
+        if not values and rdtype in _FALLBACK_FAMILIES:
+            # Hosts-file names and search-domain names only resolve through the system resolver
+            system_values, system_ttl = await self._query_system(name, rdtype)
+            if system_values:
+                return system_values, system_ttl
+            ttl = min(ttl, system_ttl)
+        return values, ttl
+
+    async def _query_dnspython(self, name: str, rdtype: str) -> Tuple[List[str], float]:
+        try:
+            answer = await self._resolver.resolve(name, rdtype)
+            values = [record.to_text().rstrip(".") for record in answer]
+            return values, answer.rrset.ttl if answer.rrset is not None else settings.dns_default_ttl_seconds
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return [], settings.dns_negative_ttl_seconds
+        except dns.exception.Timeout:
+            self._stats["timeouts"] += 1
+            return [], settings.dns_failure_ttl_seconds
+        except Exception as e:
+            self._stats["failures"] += 1
+            logger.debug(f"DNS {rdtype} lookup for {name} failed: {e}")
+            return [], settings.dns_failure_ttl_seconds
+
+    async def _query_system(self, name: str, rdtype: str) -> Tuple[List[str], float]:
+        negative_ttl = settings.dns_negative_ttl_seconds
+        loop = asyncio.get_running_loop()
+        try:
+            if rdtype == "PTR":
+                address = _pointer_to_address(name)
+                if address is None:
+                    return [], negative_ttl
+                hostname, _ = await asyncio.wait_for(
+                    loop.getnameinfo((address, 0), socket.NI_NAMEREQD), timeout=self.timeout
+                )
+                return [hostname], settings.dns_default_ttl_seconds
+            if rdtype in _FALLBACK_FAMILIES:
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(name, None, family=_FALLBACK_FAMILIES[rdtype]), timeout=self.timeout
+                )
+                return list(dict.fromkeys(info[4][0] for info in infos)), settings.dns_default_ttl_seconds
+            # Other record types need dnspython
+            return [], negative_ttl
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            return [], settings.dns_failure_ttl_seconds
+        except socket.gaierror as e:
+            if e.errno in _NONEXISTENT_ERRORS:
+                return [], negative_ttl
+            self._stats["failures"] += 1
+            return [], settings.dns_failure_ttl_seconds
+        except socket.herror:
+            return [], negative_ttl
+        except OSError:
+            self._stats["failures"] += 1
+            return [], settings.dns_failure_ttl_seconds
+
+    def _store(self, key: Tuple[str, str], values: List[str], ttl: float):
+        if ttl <= 0:
+            return
+        if values:
+            ttl = min(max(ttl, settings.dns_min_ttl_seconds), settings.dns_max_ttl_seconds)
+        self._cache[key] = (time.monotonic() + ttl, values)
+        self._cache.move_to_end(key)
+        while len(self._cache) > settings.dns_cache_max_entries:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "backend": "dnspython" if self._resolver is not None else "system",
+            "entries": len(self._cache),
+            "in_flight": len(self._inflight),
+            **self._stats
+        }
+
+
+def _pointer_to_address(name: str) -> Optional[str]:
+    """IP address for an in-addr.arpa / ip6.arpa name"""
+    labels = name.rstrip(".").split(".")
+    if name.endswith("in-addr.arpa") and len(labels) == 6:
+        return ".".join(reversed(labels[:4]))
+    if name.endswith("ip6.arpa") and len(labels) == 34:
+        digits = "".join(reversed(labels[:32]))
+        return str(ipaddress.IPv6Address(int(digits, 16)))
+    return None
+
+
+# Global service instance
+_dns_resolver_service = None
+
+def get_dns_resolver_service() -> DnsResolverService:
+    """Get or create the DNS resolver service instance"""
+    global _dns_resolver_service
+    if _dns_resolver_service is None:
+        _dns_resolver_service = DnsResolverService()
+    return _dns_resolver_service
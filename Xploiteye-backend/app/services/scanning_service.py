@@ -6,14 +6,22 @@ Integrates with the scanner engine and manages scan operations
 import asyncio
 import json
 import os
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import logging
 
-from app.models.scan import ScanRequest, ScanResponse, ScanStatus, ScanType, ScanResults, ReportResponse
+from app.models.scan import (
+    BatchScanRequest, BatchScanResponse, ScanRequest, ScanResponse, ScanStatus, ScanType, ScanResults, ReportResponse
+)
 from app.models.user import UserInDB
-from app.scanning.scanner_engine import execute_scan_with_controller
+from app.scanning.scanner_engine import cancel_scan_execution, execute_scan_with_controller
+from app.scanning.batch_scanner import execute_batch_scan, expand_targets
+from app.scanning.scan_context import get_scan_context, get_scan_slots
+from app.scanning.scan_events import TERMINAL_STATUSES, get_scan_event_log, open_scan_event_log
+from app.scanning.results_cache import get_results_cache
+from app.scanning.cve_records import is_records_file, read_jsonl, render_report_text, to_cve_store_entry
 from app.scanning.report_generator.gpt_prompts import generate_full_report
 from app.scanning.report_generator.pdf_generator import generate_pdf_report
 from app.services.cve_service import CVEService
@@ -22,11 +30,17 @@ from app.database.mongodb import get_database
 from config.settings import settings
 from config.logging_config import scanning_logger
 
+# Minimum seconds between Mongo writes of live port/progress events (phase and host events always write)
+PROGRESS_WRITE_INTERVAL = 2.0
+
 class ScanningService:
     """Service for managing network scans"""
 
     def __init__(self):
         self.active_scans: Dict[str, Dict] = {}
+        self.active_batches: Dict[str, Dict] = {}
+        # Background task of each scan or batch still running, so cancelling can stop it
+        self.scan_tasks: Dict[str, asyncio.Task] = {}
         self.db = None
         self.pdf_generation_queue: List[Dict] = []
         self.pdf_worker_running = False
@@ -54,12 +68,15 @@ class ScanningService:
             "results": None,
             "json_file_path": None,
             "txt_file_path": None,
+            "cve_records_path": None,
+            "incremental": scan_request.incremental,
             "errors": [],
             "user": user.dict()  # Store user data for automatic PDF generation
         }
 
         # Store in memory and database
         self.active_scans[scan_id] = scan_data
+        open_scan_event_log(scan_id, user.id).publish("status", {"status": ScanStatus.PENDING.value, "message": "Scan queued"})
 
         try:
             db = await self.get_database()
@@ -68,7 +85,7 @@ class ScanningService:
             logging.error(f"Failed to save scan to database: {e}")
 
         # Start scan in background
-        asyncio.create_task(self._execute_scan(scan_id, scan_request, user))
+        self._track_scan_task(scan_id, asyncio.create_task(self._execute_scan(scan_id, scan_request, user)))
 
         return ScanResponse(
             scan_id=scan_id,
@@ -80,8 +97,26 @@ class ScanningService:
             started_at=started_at
         )
 
+    def _track_scan_task(self, scan_id: str, task: asyncio.Task):
+        self.scan_tasks[scan_id] = task
+        task.add_done_callback(lambda _: self.scan_tasks.pop(scan_id, None))
+
     async def _execute_scan(self, scan_id: str, scan_request: ScanRequest, user: UserInDB):
-        """Execute the actual scan in background"""
+        """Execute the actual scan in background, waiting for a free scan slot first"""
+        scan_slots = get_scan_slots()
+        if scan_slots.locked():
+            logging.info(f"Scan {scan_id} queued: {settings.max_concurrent_network_scans} scans already running")
+            await self._update_scan_status(scan_id, ScanStatus.PENDING, "Waiting for a free scan slot...")
+
+        async with scan_slots:
+            # Scan may have been cancelled while it was queued
+            if self.active_scans.get(scan_id, {}).get("status") == ScanStatus.CANCELLED:
+                logging.info(f"Scan {scan_id} was cancelled before it started")
+                return
+            await self._run_scan(scan_id, scan_request, user)
+
+    async def _run_scan(self, scan_id: str, scan_request: ScanRequest, user: UserInDB):
+        """Run a scan through the scanner engine and store its results"""
         try:
             # Update status to running
             await self._update_scan_status(scan_id, ScanStatus.RUNNING, "Scan in progress...")
@@ -93,10 +128,18 @@ class ScanningService:
                 scan_type=scan_request.scan_type.value,
                 target=scan_request.target,
                 user_id=user.id,
-                scan_id=scan_id
+                scan_id=scan_id,
+                progress_callback=self._make_progress_listener(scan_id),
+                incremental=scan_request.incremental
             )
 
             completed_at = datetime.utcnow()
+            # Stored once, next to the results rather than inside them
+            timings = scan_results.pop("timings", None)
+
+            # A cancelled scan keeps its cancelled status whatever the engine returned
+            if self.active_scans.get(scan_id, {}).get("status") == ScanStatus.CANCELLED:
+                return
 
             if scan_results.get("status") == "failed":
                 await self._update_scan_status(
@@ -104,7 +147,8 @@ class ScanningService:
                     ScanStatus.FAILED,
                     f"Scan failed: {scan_results.get('error', 'Unknown error')}",
                     completed_at=completed_at,
-                    results=scan_results
+                    results=scan_results,
+                    timings=timings
                 )
             else:
                 # Construct the JSON file path based on scan parameters
@@ -161,7 +205,8 @@ class ScanningService:
                     completed_at=completed_at,
                     results=scan_results,
                     json_file_path=json_file_path,
-                    txt_file_path=scan_results.get("txt_file_path")
+                    cve_records_path=scan_results.get("cve_records_path"),
+                    timings=timings
                 )
 
                 logging.info(f"Scan {scan_id} completed successfully")
@@ -173,6 +218,8 @@ class ScanningService:
                 await self._mark_scan_for_pdf_generation(scan_id, user.dict())
                 logging.info(f"Scan {scan_id} completed. Marked for background PDF generation.")
 
+        except asyncio.CancelledError:
+            logging.info(f"Scan {scan_id} stopped after cancellation")
         except Exception as e:
             logging.error(f"Scan {scan_id} failed with exception: {e}")
             await self._update_scan_status(
@@ -182,12 +229,52 @@ class ScanningService:
                 completed_at=datetime.utcnow()
             )
 
+    def _make_progress_listener(self, scan_id: str):
+        """Build a scanner engine listener that mirrors live scan progress into memory and Mongo"""
+        loop = asyncio.get_running_loop()
+        last_write = {"at": 0.0}
+
+        event_log = get_scan_event_log(scan_id)
+
+        def listener(event_type: str, data: Dict):
+            if event_log is not None:
+                event_log.publish(event_type, data)
+            ctx = get_scan_context(scan_id)
+            if ctx is None:
+                return
+            if scan_id in self.active_scans:
+                self.active_scans[scan_id]["progress"] = ctx.progress_snapshot()
+
+            now = time.monotonic()
+            if event_type in ("phase", "host") or now - last_write["at"] >= PROGRESS_WRITE_INTERVAL:
+                last_write["at"] = now
+                asyncio.run_coroutine_threadsafe(self._save_scan_progress(scan_id), loop)
+
+        return listener
+
+    async def _save_scan_progress(self, scan_id: str):
+        """Persist the latest live progress snapshot of a running scan"""
+        progress = self.active_scans.get(scan_id, {}).get("progress")
+        if progress is None:
+            return
+        try:
+            db = await self.get_database()
+            await db.scans.update_one(
+                {"scan_id": scan_id},
+                {"$set": {"progress": progress}}
+            )
+        except Exception as e:
+            logging.error(f"Failed to save scan progress for {scan_id}: {e}")
+
     async def _update_scan_status(self, scan_id: str, status: ScanStatus, message: str,
                                 completed_at: Optional[datetime] = None,
                                 results: Optional[Dict] = None,
                                 json_file_path: Optional[str] = None,
-                                txt_file_path: Optional[str] = None):
+                                cve_records_path: Optional[str] = None,
+                                timings: Optional[Dict] = None):
         """Update scan status in memory and database"""
+        self._publish_status(scan_id, status, message, (results or {}).get("scan_results", {}).get("summary"))
+
         if scan_id in self.active_scans:
             self.active_scans[scan_id]["status"] = status
             self.active_scans[scan_id]["message"] = message
@@ -197,8 +284,10 @@ class ScanningService:
                 self.active_scans[scan_id]["results"] = results
             if json_file_path:
                 self.active_scans[scan_id]["json_file_path"] = json_file_path
-            if txt_file_path:
-                self.active_scans[scan_id]["txt_file_path"] = txt_file_path
+            if cve_records_path:
+                self.active_scans[scan_id]["cve_records_path"] = cve_records_path
+            if timings:
+                self.active_scans[scan_id]["timings"] = timings
 
         # Update in database
         try:
@@ -213,8 +302,10 @@ class ScanningService:
                 update_data["results"] = results
             if json_file_path:
                 update_data["json_file_path"] = json_file_path
-            if txt_file_path:
-                update_data["txt_file_path"] = txt_file_path
+            if cve_records_path:
+                update_data["cve_records_path"] = cve_records_path
+            if timings:
+                update_data["timings"] = timings
 
             await db.scans.update_one(
                 {"scan_id": scan_id},
@@ -223,6 +314,41 @@ class ScanningService:
         except Exception as e:
             logging.error(f"Failed to update scan in database: {e}")
 
+    def _publish_status(self, scan_id: str, status: ScanStatus, message: str, summary: Optional[Dict] = None):
+        """Push a status change to the scan's event stream; terminal statuses end the stream"""
+        event_log = get_scan_event_log(scan_id)
+        if event_log is None:
+            return
+        status_data = {"status": status.value, "message": message}
+        if summary:
+            status_data["summary"] = summary
+        if status.value in TERMINAL_STATUSES:
+            event_log.close(status_data)
+        else:
+            event_log.publish("status", status_data)
+
+    async def get_scan_state(self, scan_id: str, user: UserInDB) -> Optional[Dict]:
+        """Status, message and progress of a scan or batch, without loading its result files"""
+        scan_data = self.active_scans.get(scan_id) or self.active_batches.get(scan_id)
+        if scan_data is None:
+            try:
+                db = await self.get_database()
+                projection = {"_id": 0, "user_id": 1, "status": 1, "message": 1, "progress": 1, "summary": 1}
+                scan_data = await db.scans.find_one({"scan_id": scan_id}, projection) \
+                    or await db.scan_batches.find_one({"batch_id": scan_id}, projection)
+            except Exception as e:
+                logging.error(f"Failed to retrieve scan state from database: {e}")
+                return None
+        if not scan_data or scan_data["user_id"] != user.id:
+            return None
+        status = scan_data["status"]
+        return {
+            "status": status.value if isinstance(status, ScanStatus) else status,
+            "message": scan_data.get("message", ""),
+            "progress": scan_data.get("progress"),
+            "summary": scan_data.get("summary")
+        }
+
     async def get_scan_status(self, scan_id: str, user: UserInDB) -> Optional[ScanResponse]:
         """Get scan status and results"""
         # Check memory first
@@ -247,18 +373,15 @@ class ScanningService:
         results = scan_data.get("results")
         json_file_path = scan_data.get("json_file_path")
 
-        logging.info(f"🔍 SCAN STATUS DEBUG: scan_id={scan_id}, status={scan_data.get('status')}, json_file_path={json_file_path}")
+        logging.debug(f"🔍 SCAN STATUS DEBUG: scan_id={scan_id}, status={scan_data.get('status')}, json_file_path={json_file_path}")
 
-        if (scan_data.get("status") == "completed" and json_file_path and os.path.exists(json_file_path)):
-            try:
-                logging.info(f"🔍 LOADING JSON FILE: {json_file_path}")
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    json_results = json.load(f)
-                    # Override results with actual JSON content
-                    results = json_results
-                    logging.info(f"✅ JSON LOADED: {len(json_results.get('vulnerabilities', []))} vulnerabilities, {len(json_results.get('services', []))} services, {json_results.get('summary', {}).get('ports_scanned', 0)} ports scanned")
-            except Exception as e:
-                logging.error(f"❌ FAILED TO LOAD JSON: {e}")
+        # Finished results files never change; the cache parses each one once
+        cached_results = get_results_cache().load(json_file_path) \
+            if scan_data.get("status") == "completed" and json_file_path else None
+        if cached_results is not None:
+            # Override results with actual JSON content
+            results = cached_results.data
+            logging.debug(f"✅ JSON LOADED: {len(results.get('vulnerabilities', []))} vulnerabilities, {len(results.get('services', []))} services, {results.get('summary', {}).get('ports_scanned', 0)} ports scanned")
         else:
             if scan_data.get("status") == "completed":
                 # File is missing - mark scan as completed_file_missing to stop polling
@@ -279,9 +402,9 @@ class ScanningService:
                     except Exception as e:
                         logging.error(f"Failed to update scan status: {e}")
                 else:
-                    logging.info(f"🔄 SCAN COMPLETED BUT NO JSON PATH SET: status={scan_data.get('status')}")
+                    logging.debug(f"🔄 SCAN COMPLETED BUT NO JSON PATH SET: status={scan_data.get('status')}")
             else:
-                logging.info(f"🔄 SCAN NOT COMPLETED YET: status={scan_data.get('status')}")
+                logging.debug(f"🔄 SCAN NOT COMPLETED YET: status={scan_data.get('status')}")
 
         return ScanResponse(
             scan_id=scan_data["scan_id"],
@@ -293,10 +416,41 @@ class ScanningService:
             started_at=scan_data["started_at"],
             completed_at=scan_data.get("completed_at"),
             results=results,
+            progress=scan_data.get("progress"),
             json_file_path=scan_data.get("json_file_path"),
-            txt_file_path=scan_data.get("txt_file_path")
+            txt_file_path=scan_data.get("txt_file_path"),
+            cve_records_path=scan_data.get("cve_records_path"),
+            timings=scan_data.get("timings")
         )
 
+    async def get_cached_results(self, scan_id: str, user: UserInDB) -> Optional[Dict]:
+        """
+        Status and results of a scan for the results endpoint: the cached results file
+        (parsed and encoded once) or, for scans without one, the stored results
+        """
+        scan_data = self.active_scans.get(scan_id)
+        if scan_data is None:
+            try:
+                db = await self.get_database()
+                scan_data = await db.scans.find_one(
+                    {"scan_id": scan_id},
+                    {"_id": 0, "user_id": 1, "status": 1, "json_file_path": 1, "results.scan_results": 1}
+                )
+            except Exception as e:
+                logging.error(f"Failed to retrieve scan from database: {e}")
+                return None
+        if not scan_data or scan_data["user_id"] != user.id:
+            return None
+
+        status = scan_data["status"]
+        status = status.value if isinstance(status, ScanStatus) else status
+        json_file_path = scan_data.get("json_file_path")
+        return {
+            "status": status,
+            "cached": get_results_cache().load(json_file_path) if status == "completed" and json_file_path else None,
+            "results": (scan_data.get("results") or {}).get("scan_results")
+        }
+
     async def get_user_scans(self, user: UserInDB, limit: int = 50, skip: int = 0) -> List[ScanResponse]:
         """Get all scans for a user"""
         try:
@@ -342,8 +496,267 @@ class ScanningService:
             completed_at=datetime.utcnow()
         )
 
+        # Stop this scan's own nmap/vulnx processes, tasks and queued CVE queries
+        cancellation = self._stop_scan_task(scan_id)
+        if scan_id in self.active_scans:
+            self.active_scans[scan_id]["cancellation"] = cancellation
+        try:
+            db = await self.get_database()
+            await db.scans.update_one({"scan_id": scan_id}, {"$set": {"cancellation": cancellation}})
+        except Exception as e:
+            logging.error(f"Failed to record cancellation of scan {scan_id}: {e}")
+
+        return True
+
+    def _stop_scan_task(self, scan_id: str) -> Dict:
+        """Cancel a scan's work in the engine and its background task; returns what was abandoned"""
+        cancellation = cancel_scan_execution(scan_id) or {"phase": "pending"}
+        task = self.scan_tasks.get(scan_id)
+        if task is not None and not task.done():
+            # Also covers scans still queued for a scan slot, which have no engine context yet
+            task.cancel()
+        logging.info(f"Scan {scan_id} cancelled: {cancellation}")
+        return cancellation
+
+    async def cancel_batch_scan(self, batch_id: str, user: UserInDB) -> bool:
+        """Cancel a running batch scan"""
+        batch_data = await self.get_batch_status(batch_id, user)
+        if not batch_data or batch_data.status not in [ScanStatus.PENDING, ScanStatus.RUNNING]:
+            return False
+
+        await self._update_batch_status(batch_id, ScanStatus.CANCELLED, "Batch scan cancelled by user",
+                                        completed_at=datetime.utcnow())
+        await self._update_batch_fields(batch_id, {"cancellation": self._stop_scan_task(batch_id)})
         return True
 
+    async def start_batch_scan(self, batch_request: BatchScanRequest, user: UserInDB) -> BatchScanResponse:
+        """Start a batch scan over several targets; raises BatchTargetError for unusable targets"""
+        hosts = expand_targets(batch_request.targets, settings.batch_scan_max_hosts)
+        batch_id = str(uuid.uuid4())
+        started_at = datetime.utcnow()
+
+        batch_data = {
+            "batch_id": batch_id,
+            "status": ScanStatus.PENDING,
+            "message": f"Started {batch_request.scan_type} batch scan of {len(hosts)} hosts",
+            "targets": batch_request.targets,
+            "scan_type": batch_request.scan_type,
+            "user_id": user.id,
+            "started_at": started_at,
+            "completed_at": None,
+            "hosts_total": len(hosts),
+            "scan_ids": [],
+            "summary": None,
+            "hosts": None,
+            "user": user.dict()
+        }
+        self.active_batches[batch_id] = batch_data
+        open_scan_event_log(batch_id, user.id).publish("status", {"status": ScanStatus.PENDING.value, "message": batch_data["message"]})
+
+        try:
+            db = await self.get_database()
+            await db.scan_batches.insert_one(dict(batch_data))
+        except Exception as e:
+            logging.error(f"Failed to save batch scan to database: {e}")
+
+        self._track_scan_task(batch_id, asyncio.create_task(self._execute_batch_scan(batch_id, batch_request, user)))
+
+        return self._batch_response(batch_data)
+
+    async def _execute_batch_scan(self, batch_id: str, batch_request: BatchScanRequest, user: UserInDB):
+        """Run a batch scan in the background; the whole batch takes one scan slot"""
+        async with get_scan_slots():
+            if self.active_batches.get(batch_id, {}).get("status") == ScanStatus.CANCELLED:
+                logging.info(f"Batch scan {batch_id} was cancelled before it started")
+                return
+            await self._run_batch_scan(batch_id, batch_request, user)
+
+    async def _run_batch_scan(self, batch_id: str, batch_request: BatchScanRequest, user: UserInDB):
+        """Run a batch scan through the batch scanner and store one scan document per host"""
+        try:
+            await self._update_batch_status(batch_id, ScanStatus.RUNNING, "Batch scan in progress...")
+            logging.info(f"Starting batch scan {batch_id}: {batch_request.scan_type} scan of {len(batch_request.targets)} targets")
+
+            batch_results = await execute_batch_scan(
+                batch_id,
+                batch_request.targets,
+                batch_request.scan_type.value,
+                user_id=user.id,
+                progress_callback=self._make_batch_progress_listener(batch_id)
+            )
+            completed_at = datetime.utcnow()
+
+            if self.active_batches.get(batch_id, {}).get("status") == ScanStatus.CANCELLED:
+                return
+
+            if batch_results.get("status") == "failed":
+                await self._update_batch_status(
+                    batch_id, ScanStatus.FAILED,
+                    f"Batch scan failed: {batch_results.get('error', 'Unknown error')}",
+                    completed_at=completed_at,
+                    timings=batch_results.get("timings")
+                )
+                return
+
+            started_at = self.active_batches.get(batch_id, {}).get("started_at", completed_at)
+            hosts, scan_ids = [], []
+            for host in batch_results["hosts"]:
+                entry = {"ip": host["ip"], "target": host["target"], "status": host["status"]}
+                if host["status"] == "completed":
+                    await self._store_batch_host_scan(batch_id, batch_request, user, host, started_at, completed_at)
+                    summary = host["scan_results"]["summary"]
+                    entry.update({
+                        "scan_id": host["scan_id"],
+                        "open_ports": summary["open_ports"],
+                        "cves_found": summary["cves_found"],
+                        "risk_score": summary["risk_score"],
+                        "risk_level": summary["risk_level"]
+                    })
+                    scan_ids.append(host["scan_id"])
+                hosts.append(entry)
+
+            await self._update_batch_status(
+                batch_id, ScanStatus.COMPLETED,
+                f"Batch scan completed: {len(scan_ids)} of {len(hosts)} hosts scanned",
+                completed_at=completed_at,
+                summary=batch_results["summary"],
+                hosts=hosts,
+                scan_ids=scan_ids,
+                timings=batch_results.get("timings")
+            )
+            logging.info(f"Batch scan {batch_id} completed successfully")
+
+        except asyncio.CancelledError:
+            logging.info(f"Batch scan {batch_id} stopped after cancellation")
+        except Exception as e:
+            logging.error(f"Batch scan {batch_id} failed with exception: {e}")
+            await self._update_batch_status(
+                batch_id, ScanStatus.FAILED,
+                f"Batch scan failed with error: {str(e)}",
+                completed_at=datetime.utcnow()
+            )
+
+    async def _store_batch_host_scan(self, batch_id: str, batch_request: BatchScanRequest, user: UserInDB,
+                                     host: Dict, started_at: datetime, completed_at: datetime):
+        """Save one host of a batch as a regular scan document and store its CVEs"""
+        scan_data = {
+            "scan_id": host["scan_id"],
+            "batch_id": batch_id,
+            "status": ScanStatus.COMPLETED,
+            "message": "Scan completed successfully",
+            "target": host["target"],
+            "scan_type": batch_request.scan_type,
+            "user_id": user.id,
+            "started_at": started_at,
+            "completed_at": completed_at,
+            "results": {
+                "status": "completed",
+                "scan_results": host["scan_results"],
+                "json_file_path": host["json_file_path"],
+                "cve_records_path": host["cve_records_path"]
+            },
+            "json_file_path": host["json_file_path"] or None,
+            "txt_file_path": None,
+            "cve_records_path": host["cve_records_path"] or None,
+            "incremental": False,
+            "errors": [],
+            "user": user.dict()
+        }
+        try:
+            db = await self.get_database()
+            await db.scans.insert_one(scan_data)
+        except Exception as e:
+            logging.error(f"Failed to save batch host scan {host['scan_id']} to database: {e}")
+
+        cves_data = [to_cve_store_entry(r) for r in host["records"] if r.get("cve_id")]
+        if cves_data:
+            try:
+                stored_ids = await CVEService().store_cves_from_scan(host["scan_id"], user, host["target"], cves_data)
+                logging.info(f"Stored {len(stored_ids)} CVEs for batch host scan {host['scan_id']}")
+            except Exception as e:
+                logging.error(f"Error storing CVEs for batch host scan {host['scan_id']}: {e}")
+
+    def _make_batch_progress_listener(self, batch_id: str):
+        """Build a scanner engine listener that mirrors live batch progress into memory and Mongo"""
+        loop = asyncio.get_running_loop()
+        last_write = {"at": 0.0}
+
+        event_log = get_scan_event_log(batch_id)
+
+        def listener(event_type: str, data: Dict):
+            if event_log is not None:
+                event_log.publish(event_type, data)
+            ctx = get_scan_context(batch_id)
+            if ctx is None or batch_id not in self.active_batches:
+                return
+            self.active_batches[batch_id]["progress"] = ctx.progress_snapshot()
+
+            now = time.monotonic()
+            if event_type in ("phase", "host") or now - last_write["at"] >= PROGRESS_WRITE_INTERVAL:
+                last_write["at"] = now
+                asyncio.run_coroutine_threadsafe(
+                    self._update_batch_fields(batch_id, {"progress": self.active_batches[batch_id]["progress"]}), loop
+                )
+
+        return listener
+
+    async def _update_batch_status(self, batch_id: str, status: ScanStatus, message: str,
+                                   completed_at: Optional[datetime] = None, **fields):
+        """Update batch status (plus any summary fields) in memory and database"""
+        self._publish_status(batch_id, status, message, fields.get("summary"))
+        update_data = {"status": status, "message": message, **fields}
+        if completed_at:
+            update_data["completed_at"] = completed_at
+        await self._update_batch_fields(batch_id, update_data)
+
+    async def _update_batch_fields(self, batch_id: str, update_data: Dict):
+        if batch_id in self.active_batches:
+            self.active_batches[batch_id].update(update_data)
+        try:
+            db = await self.get_database()
+            await db.scan_batches.update_one(
+                {"batch_id": batch_id},
+                {"$set": {k: v.value if isinstance(v, ScanStatus) else v for k, v in update_data.items()}}
+            )
+        except Exception as e:
+            logging.error(f"Failed to update batch scan in database: {e}")
+
+    def _batch_response(self, batch_data: Dict) -> BatchScanResponse:
+        return BatchScanResponse(
+            batch_id=batch_data["batch_id"],
+            status=ScanStatus(batch_data["status"]),
+            message=batch_data.get("message", ""),
+            targets=batch_data["targets"],
+            scan_type=ScanType(batch_data["scan_type"]),
+            user_id=batch_data["user_id"],
+            started_at=batch_data["started_at"],
+            completed_at=batch_data.get("completed_at"),
+            hosts_total=batch_data.get("hosts_total", 0),
+            scan_ids=batch_data.get("scan_ids") or [],
+            summary=batch_data.get("summary"),
+            hosts=batch_data.get("hosts"),
+            progress=batch_data.get("progress"),
+            timings=batch_data.get("timings")
+        )
+
+    async def get_batch_status(self, batch_id: str, user: UserInDB) -> Optional[BatchScanResponse]:
+        """Get batch scan status, summary and per-host scan IDs"""
+        if batch_id in self.active_batches:
+            batch_data = self.active_batches[batch_id]
+        else:
+            try:
+                db = await self.get_database()
+                batch_data = await db.scan_batches.find_one({"batch_id": batch_id})
+                if not batch_data:
+                    return None
+            except Exception as e:
+                logging.error(f"Failed to retrieve batch scan from database: {e}")
+                return None
+
+        if batch_data["user_id"] != user.id:
+            return None
+        return self._batch_response(batch_data)
+
     async def generate_pdf_report(self, scan_id: str, user: UserInDB, report_name: Optional[str] = None) -> ReportResponse:
         """Generate PDF report from scan results using ISO-standard professional format"""
         scan_data = await self.get_scan_status(scan_id, user)
@@ -361,9 +774,10 @@ class ScanningService:
                 scan_id=scan_id
             )
 
-        # Check if both JSON and TXT files exist (required for ISO report)
+        # Check if the JSON file and the CVE details exist (required for ISO report)
         json_file_path = scan_data.json_file_path
-        txt_file_path = getattr(scan_data, 'txt_file_path', None)
+        # CVE records for current scans, the TXT CVE details for scans that predate them
+        cve_file_path = scan_data.cve_records_path or getattr(scan_data, 'txt_file_path', None)
 
         if not json_file_path or not os.path.exists(json_file_path):
             return ReportResponse(
@@ -372,10 +786,10 @@ class ScanningService:
                 scan_id=scan_id
             )
 
-        if not txt_file_path or not os.path.exists(txt_file_path):
+        if not cve_file_path or not os.path.exists(cve_file_path):
             return ReportResponse(
                 status="error",
-                message="TXT CVE details file not found",
+                message="CVE details file not found",
                 scan_id=scan_id
             )
 
@@ -398,7 +812,7 @@ class ScanningService:
             # Use NEW ISO-standard report generator
             logging.info(f"🚀 Generating ISO-standard professional report for scan {scan_id}...")
             logging.info(f"📂 JSON: {json_file_path}")
-            logging.info(f"📂 TXT: {txt_file_path}")
+            logging.info(f"📂 CVE details: {cve_file_path}")
             logging.info(f"📄 Output: {output_path}")
 
             # Import the new ISO report generator
@@ -414,7 +828,7 @@ class ScanningService:
                     executor,
                     generate_iso_report,
                     json_file_path,
-                    txt_file_path,
+                    cve_file_path,
                     output_path
                 )
 
@@ -477,8 +891,14 @@ class ScanningService:
             # Extract CVEs from scan results
             cves_data = []
 
+            # CVE records carry the full details (score, exploit availability) without any parsing
+            cve_records_path = scan_results.get("cve_records_path")
+            if is_records_file(cve_records_path):
+                cves_data = [to_cve_store_entry(r) for r in read_jsonl(cve_records_path) if r.get("cve_id")]
+                logging.info(f"Loaded {len(cves_data)} CVE records from {cve_records_path}")
+
             # Check different possible locations for vulnerability data
-            if "vulnerabilities" in actual_scan_data:
+            elif "vulnerabilities" in actual_scan_data:
                 vulnerabilities = actual_scan_data["vulnerabilities"]
                 logging.info(f"Found {len(vulnerabilities)} vulnerabilities in scan results")
                 for vuln in vulnerabilities:
@@ -680,6 +1100,22 @@ class ScanningService:
             logging.error(f"Failed to format scan results to text: {e}")
             return json.dumps(scan_results, indent=2)
 
+    async def get_cve_report_text(self, scan_id: str, user: UserInDB) -> Optional[str]:
+        """Render the text CVE report of a completed scan from its CVE records"""
+        scan_data = await self.get_scan_status(scan_id, user)
+        if not scan_data or scan_data.status != ScanStatus.COMPLETED:
+            return None
+
+        if is_records_file(scan_data.cve_records_path):
+            records = await asyncio.to_thread(read_jsonl, scan_data.cve_records_path)
+            return render_report_text(scan_data.results or {}, records)
+
+        # Scans that predate the CVE records still have their text report on disk
+        if scan_data.txt_file_path and os.path.exists(scan_data.txt_file_path):
+            with open(scan_data.txt_file_path, "r", encoding="utf-8") as f:
+                return f.read()
+        return None
+
     async def get_available_reports(self, user: UserInDB) -> List[Dict[str, Any]]:
         """Get list of available PDF reports for user"""
         try:
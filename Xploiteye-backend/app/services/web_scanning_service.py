@@ -1,7 +1,6 @@
 import os
 import datetime
 import json
-import socket
 import logging
 import asyncio
 import aiofiles
@@ -9,6 +8,7 @@ from urllib.parse import urlparse
 from typing import Optional, Dict, Any
 
 from config.settings import settings
+from app.services.dns_resolver_service import get_dns_resolver_service
 from app.web_application_scanner.scanners.recon_primary import ReconScanner
 from app.web_application_scanner.scanners.network_scanner import NetworkScanner
 from app.web_application_scanner.scanners.ssl_scanner import SSLScanner
@@ -31,10 +31,13 @@ async def process_web_scan(scan_id: str, url: str, user_email: Optional[str] = N
     try:
         domain = urlparse(url).netloc
         if not domain: domain = url
-        try:
-            target_ip = await asyncio.to_thread(socket.gethostbyname, domain)
-        except:
-            target_ip = "Unknown IP"
+        # One cached lookup feeds both the target IP and the recon DNS profile
+        dns_resolver = get_dns_resolver_service()
+        a_records, cname_records = await asyncio.gather(
+            dns_resolver.resolve(domain, "A"),
+            dns_resolver.resolve(domain, "CNAME")
+        )
+        target_ip = a_records[0] if a_records else "Unknown IP"
             
         logger.info(f"[WEB-SCAN] Initiated for URL: {url} | Resolved IP: {target_ip} | ID: {scan_id}")
         
@@ -54,7 +57,7 @@ async def process_web_scan(scan_id: str, url: str, user_email: Optional[str] = N
         
         # 1. Reconnaissance
         recon = ReconScanner()
-        recon_data = await asyncio.to_thread(recon.scan, domain)
+        recon_data = await asyncio.to_thread(recon.scan, domain, {"A": a_records, "CNAME": cname_records})
         
         # 2. Network Scanning
         network = NetworkScanner()
@@ -1,6 +1,6 @@
 import whois
 import dns.resolver
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 class ReconScanner:
     """
@@ -8,7 +8,11 @@ class ReconScanner:
     Performs DNS resolution and Whois lookups to profile the target infrastructure.
     """
     
-    def scan(self, domain: str) -> Dict[str, Any]:
+    def scan(self, domain: str, dns_records: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+        """
+        Profile a domain. dns_records ({"A": [...], "CNAME": [...]}) already
+        resolved by the caller are used instead of querying DNS again.
+        """
         results = {
             "dns": {},
             "whois": {},
@@ -17,23 +21,31 @@ class ReconScanner:
         
         # 1. DNS Resolution
         try:
-            # A Record (IP)
-            a_records = dns.resolver.resolve(domain, 'A')
-            results["dns"]["ip"] = [r.to_text() for r in a_records]
-            
-            # CNAME (WAF Detection hint)
-            try:
-                cname_records = dns.resolver.resolve(domain, 'CNAME')
-                cnames = [r.to_text() for r in cname_records]
+            if dns_records is not None:
+                if not dns_records.get("A"):
+                    raise ValueError(f"No A records found for {domain}")
+                results["dns"]["ip"] = list(dns_records["A"])
+                cnames = list(dns_records.get("CNAME") or [])
+            else:
+                # A Record (IP)
+                a_records = dns.resolver.resolve(domain, 'A')
+                results["dns"]["ip"] = [r.to_text() for r in a_records]
+
+                # CNAME (WAF Detection hint)
+                try:
+                    cname_records = dns.resolver.resolve(domain, 'CNAME')
+                    cnames = [r.to_text() for r in cname_records]
+                except dns.resolver.NoAnswer:
+                    cnames = []
+
+            if cnames:
                 results["dns"]["cname"] = cnames
-                
-                # Basic WAF Heuristic
-                for cname in cnames:
-                    if "cloudflare" in cname or "akamai" in cname or "incapsula" in cname:
-                        results["waf_detected"] = True
-                        results["waf_vendor"] = cname
-            except dns.resolver.NoAnswer:
-                pass
+
+            # Basic WAF Heuristic
+            for cname in cnames:
+                if "cloudflare" in cname or "akamai" in cname or "incapsula" in cname:
+                    results["waf_detected"] = True
+                    results["waf_vendor"] = cname
                 
         except Exception as e:
             results["dns"]["error"] = str(e)
@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the network scanning engine (see scan_benchmark.py)
+"""
@@ -0,0 +1,115 @@
+"""
+nmap XML fixtures for the scan benchmark
+Builds deterministic `nmap -sV -O -oX -` style documents with a chosen number of
+open ports, spread so that light (1-1000), medium (1-5000) and deep (1-15000)
+scans each see a different share of them. The stub nmap replays a fixture,
+filtered to the ports and phase of each invocation; a real recorded nmap XML
+file can be used in place of a generated one.
+
+    python -m benchmarks.fixtures large /tmp/large.xml
+"""
+
+import argparse
+import xml.etree.ElementTree as ET
+
+# Open ports per fixture size (over the deep scan's 1-15000 range)
+FIXTURE_SIZES = {
+    "small": 6,
+    "medium": 40,
+    "large": 200
+}
+
+# Address of the recorded host; the stub rewrites it to each scanned target
+FIXTURE_ADDRESS = "192.0.2.10"
+
+# (port, service, product, version, cpe) as nmap reports them for common Linux services
+SERVICE_CATALOGUE = [
+    (21, "ftp", "vsftpd", "2.3.4", "cpe:/a:vsftpd:vsftpd:2.3.4"),
+    (22, "ssh", "OpenSSH", "7.4 (protocol 2.0)", "cpe:/a:openbsd:openssh:7.4"),
+    (23, "telnet", "Linux telnetd", "", "cpe:/o:linux:linux_kernel"),
+    (25, "smtp", "Postfix smtpd", "", "cpe:/a:postfix:postfix"),
+    (53, "domain", "ISC BIND", "9.4.2", "cpe:/a:isc:bind:9.4.2"),
+    (80, "http", "Apache httpd", "2.4.6 ((CentOS))", "cpe:/a:apache:http_server:2.4.6"),
+    (111, "rpcbind", "", "2-4 (RPC #100000)", ""),
+    (139, "netbios-ssn", "Samba smbd", "3.X - 4.X (workgroup: WORKGROUP)", "cpe:/a:samba:samba"),
+    (443, "https", "nginx", "1.14.0 (Ubuntu)", "cpe:/a:igor_sysoev:nginx:1.14.0"),
+    (445, "microsoft-ds", "Samba smbd", "4.7.6-Ubuntu (workgroup: WORKGROUP)", "cpe:/a:samba:samba:4.7.6"),
+    (3306, "mysql", "MySQL", "5.0.51a-3ubuntu5", "cpe:/a:mysql:mysql:5.0.51a-3ubuntu5"),
+    (3389, "ms-wbt-server", "xrdp", "", "cpe:/a:neutrinolabs:xrdp"),
+    (5432, "postgresql", "PostgreSQL DB", "8.3.0 - 8.3.7", "cpe:/a:postgresql:postgresql:8.3"),
+    (5900, "vnc", "VNC", "protocol 3.3", ""),
+    (6379, "redis", "Redis key-value store", "4.0.9", "cpe:/a:redislabs:redis:4.0.9"),
+    (8080, "http", "Apache Tomcat/Coyote JSP engine", "1.1", "cpe:/a:apache:coyote_http_connector:1.1"),
+    (8443, "https-alt", "Jetty", "9.4.z-SNAPSHOT", "cpe:/a:eclipse:jetty:9.4.z-snapshot"),
+    (9200, "http", "Elasticsearch REST API", "6.8.0 (name: node-1)", "cpe:/a:elastic:elasticsearch:6.8.0"),
+    (11211, "memcache", "Memcached", "1.5.6 (uptime 3600 seconds)", "cpe:/a:memcached:memcached:1.5.6"),
+    (27017, "mongodb", "MongoDB", "3.6.3", "cpe:/a:mongodb:mongodb:3.6.3"),
+]
+
+# Generic services used once the catalogue is exhausted
+FILLER_SERVICES = [
+    ("http", "lighttpd", "1.4.{minor}", "cpe:/a:lighttpd:lighttpd:1.4.{minor}"),
+    ("ssh", "Dropbear sshd", "20{minor}.7{minor}", "cpe:/a:matt_johnston:dropbear_ssh_server:20{minor}.7{minor}"),
+    ("ftp", "ProFTPD", "1.3.{minor}", "cpe:/a:proftpd:proftpd:1.3.{minor}"),
+    ("unknown", "", "", ""),
+]
+
+
+def fixture_ports(open_ports: int) -> list:
+    """(port, service, product, version, cpe) entries for a host with `open_ports` open ports."""
+    entries = list(SERVICE_CATALOGUE[:open_ports])
+    used = {entry[0] for entry in entries}
+    # Spread the remaining ports over 1025-14994 (a permutation, since 7919 is coprime
+    # with 13970) so every scan depth finds a different share of them
+    index = 0
+    while len(entries) < open_ports and index < 13970:
+        port = 1025 + (index * 7919) % 13970
+        if port not in used:
+            used.add(port)
+            service, product, version, cpe = FILLER_SERVICES[len(entries) % len(FILLER_SERVICES)]
+            minor = len(entries) % 10
+            entries.append((port, service, product, version.format(minor=minor), cpe.format(minor=minor)))
+        index += 1
+    return sorted(entries)
+
+
+def build_fixture(open_ports: int, address: str = FIXTURE_ADDRESS) -> ET.ElementTree:
+    """An nmap -sV -O XML document for one host with the given number of open ports."""
+    root = ET.Element("nmaprun", {"scanner": "nmap", "args": "nmap -sV -O -oX - " + address, "version": "7.94"})
+    host = ET.SubElement(root, "host")
+    ET.SubElement(host, "status", {"state": "up", "reason": "user-set"})
+    ET.SubElement(host, "address", {"addr": address, "addrtype": "ipv4"})
+    ET.SubElement(host, "hostnames")
+    ports = ET.SubElement(host, "ports")
+    for port, service, product, version, cpe in fixture_ports(open_ports):
+        port_element = ET.SubElement(ports, "port", {"protocol": "tcp", "portid": str(port)})
+        ET.SubElement(port_element, "state", {"state": "open", "reason": "syn-ack"})
+        attributes = {"name": service, "method": "probed", "conf": "10"}
+        if product:
+            attributes["product"] = product
+        if version:
+            attributes["version"] = version
+        service_element = ET.SubElement(port_element, "service", attributes)
+        if cpe:
+            ET.SubElement(service_element, "cpe").text = cpe
+    os_element = ET.SubElement(host, "os")
+    ET.SubElement(os_element, "osmatch", {"name": "Linux 3.10 - 4.11", "accuracy": "96"})
+    return ET.ElementTree(root)
+
+
+def write_fixture(size: str, path: str) -> str:
+    """Write the fixture of a named size (see FIXTURE_SIZES) to path."""
+    build_fixture(FIXTURE_SIZES[size]).write(path, encoding="utf-8", xml_declaration=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write an nmap XML fixture for the scan benchmark")
+    parser.add_argument("size", choices=sorted(FIXTURE_SIZES))
+    parser.add_argument("path")
+    args = parser.parse_args()
+    print(write_fixture(args.size, args.path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Offline smoke check of the report GPT client
+Builds the real report OpenAI client (no request is sent) and drives
+_request_completion and call_gpt against a stand-in client, so a broken client
+setup or retry loop shows up without an API key or network access.
+
+Run from Xploiteye-backend:
+
+    python -m benchmarks.report_gpt_smoke
+
+The exit status is 1 when a check fails.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import openai
+
+from config.settings import settings
+from app.scanning.report_generator import enhanced_gpt_prompts
+
+
+class FakeCompletions:
+    """Stand-in for client.chat.completions: raises the queued errors, then answers."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="  Section text \n"))])
+
+
+def _use_fake_client(errors=()) -> FakeCompletions:
+    completions = FakeCompletions(errors)
+    enhanced_gpt_prompts._openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+
+def _timeout_error() -> openai.APITimeoutError:
+    # The request is only kept for error reporting
+    return openai.APITimeoutError(request=None)
+
+
+def run_checks() -> list:
+    """Names of the failed checks."""
+    failures = []
+
+    def check(name, ok):
+        print(f"{'✅' if ok else '❌'} {name}")
+        if not ok:
+            failures.append(name)
+
+    # The real client: built once, SDK retries off, report timeout
+    os.environ.setdefault("OPENAI_API_KEY", "sk-smoke-check")
+    enhanced_gpt_prompts._openai_client = None
+    client = enhanced_gpt_prompts.get_openai_client()
+    check("client has SDK retries disabled", client.max_retries == 0)
+    check("client uses report_gpt_timeout_seconds", client.timeout == settings.report_gpt_timeout_seconds)
+    check("client is shared", enhanced_gpt_prompts.get_openai_client() is client)
+
+    completions = _use_fake_client()
+    text = enhanced_gpt_prompts._request_completion("Summarize", "data", 123)
+    check("_request_completion returns the stripped answer", text == "Section text")
+    check("_request_completion sends model and max_tokens",
+          completions.calls[0]["model"] == enhanced_gpt_prompts.GPT_MODEL and completions.calls[0]["max_tokens"] == 123)
+
+    enhanced_gpt_prompts.RETRY_BACKOFF_SECONDS = 0
+    attempts = max(1, settings.report_gpt_max_attempts)
+    completions = _use_fake_client([_timeout_error()] * (attempts - 1))
+    text = enhanced_gpt_prompts.call_gpt("Summarize", "data")
+    check("call_gpt retries timeouts", text == "Section text" and len(completions.calls) == attempts)
+
+    completions = _use_fake_client([_timeout_error()] * attempts)
+    text = enhanced_gpt_prompts.call_gpt("Summarize", "data")
+    check("call_gpt gives up after report_gpt_max_attempts",
+          text.startswith("Error generating content") and len(completions.calls) == attempts)
+
+    enhanced_gpt_prompts._openai_client = None
+    return failures
+
+
+def main():
+    failures = run_checks()
+    if failures:
+        print(f"\n❌ {len(failures)} report GPT check(s) failed")
+        sys.exit(1)
+    print("\n✅ Report GPT client checks passed")
+
+
+if __name__ == "__main__":
+    main()
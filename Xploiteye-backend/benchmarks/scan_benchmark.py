@@ -0,0 +1,343 @@
+"""
+Offline benchmark of the network scan engine
+Drives execute_scan_with_controller against stand-ins instead of real targets:
+nmap, sudo, ping and curl are PATH shims that replay an nmap XML fixture
+(benchmarks/stubs.py), vulnx is a stub with configurable latency and rate-limit
+answers, the LLM is a fake with fixed latency and VPN rotations only wait.
+For every scan type and concurrency it reports wall time, scan latency, the
+per-phase breakdown recorded in the scan timings, peak RSS and thread counts.
+
+Run from Xploiteye-backend:
+
+    python -m benchmarks.scan_benchmark --scan-types light,medium,deep --concurrency 1,4 --scans 8
+    python -m benchmarks.scan_benchmark --fixture large --vulnx-rate-limit-every 25 --save baseline.json
+    python -m benchmarks.scan_benchmark --compare baseline.json --tolerance 0.25
+
+With --compare the exit status is 1 when a scenario's median scan latency or wall
+time regressed by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+from benchmarks.fixtures import FIXTURE_SIZES, write_fixture
+
+STUB_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs.py")
+STUB_TOOLS = ["nmap", "sudo", "ping", "curl", "vulnx"]
+
+# Interval of the RSS / thread sampler
+SAMPLE_INTERVAL = 0.05
+
+FAKE_PUBLIC_IP = "203.0.113.10"
+
+
+class FakeLLM:
+    """Stand-in for the scanner's ChatOpenAI instance: fixed latency, canned answers."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def _answer(self, prompt) -> SimpleNamespace:
+        self.calls += 1
+        text = prompt if isinstance(prompt, str) else " ".join(getattr(m, "content", str(m)) for m in prompt)
+        if "risk_score" in text:
+            content = json.dumps({
+                "risk_score": 7,
+                "risk_level": "high",
+                "recommendations": ["Patch exposed services", "Restrict management ports to the admin network"]
+            })
+        elif "version" in text.lower() and "JSON" in text:
+            content = "{}"
+        else:
+            content = "host_connectivity_tool,light_scan_ports_os,light_scan_versions,cvelook_light"
+        return SimpleNamespace(content=content)
+
+    def invoke(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+
+def _proc_status(field: str) -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class ResourceSampler:
+    """Samples RSS and thread counts of this process while a scenario runs."""
+
+    def __init__(self):
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self.peak_os_threads = 0
+        self._task = None
+
+    def sample(self):
+        # VmRSS is Linux only; ru_maxrss (the process-lifetime peak) is the fallback
+        rss_kb = _proc_status("VmRSS") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.peak_rss_kb = max(self.peak_rss_kb, rss_kb)
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        self.peak_os_threads = max(self.peak_os_threads, _proc_status("Threads"))
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.sample()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def prepare_workspace(args) -> Dict:
+    """Temp directory with the shims, the nmap fixture and the results/cache files."""
+    workspace = tempfile.mkdtemp(prefix="xploiteye-bench-")
+    bin_dir = os.path.join(workspace, "bin")
+    os.makedirs(bin_dir)
+    for tool in STUB_TOOLS:
+        shim = os.path.join(bin_dir, tool)
+        with open(shim, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{STUB_SCRIPT}" {tool} "$@"\n')
+        os.chmod(shim, 0o755)
+
+    fixture = args.fixture_file or write_fixture(args.fixture, os.path.join(workspace, f"{args.fixture}.xml"))
+
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ.update({
+        "BENCH_NMAP_FIXTURE": os.path.abspath(fixture),
+        "BENCH_NMAP_PORTS_PER_SECOND": str(args.nmap_ports_per_second),
+        "BENCH_NMAP_VERSION_SECONDS": str(args.nmap_version_seconds),
+        "BENCH_PING_RTT_MS": str(args.ping_rtt_ms),
+        "BENCH_VULNX_LATENCY": str(args.vulnx_latency),
+        "BENCH_VULNX_HIT_RATE": str(args.vulnx_hit_rate),
+        "BENCH_VULNX_RATE_LIMIT_EVERY": str(args.vulnx_rate_limit_every),
+        "BENCH_STATE_DIR": workspace,
+    })
+    return {"workspace": workspace, "bin_dir": bin_dir, "fixture": fixture}
+
+
+def configure_engine(args, workspace: Dict):
+    """Point the settings at the workspace and swap the LLM and VPN control for stand-ins."""
+    from config.settings import settings
+
+    results_dir = os.path.join(workspace["workspace"], "results")
+    settings.results_dir = results_dir
+    settings.reports_dir = os.path.join(workspace["workspace"], "reports")
+    settings.vulnx_path = os.path.join(workspace["bin_dir"], "vulnx")
+    settings.cve_lookup_engine = "vulnx"
+    settings.cve_cache_enabled = args.cve_cache
+    settings.cve_cache_path = os.path.join(results_dir, "cve_lookup_cache.sqlite3")
+    settings.fingerprint_store_path = os.path.join(results_dir, "scan_fingerprints.sqlite3")
+    settings.timing_history_path = os.path.join(results_dir, "scan_timings.sqlite3")
+    settings.service_normalizer_llm_fallback = args.llm_version_cleaning
+
+    from app.scanning import scanner_engine
+
+    def rotate_vpn():
+        time.sleep(args.vpn_latency)
+        return True
+
+    fake_llm = FakeLLM(args.llm_latency)
+    scanner_engine._llm_instance = fake_llm
+    scanner_engine.get_initial_public_ip = lambda: FAKE_PUBLIC_IP
+    scanner_engine.execute_vpn_command = lambda command_args: True
+    scanner_engine._rotate_vpn_connection_locked = rotate_vpn
+    return scanner_engine, fake_llm
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_scenario(scanner_engine, scan_type: str, concurrency: int, scans: int) -> Dict:
+    """Run `scans` scans of one type, at most `concurrency` at a time, and summarize them."""
+    semaphore = asyncio.Semaphore(concurrency)
+    sampler = ResourceSampler()
+    latencies, failures = [], 0
+    phase_seconds: Dict[str, List[float]] = {}
+    span_seconds: Dict[str, List[float]] = {}
+
+    async def one_scan(index: int):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            result = await scanner_engine.execute_scan_with_controller(
+                scan_type=scan_type,
+                target=f"192.0.2.{index % 250 + 1}",
+                user_id="benchmark",
+                scan_id=f"bench-{scan_type}-{concurrency}-{index}"
+            )
+            latencies.append(time.perf_counter() - started)
+            if result.get("status") != "completed":
+                failures += 1
+            timings = result.get("timings") or {}
+            for phase in timings.get("phases", []):
+                phase_seconds.setdefault(phase["phase"], []).append(phase["seconds"])
+            for name, total in (timings.get("totals") or {}).items():
+                span_seconds.setdefault(name, []).append(total["seconds"])
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one_scan(i) for i in range(scans)))
+    wall = time.perf_counter() - started
+    await sampler.stop()
+
+    return {
+        "scan_type": scan_type,
+        "concurrency": concurrency,
+        "scans": scans,
+        "failures": failures,
+        "wall_seconds": round(wall, 3),
+        "scans_per_minute": round(scans * 60 / wall, 2) if wall else 0.0,
+        "latency_seconds": {
+            "p50": round(_percentile(latencies, 0.5), 3),
+            "p95": round(_percentile(latencies, 0.95), 3),
+            "max": round(max(latencies, default=0.0), 3)
+        },
+        "phases": {name: round(statistics.mean(values), 3) for name, values in phase_seconds.items()},
+        "spans": {name: round(statistics.mean(values), 3) for name, values in sorted(span_seconds.items())},
+        "peak_rss_mb": round(sampler.peak_rss_kb / 1024, 1),
+        "peak_threads": sampler.peak_threads,
+        "peak_os_threads": sampler.peak_os_threads
+    }
+
+
+def print_report(results: List[Dict]):
+    print(f"\n{'scenario':<14}{'scans':>6}{'fail':>6}{'wall s':>9}{'p50 s':>8}{'p95 s':>8}{'scans/min':>11}"
+          f"{'rss MB':>9}{'threads':>9}{'os thr':>8}")
+    for result in results:
+        latency = result["latency_seconds"]
+        print(f"{result['scan_type'] + '@' + str(result['concurrency']):<14}{result['scans']:>6}{result['failures']:>6}"
+              f"{result['wall_seconds']:>9.2f}{latency['p50']:>8.2f}{latency['p95']:>8.2f}{result['scans_per_minute']:>11.1f}"
+              f"{result['peak_rss_mb']:>9.1f}{result['peak_threads']:>9}{result['peak_os_threads']:>8}")
+    for result in results:
+        print(f"\n{result['scan_type']}@{result['concurrency']} mean seconds per scan")
+        for name, seconds in result["phases"].items():
+            print(f"  phase {name:<30}{seconds:>9.3f}")
+        for name, seconds in result["spans"].items():
+            print(f"  span  {name:<30}{seconds:>9.3f}")
+
+
+def compare_with_baseline(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Scenarios whose median latency or wall time grew by more than tolerance over the baseline."""
+    with open(baseline_path) as f:
+        baseline = {f"{r['scan_type']}@{r['concurrency']}": r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        key = f"{result['scan_type']}@{result['concurrency']}"
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, current, before in (
+            ("p50 latency", result["latency_seconds"]["p50"], previous["latency_seconds"]["p50"]),
+            ("wall time", result["wall_seconds"], previous["wall_seconds"]),
+        ):
+            if before > 0 and current > before * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {current:.2f}s vs {before:.2f}s baseline (+{(current / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _csv(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the network scan engine against recorded fixtures")
+    parser.add_argument("--scan-types", type=_csv, default=["light", "medium", "deep"])
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in _csv(v)], default=[1, 4])
+    parser.add_argument("--scans", type=int, default=8, help="Scans per scenario")
+    parser.add_argument("--fixture", choices=sorted(FIXTURE_SIZES), default="medium", help="Generated nmap fixture size")
+    parser.add_argument("--fixture-file", help="Recorded nmap -sV -O -oX file to replay instead of a generated fixture")
+    parser.add_argument("--nmap-ports-per-second", type=float, default=5000)
+    parser.add_argument("--nmap-version-seconds", type=float, default=0.05, help="Simulated -sV time per open port")
+    parser.add_argument("--ping-rtt-ms", type=float, default=1.0)
+    parser.add_argument("--vulnx-latency", type=float, default=0.3)
+    parser.add_argument("--vulnx-hit-rate", type=float, default=0.7)
+    parser.add_argument("--vulnx-rate-limit-every", type=int, default=0, help="Every Nth vulnx call is rate limited (0 = never)")
+    parser.add_argument("--vpn-latency", type=float, default=1.0, help="Seconds a VPN rotation takes")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--llm-version-cleaning", action="store_true", help="Enable the LLM version-cleaning fallback")
+    parser.add_argument("--cve-cache", action="store_true", help="Keep the CVE lookup cache enabled")
+    parser.add_argument("--save", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="Keep the engine's INFO logging")
+    return parser.parse_args(argv)
+
+
+async def run_benchmark(args) -> Dict:
+    workspace = prepare_workspace(args)
+    scanner_engine, fake_llm = configure_engine(args, workspace)
+    results = []
+    for scan_type in args.scan_types:
+        for concurrency in args.concurrency:
+            print(f"▶️ {scan_type} x{args.scans} at concurrency {concurrency}", flush=True)
+            results.append(await run_scenario(scanner_engine, scan_type, concurrency, args.scans))
+    cve_scheduler = scanner_engine.get_cve_scheduler()
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "workspace": workspace["workspace"],
+        "llm_calls": fake_llm.calls,
+        "cve_scheduler": cve_scheduler.stats() if cve_scheduler else None,
+        "results": results
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report["results"])
+    print(f"\nLLM calls: {report['llm_calls']}  CVE scheduler: {report['cve_scheduler']}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if args.compare:
+        regressions = compare_with_baseline(report["results"], args.compare, args.tolerance)
+        if regressions:
+            print("\n❌ Performance regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regression beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
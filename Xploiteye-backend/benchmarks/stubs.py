@@ -0,0 +1,213 @@
+"""
+Stand-in executables for the scan benchmark
+The benchmark puts shims named nmap, sudo, ping, curl and vulnx on PATH that run
+this script with the tool name as first argument. Behaviour is configured through
+environment variables set by scan_benchmark:
+
+    BENCH_NMAP_FIXTURE              nmap XML file replayed for every target
+    BENCH_NMAP_PORTS_PER_SECOND     simulated discovery speed (default 5000)
+    BENCH_NMAP_VERSION_SECONDS      simulated -sV time per open port (default 0.05)
+    BENCH_PING_RTT_MS               round-trip time ping reports (default 1.0)
+    BENCH_VULNX_LATENCY             seconds each vulnx query takes (default 0.3)
+    BENCH_VULNX_HIT_RATE            share of queries that find a CVE (default 0.7)
+    BENCH_VULNX_RATE_LIMIT_EVERY    every Nth vulnx call answers "Rate limit exceeded" (0 = never)
+    BENCH_STATE_DIR                 directory for the vulnx call counter
+
+Only the standard library is used so the shims start quickly.
+"""
+
+import copy
+import fcntl
+import hashlib
+import ipaddress
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+# Seconds between <taskprogress> lines (nmap's --stats-every, shortened for benchmarks)
+PROGRESS_INTERVAL = 0.5
+
+SEVERITIES = ["critical", "high", "medium", "low"]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _parse_ports(spec: str) -> set:
+    ports = set()
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        if first.isdigit():
+            ports.update(range(int(first), int(last or first) + 1))
+    return ports
+
+
+def _nmap_targets(args: list) -> list:
+    # The engine always ends its nmap commands with "-oX - <targets...>"
+    if "-oX" in args:
+        return args[args.index("-oX") + 2:]
+    return args[-1:]
+
+
+def _expand_target(target: str) -> list:
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError:
+        return [target]
+    hosts = list(network.hosts()) or [network.network_address]
+    return [str(host) for host in hosts[:256]]
+
+
+def _write(text: str):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def _sleep_with_progress(seconds: float, task: str):
+    """Sleep like a running nmap, printing <taskprogress> lines as it goes."""
+    started = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= seconds:
+            return
+        percent = 100.0 * elapsed / seconds if seconds else 100.0
+        _write(f'<taskprogress task="{task}" time="{int(time.time())}" percent="{percent:.2f}" '
+               f'remaining="{int(seconds - elapsed)}" etc="{int(time.time() + seconds - elapsed)}"/>\n')
+        time.sleep(min(PROGRESS_INTERVAL, seconds - elapsed))
+
+
+def nmap(args: list) -> int:
+    fixture_host = ET.parse(os.environ["BENCH_NMAP_FIXTURE"]).getroot().find("host")
+    targets = [host for target in _nmap_targets(args) for host in _expand_target(target)]
+    ping_sweep = "-sn" in args
+    version = "-sV" in args
+    os_detection = "-O" in args
+    ports = _parse_ports(args[args.index("-p") + 1]) if "-p" in args else set(range(1, 1001))
+
+    _write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    _write(f'<nmaprun scanner="nmap" args="nmap {" ".join(args)}" start="{int(time.time())}" version="7.94">\n')
+
+    open_ports = [port for port in fixture_host.iter("port") if int(port.get("portid")) in ports]
+    if ping_sweep:
+        _sleep_with_progress(0.01 * len(targets), "Ping Scan")
+    elif version:
+        _sleep_with_progress(_env_float("BENCH_NMAP_VERSION_SECONDS", 0.05) * len(open_ports), "Service scan")
+    else:
+        _sleep_with_progress(len(ports) * len(targets) / _env_float("BENCH_NMAP_PORTS_PER_SECOND", 5000), "SYN Stealth Scan")
+
+    for target in targets:
+        host = copy.deepcopy(fixture_host)
+        address = host.find("address")
+        if address is not None:
+            address.set("addr", target)
+        port_list = host.find("ports")
+        if port_list is not None:
+            for port in list(port_list):
+                if port.tag != "port":
+                    continue
+                if ping_sweep or int(port.get("portid")) not in ports:
+                    port_list.remove(port)
+                elif not version:
+                    # Discovery only knows the service name from the port table
+                    service = port.find("service")
+                    if service is not None:
+                        for cpe in list(service):
+                            service.remove(cpe)
+                        for attribute in ("product", "version", "method", "conf"):
+                            service.attrib.pop(attribute, None)
+        os_element = host.find("os")
+        if os_element is not None and not os_detection:
+            host.remove(os_element)
+        _write(ET.tostring(host, encoding="unicode") + "\n")
+
+    _write(f'<runstats><finished time="{int(time.time())}" exit="success"/></runstats>\n</nmaprun>\n')
+    return 0
+
+
+def _next_vulnx_call() -> int:
+    path = os.path.join(os.environ.get("BENCH_STATE_DIR", "/tmp"), "vulnx_calls")
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        count = int(f.read() or 0) + 1
+        f.seek(0)
+        f.truncate()
+        f.write(str(count))
+    return count
+
+
+def vulnx(args: list) -> int:
+    query = args[1] if len(args) > 1 and args[0] == "search" else " ".join(args)
+    time.sleep(_env_float("BENCH_VULNX_LATENCY", 0.3))
+
+    every = int(_env_float("BENCH_VULNX_RATE_LIMIT_EVERY", 0))
+    if every and _next_vulnx_call() % every == 0:
+        print("[ERR] Rate limit exceeded, try again later", file=sys.stderr)
+        return 1
+
+    # Same query, same answer: hits are decided by a hash of the query
+    digest = int(hashlib.sha1(query.encode()).hexdigest(), 16)
+    if digest % 100 >= _env_float("BENCH_VULNX_HIT_RATE", 0.7) * 100:
+        print(json.dumps({"results": []}))
+        return 0
+
+    cve_id = f"CVE-20{10 + digest % 15}-{10000 + digest % 90000}"
+    print(json.dumps({"results": [{
+        "cve_id": cve_id,
+        "name": f"{query} vulnerability",
+        "description": f"Benchmark fixture vulnerability for {query}.",
+        "impact": "Remote code execution",
+        "severity": SEVERITIES[digest % len(SEVERITIES)],
+        "cvss_score": round(4 + (digest % 60) / 10, 1),
+        "epss_score": round((digest % 1000) / 1000, 3),
+        "age_in_days": digest % 3000,
+        "remediation": "Upgrade to a fixed release.",
+        "citations": [{"url": f"https://www.exploit-db.com/search?cve={cve_id}"}]
+    }]}))
+    return 0
+
+
+def ping(args: list) -> int:
+    rtt = _env_float("BENCH_PING_RTT_MS", 1.0)
+    target = args[-1] if args else "localhost"
+    for seq in range(1, 4):
+        print(f"64 bytes from {target}: icmp_seq={seq} ttl=64 time={rtt:.3f} ms")
+    print(f"\n--- {target} ping statistics ---")
+    print("3 packets transmitted, 3 received, 0% packet loss, time 402ms")
+    print(f"rtt min/avg/max/mdev = {rtt * 0.8:.3f}/{rtt:.3f}/{rtt * 1.2:.3f}/0.050 ms")
+    return 0
+
+
+def curl(args: list) -> int:
+    if any("ipify" in arg for arg in args):
+        print("203.0.113.10")
+    else:
+        print("HTTP/1.1 200 OK\r\nServer: Apache/2.4.6 (CentOS)\r\nContent-Type: text/html\r\n\r")
+    return 0
+
+
+def sudo(args: list) -> int:
+    # sudo nmap runs the nmap stub; pkill, ip link and the like are no-ops
+    if args and args[0] in TOOLS and args[0] != "sudo":
+        return TOOLS[args[0]](args[1:])
+    return 0
+
+
+TOOLS = {"nmap": nmap, "vulnx": vulnx, "ping": ping, "curl": curl, "sudo": sudo}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in TOOLS:
+        print(f"usage: stubs.py {{{','.join(TOOLS)}}} [args...]", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(TOOLS[sys.argv[1]](sys.argv[2:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -66,6 +66,91 @@ class Settings(BaseSettings):
     vulnx_path: str = Field(default="/home/kali/go/bin/vulnx")
     nmap_path: str = Field(default="/usr/bin/nmap")
 
+    # Scan Plans
+    scan_profiles_file: str = Field(default="")  # Optional JSON file with custom (global or per-user) scan plan profiles
+
+    # Network Scan Concurrency
+    max_concurrent_network_scans: int = Field(default=20)  # Scans running at once per backend process; extra scans wait as pending
+
+    # Nmap Sharding
+    nmap_shard_min_ports: int = Field(default=10000)  # Port ranges at least this wide are split into parallel nmap shards (0 disables sharding)
+    nmap_shard_count: int = Field(default=0)  # Shards per sharded scan; 0 = one per CPU core
+    nmap_shard_parallelism: int = Field(default=0)  # nmap shard processes running at once across all scans; 0 = number of CPU cores
+
+    # Scan Event Stream
+    scan_event_buffer_size: int = Field(default=2000)  # Events kept per scan for resuming /scanning/events streams
+    scan_event_retention_seconds: int = Field(default=900)  # How long a finished scan's events stay available
+    scan_event_heartbeat_seconds: int = Field(default=15)  # Keep-alive comment interval on idle event streams
+
+    # Scan Results Cache
+    results_cache_max_entries: int = Field(default=128)  # Parsed results files kept in memory (finished scans are immutable)
+    results_cache_max_mb: int = Field(default=64)  # Memory cap of the results cache, including compressed bodies
+    results_compress_min_bytes: int = Field(default=1024)  # Smaller results responses are sent uncompressed
+
+    # Batch Scanning
+    batch_scan_max_hosts: int = Field(default=1024)  # Hosts a batch scan may expand to (target list plus CIDR ranges)
+    batch_hosts_per_nmap: int = Field(default=32)  # Hosts packed into one shared nmap invocation
+    batch_scan_parallelism: int = Field(default=4)  # Host groups of a batch scan scanned at once
+
+    # Adaptive Timing
+    adaptive_timing_enabled: bool = Field(default=True)  # Derive nmap timing flags from the target's measured RTT and packet loss
+    timing_history_path: str = Field(default="")  # SQLite file of per-phase scan timings; empty = scan_timings.sqlite3 in results_dir
+
+    # Scan Fingerprints
+    fingerprint_store_enabled: bool = Field(default=True)  # Remember each target's last scan for deltas and incremental rescans
+    fingerprint_store_path: str = Field(default="")  # SQLite file; empty = scan_fingerprints.sqlite3 in results_dir
+    fingerprint_max_age_hours: int = Field(default=72)  # A rescan runs in full when the last full scan is older than this
+
+    # CVE Lookup Cache
+    cve_cache_enabled: bool = Field(default=True)
+    cve_cache_path: str = Field(default="")  # Empty = <results_dir>/cve_lookup_cache.sqlite3
+    cve_cache_ttl_hours: int = Field(default=168)  # How long a found CVE stays cached
+    cve_cache_negative_ttl_hours: int = Field(default=24)  # How long a "no CVE found" result stays cached
+
+    # Offline CVE Index
+    cve_lookup_engine: str = Field(default="auto")  # auto (offline index when populated) | offline | vulnx
+    cve_index_path: str = Field(default="")  # Empty = <results_dir>/cve_index.sqlite3
+    cve_feeds_dir: str = Field(default="./data/cve_feeds")  # NVD JSON / EPSS CSV files for `python -m app.scanning.cve_index import`
+
+    # Network Discovery
+    discovery_max_prefix: int = Field(default=16)  # Ranges wider than this prefix (more than 65536 addresses at /16) are rejected
+    discovery_private_ranges_only: bool = Field(default=True)  # Only private (RFC 1918, loopback, link-local) ranges may be swept
+
+    # Network Discovery Cache
+    discovery_cache_enabled: bool = Field(default=True)  # Keep each range's devices between sweeps and serve recent sweeps from disk
+    discovery_cache_path: str = Field(default="")  # SQLite file; empty = network_discoveries.sqlite3 in results_dir
+    discovery_cache_max_age_seconds: int = Field(default=300)  # Sweeps younger than this answer discovery requests
+    discovery_device_retention_days: int = Field(default=7)  # Devices unseen for longer are dropped from a range's record
+
+    # DNS Resolver
+    dns_timeout_seconds: float = Field(default=2.0)  # Per-lookup timeout
+    dns_bulk_timeout_seconds: float = Field(default=4.0)  # Overall budget for a bulk lookup; unfinished names count as unresolved
+    dns_max_concurrency: int = Field(default=256)  # DNS queries in flight at once
+    dns_cache_max_entries: int = Field(default=10000)
+    dns_default_ttl_seconds: int = Field(default=300)  # TTL for answers without one (system resolver fallback)
+    dns_min_ttl_seconds: int = Field(default=30)  # Record TTLs are clamped to this range
+    dns_max_ttl_seconds: int = Field(default=3600)
+    dns_negative_ttl_seconds: int = Field(default=60)  # How long NXDOMAIN and no-answer results stay cached
+    dns_failure_ttl_seconds: int = Field(default=0)  # How long timeouts and server failures stay cached (0 = not cached)
+
+    # MAC Vendor (OUI) Database
+    oui_db_path: str = Field(default="./data/oui.bin")  # Compiled by `python -m app.scanning.oui_db build`; built-in table if missing
+    oui_csv_dir: str = Field(default="./data/oui")  # IEEE registry CSVs (oui.csv, mam.csv, oui36.csv) for the build command
+
+    # CVE Query Scheduling
+    cve_rate_limit_window_seconds: int = Field(default=60)  # Time for the vulnx rate-limit budget to refill without a VPN rotation
+
+    # Report Generation
+    report_gpt_concurrency: int = Field(default=6)  # GPT section requests running at once for one ISO report
+    report_gpt_timeout_seconds: int = Field(default=90)  # Timeout of each GPT section request
+    report_gpt_max_attempts: int = Field(default=3)  # Tries per section on timeouts, rate limits and server errors
+    report_section_cache_enabled: bool = Field(default=True)  # Reuse GPT-written CVE analyses across reports
+    report_section_cache_path: str = Field(default="")  # SQLite file; empty = report_section_cache.sqlite3 in results_dir
+    report_section_cache_ttl_days: int = Field(default=30)  # How long a cached analysis is reused
+
+    # Service Normalization
+    service_normalizer_llm_fallback: bool = Field(default=False)  # Ask the LLM to clean version strings the rule-based normalizer cannot parse
+
     # Email Configuration
     gmail_username: str = Field(default="")
     gmail_app_password: str = Field(default="")
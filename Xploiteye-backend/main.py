@@ -38,6 +38,10 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.results_dir, exist_ok=True)
     os.makedirs(settings.reports_dir, exist_ok=True)
 
+    # Build the scan workflow and compile scan plans before the first scan arrives
+    from app.scanning.scanner_engine import get_workflow
+    get_workflow()
+
     yield
 
     # Shutdown